@@ -1,11 +1,21 @@
 from gevent import monkey
 monkey.patch_all()
 
-import os, random, string, logging, time, json, threading, socket, tempfile, shutil
-from flask import Flask, jsonify, request, send_from_directory, Response, stream_with_context
+import os, re, math, random, string, logging, time, json, threading, socket, tempfile, shutil, hashlib, subprocess
+from collections import OrderedDict, Counter, defaultdict
+from functools import partial
+import gevent
+from gevent.event import AsyncResult, Event
+from gevent.pool import Pool
+from gevent.queue import Queue, Full
+from urllib.parse import urlsplit
+from flask import Flask, jsonify, request, send_from_directory, Response, stream_with_context, redirect
 from flask_socketio import SocketIO, join_room, emit
+from socketio import RedisManager
 from flask_cors import CORS
 import redis
+import requests
+from requests.adapters import HTTPAdapter
 import yt_dlp
 from ytmusicapi import YTMusic
 from werkzeug.utils import secure_filename
@@ -39,24 +49,47 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'moodsync-dev-secret')
 
+# --- Workers ---
+# One process can run alone, or several can run behind a sticky load balancer (see
+# docker-compose.workers.yml). With SOCKETIO_MESSAGE_QUEUE set, every emit is published through
+# Redis, so a broadcast to a room (or to one sid) reaches sockets held by any worker. Each socket's
+# own events, and its join_room, stay on the worker that holds the socket.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+
+def _socketio_client_manager():
+    if not SOCKETIO_MESSAGE_QUEUE:
+        return None
+    options = {'ssl_cert_reqs': None} if SOCKETIO_MESSAGE_QUEUE.startswith('rediss://') else {}
+    return RedisManager(SOCKETIO_MESSAGE_QUEUE, channel='moodsync-socketio', redis_options=options)
+
 socketio = SocketIO(app,
     cors_allowed_origins="*",
     async_mode='gevent',
     ping_timeout=60,
     ping_interval=25,
-    transports=['websocket', 'polling']
+    transports=['websocket', 'polling'],
+    client_manager=_socketio_client_manager()
 )
 
 UPLOAD_FOLDER = os.path.abspath('uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # --- Cloudflare R2 Storage (optional — falls back to local disk if not configured) ---
+R2_UPLOAD_URL_TTL = 900
+R2_DOWNLOAD_URL_TTL = 6 * 86400  # SigV4 presigned URLs max out at 7 days
+_r2_clients = {}  # credentials -> client; building one costs ~8ms of CPU, and rooms sign URLs on every read
+
 def _r2_client():
     account_id = os.environ.get('R2_ACCOUNT_ID')
     access_key = os.environ.get('R2_ACCESS_KEY_ID')
     secret_key = os.environ.get('R2_SECRET_ACCESS_KEY')
     if not all([account_id, access_key, secret_key]):
         return None, None
+    bucket = os.environ.get('R2_BUCKET_NAME', 'moodsync')
+    creds = (account_id, access_key, secret_key)
+    if creds in _r2_clients:
+        return _r2_clients[creds], bucket
     try:
         import boto3
         from botocore.client import Config
@@ -68,24 +101,49 @@ def _r2_client():
             config=Config(signature_version='s3v4'),
             region_name='auto'
         )
-        return client, os.environ.get('R2_BUCKET_NAME', 'moodsync')
+        _r2_clients[creds] = client  # boto3 clients are thread-safe
+        return client, bucket
     except Exception as e:
         logger.warning(f"R2 client init failed: {e}")
         return None, None
 
-def r2_upload(local_path, filename, content_type='audio/mpeg'):
+def r2_upload(local_path, filename, content_type='audio/mpeg', cache_control=None):
     client, bucket = _r2_client()
     if not client:
         return None
+    extra = {'ContentType': content_type}
+    if cache_control:
+        extra['CacheControl'] = cache_control
     try:
-        client.upload_file(local_path, bucket, filename, ExtraArgs={'ContentType': content_type})
-        public_url = os.environ.get('R2_PUBLIC_URL', '').rstrip('/')
+        client.upload_file(local_path, bucket, filename, ExtraArgs=extra)
         logger.info(f"✅ R2 upload: {filename}")
-        return f"{public_url}/{filename}"
+        return r2_playback_url(filename)
     except Exception as e:
         logger.error(f"R2 upload failed: {e}")
         return None
 
+def r2_playback_url(key, client=None, bucket=None):
+    """Public bucket URL when there is one, else a presigned GET — either way playback skips the Flask proxy.
+    Presigned URLs expire after R2_DOWNLOAD_URL_TTL, so store the key and call this per read."""
+    public_url = os.environ.get('R2_PUBLIC_URL', '').rstrip('/')
+    if public_url:
+        return f"{public_url}/{key}"
+    if not client:
+        client, bucket = _r2_client()
+    if not client:
+        return None
+    return client.generate_presigned_url(
+        'get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=R2_DOWNLOAD_URL_TTL
+    )
+
+def playable_tracks(tracks):
+    """Tracks with audioUrl filled in from their R2 key (audioKey), signed now. Others pass through."""
+    if not any(t.get('audioKey') for t in tracks):
+        return tracks
+    client, bucket = (None, None) if os.environ.get('R2_PUBLIC_URL') else _r2_client()
+    return [{**t, 'audioUrl': r2_playback_url(t['audioKey'], client, bucket)} if t.get('audioKey') else t
+            for t in tracks]
+
 def r2_exists(filename):
     client, bucket = _r2_client()
     if not client: return False
@@ -105,7 +163,7 @@ def r2_ensure_cors():
             CORSConfiguration={
                 'CORSRules': [{
                     'AllowedHeaders': ['*'],
-                    'AllowedMethods': ['GET', 'HEAD'],
+                    'AllowedMethods': ['GET', 'HEAD', 'PUT'],
                     'AllowedOrigins': ['*'],
                     'ExposeHeaders': ['Content-Length', 'Content-Type', 'ETag'],
                     'MaxAgeSeconds': 86400,
@@ -130,7 +188,8 @@ redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379')
 def _try_connect_redis():
     global r
     try:
-        kwargs = dict(decode_responses=True, socket_connect_timeout=5, socket_timeout=5)
+        # surrogateescape lets binary room values (ROOM_CODEC=msgpack) round-trip as str
+        kwargs = dict(decode_responses=True, encoding_errors='surrogateescape', socket_connect_timeout=5, socket_timeout=5)
         if redis_url.startswith('rediss://'):
             kwargs['ssl_cert_reqs'] = 'none'
         client = redis.from_url(redis_url, **kwargs)
@@ -144,11 +203,12 @@ def _try_connect_redis():
         return False
 
 def _redis_reconnect_loop():
-    """Background thread — keeps trying to reconnect if Redis is down."""
+    """Background thread — keeps trying to reconnect if Redis is down. Jittered so a fleet of
+    workers doesn't hit a recovering Redis in lockstep."""
     while True:
         if r is None:
             _try_connect_redis()
-        time.sleep(10)
+        time.sleep(10 + random.uniform(0, 5))
 
 # Try once at startup (non-blocking — 5s timeout max)
 _try_connect_redis()
@@ -156,13 +216,1197 @@ _try_connect_redis()
 # Background reconnect thread so the app heals automatically
 threading.Thread(target=_redis_reconnect_loop, daemon=True).start()
 
-# --- Helpers ---
-def safe_get(key): 
-    return r.get(key) if r else None
+# --- Server clock ---
+# Playback timestamps and time-sync replies come from wall time read once at startup and advanced
+# by the monotonic clock, so an NTP step or manual clock change on the host can't yank every
+# listener's position. Workers anchor independently; their host clocks are NTP-disciplined.
+_CLOCK_ANCHOR = (time.time(), time.monotonic())
+
+def server_now():
+    wall, mono = _CLOCK_ANCHOR
+    return wall + (time.monotonic() - mono)
+
+# --- Room codecs ---
+# How room values (state, users, tracks) are serialized in Redis. Readers — here and in the Lua
+# scripts — accept every format; ROOM_CODEC only picks what new writes use:
+#   json      stdlib JSON, what older builds wrote (no header)
+#   fastjson  orjson; still plain JSON, so any reader can take it (falls back to json if missing)
+#   msgpack   header byte \x01 then MessagePack. Only switch to it once every worker runs a build
+#             that reads it. Binary goes through the text client with surrogateescape. Null fields
+#             are dropped when a script rewrites a value (Lua tables can't hold nil) — read with .get().
+# A new format gets the next header byte; JSON never starts with a control character.
+ROOM_CODEC = os.environ.get('ROOM_CODEC', 'fastjson')
+
+class JSONCodec:
+    name, header = 'json', ''
+    lua_encode = 'exact_json(value)'
+
+    def dumps(self, value):
+        return json.dumps(value, separators=(',', ':'))
+
+    def loads(self, raw):
+        return json.loads(raw)
+
+class FastJSONCodec(JSONCodec):
+    name = 'fastjson'
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def dumps(self, value):
+        return self._orjson.dumps(value).decode()
+
+    def loads(self, raw):
+        return self._orjson.loads(raw)
+
+class MsgpackCodec:
+    name, header = 'msgpack', '\x01'
+    lua_encode = "'\\1' .. cmsgpack.pack(value)"
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def dumps(self, value):
+        return self.header + self._msgpack.packb(value).decode('utf-8', 'surrogateescape')
+
+    def loads(self, raw):
+        return self._msgpack.unpackb(raw[1:].encode('utf-8', 'surrogateescape'))
+
+def _load_codec(name):
+    try:
+        return {'json': JSONCodec, 'fastjson': FastJSONCodec, 'msgpack': MsgpackCodec}[name]()
+    except Exception as e:
+        logger.warning(f"Room codec {name!r} unavailable ({e!r}), using fastjson/json")
+        return _load_codec('fastjson') if name != 'fastjson' else JSONCodec()
+
+room_codec = _load_codec(ROOM_CODEC)
+_json_reader = room_codec if isinstance(room_codec, JSONCodec) else _load_codec('fastjson')
+_header_readers = {}
+
+def encode_room_value(value):
+    return room_codec.dumps(value)
+
+def decode_room_value(raw):
+    if raw[:1] == MsgpackCodec.header:
+        if MsgpackCodec.header not in _header_readers:
+            _header_readers[MsgpackCodec.header] = MsgpackCodec()
+        return _header_readers[MsgpackCodec.header].loads(raw)
+    return _json_reader.loads(raw)
+
+# --- Room storage ---
+# A room is split across per-field keys so each handler only moves what it changes:
+#   room:<code>:meta      hash    title, admin_uuid, admin_sid, playlist_rev
+#   room:<code>:state     string  current_state JSON
+#   room:<code>:users     hash    sid -> user JSON
+#   room:<code>:tracks    hash    track id -> track JSON
+#   room:<code>:seen      zset    sid -> last presence heartbeat
+#   room:<code>:order     zset    track id -> position; play order is score order
+# Rooms written by older builds as a single `room:<code>` JSON blob are split on first access, and
+# playlists kept as a `room:<code>:playlist` list (from before track ids) move to tracks + order.
+# Expiry slides: while a room has members, every write or join pushes all its keys out to ROOM_TTL
+# again. A room starts on the short ROOM_EMPTY_GRACE expiry until someone joins, and is cut back to
+# it when the last user leaves; a (re)join inside that window restores it. Writes to an empty room
+# (prefetch, enrichment, ingest callbacks) don't extend it.
+ROOM_TTL = int(os.environ.get('ROOM_TTL', 86400))
+ROOM_EMPTY_GRACE = int(os.environ.get('ROOM_EMPTY_GRACE', 900))
+ROOM_PARTS = ('meta', 'state', 'users', 'tracks', 'seen', 'order', 'playlist')
+ROOM_META_FIELDS = ('title', 'admin_uuid', 'admin_sid')
+ROOM_CHANGED_CHANNEL = 'room:changed'
+
+def room_key(code, part):
+    return f"room:{code}:{part}"
+
+def _room_keys(code):
+    return [room_key(code, p) for p in ROOM_PARTS]
+
+def _touch_room(pipe, code, ttl=ROOM_TTL):
+    for k in _room_keys(code):
+        pipe.expire(k, ttl)
+
+def _write_room(pipe, code, rd):
+    meta = {'title': rd.get('title') or 'Sonic Space', 'playlist_rev': rd.get('playlistRev', 0)}
+    for f in ('admin_uuid', 'admin_sid'):
+        if rd.get(f): meta[f] = rd[f]
+    pipe.delete(*_room_keys(code))
+    pipe.hset(room_key(code, 'meta'), mapping=meta)
+    pipe.set(room_key(code, 'state'), encode_room_value(rd.get('current_state') or {}))
+    users = rd.get('users') or {}
+    if users:
+        pipe.hset(room_key(code, 'users'), mapping={sid: encode_room_value(u) for sid, u in users.items()})
+    playlist = [{**t, 'id': t.get('id') or os.urandom(6).hex()} for t in rd.get('playlist') or []]
+    if playlist:
+        pipe.hset(room_key(code, 'tracks'), mapping={t['id']: encode_room_value(t) for t in playlist})
+        pipe.zadd(room_key(code, 'order'), {t['id']: i + 1 for i, t in enumerate(playlist)})
+    _touch_room(pipe, code, ROOM_TTL if users else ROOM_EMPTY_GRACE)
+    pipe.publish(ROOM_CHANGED_CHANNEL, f"{code} 0")  # a new room under this code: drop anything cached for the old one
+
+def create_room(code, rd):
+    """Write a new room only if the code is free (split or legacy). Returns False if it's taken."""
+    claimed = [room_key(code, 'meta'), f"room:{code}"]
+    with r.pipeline() as pipe:
+        try:
+            pipe.watch(*claimed)
+            if pipe.exists(*claimed):
+                return False
+            pipe.multi()
+            _write_room(pipe, code, rd)
+            pipe.execute()
+            forget_room(code)
+            return True
+        except redis.WatchError:
+            return False  # someone created it between the check and the write
+
+def release_if_empty(code):
+    """Put a room with no users left on the short ROOM_EMPTY_GRACE expiry. Retries if someone joins meanwhile."""
+    def shorten(pipe):
+        if pipe.hlen(room_key(code, 'users')):
+            return False
+        pipe.multi()
+        _touch_room(pipe, code, ROOM_EMPTY_GRACE)
+        return True
+    return r.transaction(shorten, room_key(code, 'users'), value_from_callable=True)
+
+def room_exists(code):
+    if not r: return False
+    return bool(r.exists(room_key(code, 'meta'), f"room:{code}"))
+
+def migrate_legacy_room(code):
+    """Split a legacy `room:<code>` blob into per-field keys. Returns True if the room now exists."""
+    legacy = f"room:{code}"
+    if not r or not r.exists(legacy):
+        return False
+    with r.lock(f"lock:migrate:{code}", timeout=5):
+        blob = r.get(legacy)
+        if not blob:
+            return bool(r.exists(room_key(code, 'meta')))
+        # Its members' sockets belonged to the build that wrote the blob: they'd never be heartbeated
+        # or reaped, and would keep the room off the empty grace expiry. They rejoin as new members.
+        rd = {**json.loads(blob), 'users': {}, 'admin_sid': None}
+        pipe = r.pipeline()
+        _write_room(pipe, code, rd)
+        pipe.delete(legacy)
+        pipe.execute()
+    forget_room(code)
+    logger.info(f"Migrated legacy room {code}")
+    return True
+
+def migrate_legacy_rooms():
+    """One-shot sweep for legacy blobs and pre-id playlist lists left by older builds; lazily-missed
+    rooms still migrate on access.
+    Every worker starts it, but only the one that claims the sweep key runs it."""
+    if not r: return
+    if not r.set('migrate:legacy_rooms', WORKER_ID, nx=True, ex=3600): return
+    count = 0
+    try:
+        for key in r.scan_iter(match='room:*', count=500, _type='string'):
+            parts = key.split(':')
+            if len(parts) == 2 and migrate_legacy_room(parts[1]):
+                count += 1
+        for key in r.scan_iter(match='room:*:playlist', count=500, _type='list'):
+            _UPGRADE_PLAYLIST(key.split(':')[1])  # the prelude does the work
+            count += 1
+    except Exception as e:
+        logger.warning(f"Legacy room migration stopped: {e}")
+    if count:
+        logger.info(f"✅ Migrated {count} legacy rooms")
+
+def _decode_meta(values):
+    return {f: v or None for f, v in zip(ROOM_META_FIELDS, values)}
+
+def _fetch_room_core(code):
+    for _ in range(2):
+        pipe = r.pipeline()
+        pipe.hmget(room_key(code, 'meta'), ROOM_META_FIELDS + ('cache_rev',))
+        pipe.get(room_key(code, 'state'))
+        meta_vals, state = pipe.execute()
+        if state is not None:
+            return int(meta_vals[-1] or 0), (_decode_meta(meta_vals), decode_room_value(state))
+        if not migrate_legacy_room(code):
+            break
+    return 0, None
+
+def load_room_core(code):
+    """Meta + current_state in one round trip — enough for permission checks. Returns (None, None) if missing."""
+    if not r: return None, None
+    core = cached_room(code, 'core', _fetch_room_core)
+    if not core: return None, None
+    meta, state = core
+    return dict(meta), dict(state)
+
+def _fetch_room(code):
+    for _ in range(2):
+        pipe = r.pipeline()
+        pipe.hmget(room_key(code, 'meta'), ROOM_META_FIELDS + ('playlist_rev', 'cache_rev'))
+        pipe.get(room_key(code, 'state'))
+        pipe.hgetall(room_key(code, 'users'))
+        meta_vals, state, users = pipe.execute()
+        if state is not None:
+            rd = _decode_meta(meta_vals)
+            rd['title'] = rd['title'] or 'Sonic Space'
+            rd['current_state'] = decode_room_value(state)
+            rd['users'] = {sid: decode_room_value(u) for sid, u in users.items()}
+            rd['playlistRev'] = int(meta_vals[-2] or 0)
+            return int(meta_vals[-1] or 0), rd
+        if not migrate_legacy_room(code):
+            break
+    return 0, None
+
+def load_room(code):
+    """The room document minus the playlist, which is read in pages (playlist_page). None if missing.
+    Nested values may be shared with the room cache: add top-level keys, don't mutate in place."""
+    if not r: return None
+    rd = cached_room(code, 'room', _fetch_room)
+    return dict(rd) if rd else None
+
+def get_room_users(code):
+    return {sid: decode_room_value(u) for sid, u in r.hgetall(room_key(code, 'users')).items()}
+
+def user_list(users):
+    return [{'sid': k, **v} for k, v in users.items()]
+
+def playlist_snapshot(code):
+    """The whole playlist + its revision. Only sent on client resync; joins get a page around the
+    current track and everything else is a delta."""
+    return playlist_page(code, limit=None)
+
+# --- Room mutations ---
+# Every read-modify-write on a room is one Lua script: a single round trip, applied atomically by
+# Redis, with no lock for concurrent events to queue behind. KEYS are the room's parts in ROOM_PARTS
+# order (plus any extras) and ARGV[1] is the TTL they all slide to. A nil reply means the room
+# doesn't exist; 0 means the caller isn't allowed to make the change.
+# Each write to current_state bumps state.version and records state.updatedBy, so clients can
+# order sync_player_state messages and the server can spot updates made against a stale view.
+# Every playlist mutation bumps playlist_rev in the same script, so a delta's rev is exactly one
+# past the state it applies to. Clients that see a gap resync via `get_playlist`.
+# Tracks are addressed by id. state.trackId names the current track; state.trackIndex is kept equal
+# to its position (ZRANK) for clients that still index by position. Positions are zset scores, so
+# appending, removing or moving a track is O(log n); a move lands halfway between its new
+# neighbours' scores.
+# Every write also bumps meta.cache_rev and publishes it on ROOM_CHANGED_CHANNEL (see Room cache).
+_LUA_ROOM_PRELUDE = f"""
+local function dec(raw)
+  if string.byte(raw, 1) == 1 then return cmsgpack.unpack(string.sub(raw, 2)) end
+  return cjson.decode(raw)
+end
+-- cjson writes numbers with 14 significant digits, 0.1ms on an epoch timestamp; the clock fields
+-- go out with %.17g instead so they round-trip exactly
+local EXACT_FIELDS = {{'startTimestamp', 'serverTime'}}
+local function exact_json(value)
+  local saved = {{}}
+  for _, k in ipairs(EXACT_FIELDS) do
+    if type(value[k]) == 'number' then saved[k], value[k] = value[k], '@@exact@@' .. k end
+  end
+  local out = cjson.encode(value)
+  for k, v in pairs(saved) do
+    value[k] = v
+    out = string.gsub(out, '"@@exact@@' .. k .. '"', string.format('%.17g', v), 1)
+  end
+  return out
+end
+local function enc(value)
+  return {room_codec.lua_encode}
+end
+local function changed()
+  local rev = redis.call('HINCRBY', KEYS[1], 'cache_rev', 1)
+  redis.call('PUBLISH', '{ROOM_CHANGED_CHANNEL}', string.sub(KEYS[1], 6, -6) .. ' ' .. rev)
+end
+local function touch()
+  if redis.call('HLEN', KEYS[3]) > 0 then
+    for i = 1, {len(ROOM_PARTS)} do redis.call('EXPIRE', KEYS[i], ARGV[1]) end
+  else
+    -- nobody here: keep the room's current (short) expiry, and give keys created or SET just now the
+    -- same. meta is only ever HSET, which keeps its TTL.
+    local ttl = redis.call('TTL', KEYS[1])
+    if ttl < 1 then ttl = {ROOM_EMPTY_GRACE} end
+    for i = 1, {len(ROOM_PARTS)} do
+      if redis.call('TTL', KEYS[i]) == -1 then redis.call('EXPIRE', KEYS[i], ttl) end
+    end
+  end
+  changed()
+end
+local function may_control(state, sid)
+  return redis.call('HGET', KEYS[1], 'admin_sid') == sid or state.isCollaborative == true
+end
+local function bump(state, writer)
+  state.version = (tonumber(state.version) or 0) + 1
+  state.updatedBy = writer
+end
+local function current(state)
+  if type(state.trackId) == 'string' then
+    local rank = redis.call('ZRANK', KEYS[6], state.trackId)
+    if rank then state.trackIndex = rank return end
+  end
+  local at = math.max(0, tonumber(state.trackIndex) or 0)
+  local id = redis.call('ZRANGE', KEYS[6], at, at)[1] or redis.call('ZRANGE', KEYS[6], 0, 0)[1]
+  state.trackId = id
+  state.trackIndex = id and redis.call('ZRANK', KEYS[6], id) or 0
+end
+local function upgrade_playlist()
+  if redis.call('EXISTS', KEYS[7]) == 0 then return end
+  for i, raw in ipairs(redis.call('LRANGE', KEYS[7], 0, -1)) do
+    local track = dec(raw)
+    if type(track.id) ~= 'string' or redis.call('HEXISTS', KEYS[4], track.id) == 1 then
+      track.id = string.format('legacy%06x', i)
+      raw = enc(track)
+    end
+    redis.call('HSET', KEYS[4], track.id, raw)
+    redis.call('ZADD', KEYS[6], i, track.id)
+  end
+  redis.call('DEL', KEYS[7])
+  local ttl = redis.call('TTL', KEYS[2])
+  if ttl > 0 then
+    redis.call('EXPIRE', KEYS[4], ttl)
+    redis.call('EXPIRE', KEYS[6], ttl)
+  end
+  changed()  -- even under a read: cached copies of the old layout are stale now
+end
+upgrade_playlist()
+"""
+
+class LuaScript:
+    """Sent by SHA and loaded on NOSCRIPT, against whichever client `r` currently is."""
+    def __init__(self, src):
+        self.src = src
+        self.sha = hashlib.sha1(self.src.encode()).hexdigest()
+
+    def _run(self, keys, args):
+        try:
+            return r.evalsha(self.sha, len(keys), *keys, *args)
+        except redis.exceptions.NoScriptError:
+            return r.eval(self.src, len(keys), *keys, *args)
+
+    def __call__(self, keys, args):
+        return self._run(keys, args)
+
+class RoomScript(LuaScript):
+    """A script over one room's keys, run with the room prelude."""
+    def __init__(self, body, writes=True):
+        super().__init__(_LUA_ROOM_PRELUDE + body)
+        self.writes = writes
+
+    def __call__(self, code, *args, extra_keys=()):
+        keys = _room_keys(code) + list(extra_keys)
+        args = (ROOM_TTL,) + args
+        res = self._run(keys, args)
+        if res is None and migrate_legacy_room(code):
+            res = self._run(keys, args)
+        if self.writes:
+            forget_room(code)  # don't wait for our own invalidation to come back over pub/sub
+        return res
+
+# ARGV: ttl, sid, uuid, now, code, encoded user as admin, encoded user as member.
+# KEYS[8] = sid:<sid>, KEYS[9] = PRESENCE_ROOMS
+_JOIN = RoomScript("""
+local state = redis.call('GET', KEYS[2])
+if not state then return nil end
+local sid, uuid = ARGV[2], ARGV[3]
+local admin = redis.call('HGET', KEYS[1], 'admin_uuid')
+local is_admin = 0
+if not admin or admin == '' or admin == uuid then
+  is_admin = 1
+  if uuid == '' then redis.call('HDEL', KEYS[1], 'admin_uuid') else redis.call('HSET', KEYS[1], 'admin_uuid', uuid) end
+  redis.call('HSET', KEYS[1], 'admin_sid', sid)
+end
+redis.call('HSET', KEYS[3], sid, is_admin == 1 and ARGV[6] or ARGV[7])
+redis.call('ZADD', KEYS[5], ARGV[4], sid)
+redis.call('ZADD', KEYS[9], ARGV[4], ARGV[5])
+redis.call('SET', KEYS[8], ARGV[5], 'EX', ARGV[1])
+touch()
+return {is_admin, state}
+""")
+
+# ARGV: ttl, sid, encoded new state, now, base version ('' if the client didn't send one)
+# Stale means: built on an older version and someone else wrote since. Positional changes from a
+# stale view are rejected ({-1, current state}); anything else (volume, ...) is applied on top.
+# So is picking a trackId that has been removed meanwhile. A trackIndex alone is mapped to its id.
+# Only player fields are taken from the update; the rest of the state is not the client's to set.
+_UPDATE_PLAYER = RoomScript("""
+local raw = redis.call('GET', KEYS[2])
+if not raw then return nil end
+local state = dec(raw)
+if not may_control(state, ARGV[2]) then return 0 end
+local new, now, base = dec(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+if type(new.trackId) ~= 'string' then new.trackId = nil end
+if base and base < (tonumber(state.version) or 0) and state.updatedBy ~= ARGV[2] then
+  for _, k in ipairs({'isPlaying', 'trackId', 'trackIndex', 'startTimestamp', 'currentTime', 'pausedAt'}) do
+    if new[k] ~= nil then return {-1, raw} end
+  end
+end
+if new.trackId and not redis.call('ZRANK', KEYS[6], new.trackId) then return {-1, raw} end
+if new.isPlaying == true and state.isPlaying ~= true and new.startTimestamp == nil then
+  new.startTimestamp = now + 1.5
+end
+if new.isPlaying == false then new.pausedAt = new.currentTime or 0 end
+new.serverTime = now
+current(state)
+local before = tostring(state.trackId) .. tostring(state.isPlaying)
+-- only player fields: version, updatedBy, isCollaborative etc. are the server's (or the admin's)
+for _, k in ipairs({'isPlaying', 'trackId', 'trackIndex', 'startTimestamp', 'currentTime', 'pausedAt', 'volume', 'serverTime'}) do
+  if new[k] ~= nil then state[k] = new[k] end
+end
+if new.trackId ~= nil then state.trackIndex = nil elseif new.trackIndex ~= nil then state.trackId = nil end
+current(state)
+bump(state, ARGV[2])
+local out = enc(state)
+redis.call('SET', KEYS[2], out)
+touch()
+return {before == tostring(state.trackId) .. tostring(state.isPlaying) and 0 or 1, out}
+""")
+
+# ARGV: ttl, encoded fields, sid ('' for a server-side change). Room settings are admin-only.
+_MERGE_STATE = RoomScript("""
+local raw = redis.call('GET', KEYS[2])
+if not raw then return nil end
+if ARGV[3] ~= '' and redis.call('HGET', KEYS[1], 'admin_sid') ~= ARGV[3] then return 0 end
+local state = dec(raw)
+for k, v in pairs(dec(ARGV[2])) do state[k] = v end
+bump(state, ARGV[3])
+local out = enc(state)
+redis.call('SET', KEYS[2], out)
+touch()
+return out
+""")
+
+# ARGV: ttl, encoded track, now, track id
+_APPEND_TRACK = RoomScript("""
+local raw = redis.call('GET', KEYS[2])
+if not raw then return nil end
+local last = redis.call('ZREVRANGE', KEYS[6], 0, 0, 'WITHSCORES')
+redis.call('HSET', KEYS[4], ARGV[4], ARGV[2])
+redis.call('ZADD', KEYS[6], (tonumber(last[2]) or 0) + 1, ARGV[4])
+local length = redis.call('ZCARD', KEYS[6])
+local rev = redis.call('HINCRBY', KEYS[1], 'playlist_rev', 1)
+local started = false
+if length == 1 then
+  local state, now = dec(raw), tonumber(ARGV[3])
+  state.isPlaying = true
+  state.startTimestamp = now + 2.0
+  state.serverTime = now
+  state.trackId = ARGV[4]
+  state.trackIndex = 0
+  bump(state, '')
+  started = enc(state)
+  redis.call('SET', KEYS[2], started)
+end
+touch()
+return {length, rev, started}
+""")
+
+# ARGV: ttl, sid, track id ('' to go by index), index
+# Removing the current track moves playback to the one after it (or before, if it was last).
+_REMOVE_TRACK = RoomScript("""
+local raw = redis.call('GET', KEYS[2])
+if not raw then return nil end
+local state = dec(raw)
+if not may_control(state, ARGV[2]) then return 0 end
+local id, at = ARGV[3], math.floor(tonumber(ARGV[4]) or -1)
+if id == '' and at >= 0 then id = redis.call('ZRANGE', KEYS[6], at, at)[1] end
+local idx = id and id ~= '' and redis.call('ZRANK', KEYS[6], id)
+if not idx then return 0 end
+current(state)
+if state.trackId == id then
+  local nxt = redis.call('ZRANGE', KEYS[6], idx + 1, idx + 1)[1]
+  if not nxt and idx > 0 then nxt = redis.call('ZRANGE', KEYS[6], idx - 1, idx - 1)[1] end
+  state.trackId = nxt
+  if not nxt then state.isPlaying = false end
+end
+redis.call('ZREM', KEYS[6], id)
+redis.call('HDEL', KEYS[4], id)
+local rev = redis.call('HINCRBY', KEYS[1], 'playlist_rev', 1)
+current(state)
+bump(state, ARGV[2])
+local out = enc(state)
+redis.call('SET', KEYS[2], out)
+touch()
+return {rev, out, idx, id}
+""")
+
+# ARGV: ttl, sid, track id, new index
+_MOVE_TRACK = RoomScript("""
+local raw = redis.call('GET', KEYS[2])
+if not raw then return nil end
+local state = dec(raw)
+if not may_control(state, ARGV[2]) then return 0 end
+local id = ARGV[3]
+local from = redis.call('ZRANK', KEYS[6], id)
+if not from then return 0 end
+local to = math.max(0, math.min(math.floor(tonumber(ARGV[4]) or 0), redis.call('ZCARD', KEYS[6]) - 1))
+if to == from then return 0 end
+current(state)
+local playing_at = state.trackIndex
+redis.call('ZREM', KEYS[6], id)
+local function score_at(i)
+  if i < 0 then return nil end
+  return tonumber(redis.call('ZRANGE', KEYS[6], i, i, 'WITHSCORES')[2])
+end
+local lo, hi = score_at(to - 1), score_at(to)
+if lo and hi and hi - lo < 1e-9 then
+  -- no room left between these two: renumber the playlist (rare, O(n))
+  for i, other in ipairs(redis.call('ZRANGE', KEYS[6], 0, -1)) do redis.call('ZADD', KEYS[6], i, other) end
+  lo, hi = score_at(to - 1), score_at(to)
+end
+local score
+if lo and hi then score = (lo + hi) / 2 elseif lo then score = lo + 1 elseif hi then score = hi - 1 else score = 1 end
+redis.call('ZADD', KEYS[6], score, id)
+local rev = redis.call('HINCRBY', KEYS[1], 'playlist_rev', 1)
+current(state)
+local out = false
+if state.trackIndex ~= playing_at then
+  bump(state, ARGV[2])
+  out = enc(state)
+  redis.call('SET', KEYS[2], out)
+end
+touch()
+return {rev, from, to, out}
+""")
+
+# ARGV: ttl, track id, encoded fields
+_UPDATE_TRACK = RoomScript("""
+local raw = redis.call('HGET', KEYS[4], ARGV[2])
+if not raw then return 0 end
+local track = dec(raw)
+for k, v in pairs(dec(ARGV[3])) do track[k] = v end
+redis.call('HSET', KEYS[4], ARGV[2], enc(track))
+local rev = redis.call('HINCRBY', KEYS[1], 'playlist_rev', 1)
+touch()
+return {redis.call('ZRANK', KEYS[6], ARGV[2]), rev}
+""")
+
+# ARGV: ttl, sid, new admin sid
+_TRANSFER_ADMIN = RoomScript("""
+if redis.call('EXISTS', KEYS[2]) == 0 then return nil end
+if redis.call('HGET', KEYS[1], 'admin_sid') ~= ARGV[2] then return 0 end
+local target = redis.call('HGET', KEYS[3], ARGV[3])
+if not target then return 0 end
+local new_uuid = dec(target).uuid
+local users = redis.call('HGETALL', KEYS[3])
+for i = 1, #users, 2 do
+  local u = dec(users[i + 1])
+  u.isAdmin = users[i] == ARGV[3]
+  users[i + 1] = enc(u)
+  redis.call('HSET', KEYS[3], users[i], users[i + 1])
+end
+if type(new_uuid) == 'string' then
+  redis.call('HSET', KEYS[1], 'admin_uuid', new_uuid)
+else
+  new_uuid = false
+  redis.call('HDEL', KEYS[1], 'admin_uuid')
+end
+redis.call('HSET', KEYS[1], 'admin_sid', ARGV[3])
+touch()
+return {new_uuid, users}
+""")
+
+# ARGV: ttl, sid... Leaving doesn't slide the TTL (release_if_empty may be about to shorten it)
+_REMOVE_USERS = RoomScript("""
+local sids = {unpack(ARGV, 2)}
+local removed = redis.call('HDEL', KEYS[3], unpack(sids))
+redis.call('ZREM', KEYS[5], unpack(sids))
+if removed > 0 and redis.call('EXISTS', KEYS[1]) == 1 then changed() end
+return {removed, redis.call('HLEN', KEYS[3])}
+""")
+
+# ARGV: ttl, mode ('around' the current track / 'after' / 'before' a position / 'all'), position, limit
+# Returns {cache_rev, playlist_rev, title, length, offset of the first track, first position, last position, tracks}
+_PLAYLIST_PAGE = RoomScript("""
+local raw = redis.call('GET', KEYS[2])
+if not raw then return nil end
+local mode, limit = ARGV[2], tonumber(ARGV[4])
+local length = redis.call('ZCARD', KEYS[6])
+local hits, first
+if mode == 'around' then
+  local state = dec(raw)
+  current(state)
+  first = math.max(0, math.min(state.trackIndex - math.floor(limit / 2), length - limit))
+  hits = redis.call('ZRANGE', KEYS[6], first, first + limit - 1, 'WITHSCORES')
+elseif mode == 'after' then
+  hits = redis.call('ZRANGEBYSCORE', KEYS[6], '(' .. ARGV[3], '+inf', 'WITHSCORES', 'LIMIT', 0, limit)
+  first = hits[1] and redis.call('ZRANK', KEYS[6], hits[1]) or length
+elseif mode == 'before' then
+  local newest = redis.call('ZREVRANGEBYSCORE', KEYS[6], '(' .. ARGV[3], '-inf', 'WITHSCORES', 'LIMIT', 0, limit)
+  hits = {}
+  for i = #newest - 1, 1, -2 do
+    hits[#hits + 1] = newest[i]
+    hits[#hits + 1] = newest[i + 1]
+  end
+  first = hits[1] and redis.call('ZRANK', KEYS[6], hits[1]) or 0
+else
+  hits = redis.call('ZRANGE', KEYS[6], 0, -1, 'WITHSCORES')
+  first = 0
+end
+local ids, tracks = {}, {}
+for i = 1, #hits, 2 do ids[#ids + 1] = hits[i] end
+for i = 1, #ids, 1000 do
+  local chunk = redis.call('HMGET', KEYS[4], unpack(ids, i, math.min(i + 999, #ids)))
+  for j = 1, #chunk do tracks[#tracks + 1] = chunk[j] end
+end
+local meta = redis.call('HMGET', KEYS[1], 'cache_rev', 'playlist_rev', 'title')
+return {meta[1] or 0, meta[2] or 0, meta[3] or '', length, first, hits[2] or '', hits[#hits] or '', tracks}
+""", writes=False)
+
+_UPGRADE_PLAYLIST = RoomScript("return 1")
+
+def join_member(code, sid, uuid, name):
+    """Add a member, making them admin if the room has none or it's theirs. Returns (user, state) or None."""
+    as_admin = {'name': name, 'isAdmin': True, 'uuid': uuid}
+    as_member = {**as_admin, 'isAdmin': False}
+    res = _JOIN(code, sid, uuid or '', time.time(), code, encode_room_value(as_admin), encode_room_value(as_member),
+                extra_keys=[f"sid:{sid}", PRESENCE_ROOMS])
+    if not res: return None
+    return (as_admin if res[0] else as_member), decode_room_value(res[1])
+
+def update_player_state(code, sid, new_state, base_version=None):
+    """Apply a controller's player update. Returns (status, state) or None if the room is missing or
+    the sid may not control it. status: -1 rejected as stale (state is the current one),
+    0 applied, 1 applied and the track or play/pause changed."""
+    res = _UPDATE_PLAYER(code, sid, encode_room_value(new_state), server_now(), '' if base_version is None else base_version)
+    if not res: return None
+    return res[0], decode_room_value(res[1])
+
+def merge_room_state(code, fields, sid=''):
+    """Merge fields into current_state. With a sid, only the room's admin may. Returns the new state,
+    or None if the room is missing or the sid isn't its admin."""
+    res = _MERGE_STATE(code, encode_room_value(fields), sid)
+    return decode_room_value(res) if res else None
+
+def append_track(code, track):
+    """Append a track; the first one also starts playback.
+    Returns (new playlist length, playlist rev, started state or None), or None if the room is gone."""
+    res = _APPEND_TRACK(code, encode_room_value(track), server_now(), track['id'])
+    if not res: return None
+    length, rev, started = res
+    return length, rev, decode_room_value(started) if started else None
+
+def remove_track(code, sid, track_id=None, index=None):
+    """Remove a track by id (or, for older clients, by position).
+    Returns (rev, state, index it had, its id) or None."""
+    res = _REMOVE_TRACK(code, sid, track_id or '', -1 if index is None else index)
+    if not res: return None
+    rev, state, idx, removed_id = res
+    return rev, decode_room_value(state), idx, removed_id
+
+def move_track(code, sid, track_id, to_index):
+    """Move a track to a new position. Returns (rev, from, to, state if the current track's position
+    changed else None) or None."""
+    res = _MOVE_TRACK(code, sid, track_id, to_index)
+    if not res: return None
+    rev, from_idx, to_idx, state = res
+    return rev, from_idx, to_idx, decode_room_value(state) if state else None
+
+def update_track(code, track_id, fields):
+    """Merge fields into the track with this id. Returns (index, rev), or None if it was removed."""
+    res = _UPDATE_TRACK(code, track_id, encode_room_value(fields))
+    return tuple(res) if res else None
+
+def remove_room_users(code, *sids):
+    """Drop members. Returns (how many were present, how many remain)."""
+    return tuple(_REMOVE_USERS(code, *sids))
+
+def transfer_admin(code, sid, new_sid):
+    """Hand admin from sid to new_sid. Returns (new admin uuid, users) or None."""
+    res = _TRANSFER_ADMIN(code, sid, new_sid)
+    if not res: return None
+    new_uuid, flat = res
+    return new_uuid, {flat[i]: decode_room_value(flat[i + 1]) for i in range(0, len(flat), 2)}
+
+PLAYLIST_PAGE_SIZE = int(os.environ.get('PLAYLIST_PAGE_SIZE', 50))
+PLAYLIST_PAGE_MAX = 500
+
+_CURSOR_MODES = {'a': 'after', 'b': 'before'}
+
+def parse_playlist_cursor(cursor):
+    """'a<position>' / 'b<position>' -> ('after' / 'before', position). Raises ValueError."""
+    if cursor[:1] not in _CURSOR_MODES or not math.isfinite(float(cursor[1:])):
+        raise ValueError(f"Bad playlist cursor {cursor!r}")
+    return _CURSOR_MODES[cursor[0]], cursor[1:]
+
+def _read_playlist(code, mode, position, limit):
+    res = _PLAYLIST_PAGE(code, mode, position, limit)
+    if not res: return 0, None
+    cache_rev, rev, title, length, first, lo, hi, tracks = res
+    tracks = [decode_room_value(t) for t in tracks if t]
+    return int(cache_rev), {
+        'title': title or 'Sonic Space', 'playlist': tracks, 'playlistRev': int(rev),
+        'playlistLength': length, 'playlistOffset': first,
+        'before': f"b{lo}" if tracks and first > 0 else None,
+        'after': f"a{hi}" if tracks and first + len(tracks) < length else None,
+    }
+
+def playlist_page(code, cursor=None, limit=PLAYLIST_PAGE_SIZE):
+    """A page of the playlist in play order, or None if the room is missing. Without a cursor it is
+    the current track with the ones around it; `before` / `after` are the cursors for the
+    neighbouring pages (None at either end). Cursors are positions, not offsets, so pages stay
+    consistent while tracks are added or removed. limit=None returns the whole playlist.
+    Uploaded tracks get their audioUrl signed here, per read, never from the cache."""
+    if not r: return None
+    if limit is None:
+        page = _read_playlist(code, 'all', '', 0)[1]
+    elif cursor:
+        page = _read_playlist(code, *parse_playlist_cursor(cursor), limit)[1]
+    elif limit != PLAYLIST_PAGE_SIZE:
+        page = _read_playlist(code, 'around', '', limit)[1]
+    else:
+        page = cached_room(code, 'page', lambda c: _read_playlist(c, 'around', '', limit))
+    return {**page, 'playlist': playable_tracks(page['playlist'])} if page else None
+
+def emit_playlist_delta(room_code, event, rev, **payload):
+    """Broadcast one playlist change: playlist_track_added / _removed / _moved / _updated."""
+    socketio.emit(f'playlist_track_{event}', {'rev': rev, **payload}, to=room_code)
+
+# --- State broadcasts ---
+# Routine player updates (seek drags, volume) are coalesced per room: the first one in a quiet room
+# opens a STATE_SYNC_WINDOW, later ones replace it, and only the newest state is broadcast when the
+# window closes, so the final position always goes out. Play/pause, track changes and admin-side
+# changes go out at once and supersede anything still waiting.
+STATE_SYNC_WINDOW = float(os.environ.get('STATE_SYNC_WINDOW', 0.15))
+_state_pending = {}  # room -> newest state not yet broadcast
+_state_lock = threading.Lock()
+
+def broadcast_state(code, state, skip_sid=None, immediate=True):
+    """Send sync_player_state to the room (except skip_sid, who already has it), now or coalesced."""
+    with _state_lock:
+        pending = _state_pending.get(code)
+        newer = pending is not None and pending[0].get('version', 0) > state.get('version', 0)
+        if immediate:
+            _state_pending.pop(code, None)
+            if newer:
+                state, skip_sid = pending  # send the coalesced state now rather than the stale one
+        elif not newer:
+            _state_pending[code] = (state, skip_sid)
+    if immediate:
+        socketio.emit('sync_player_state', state, to=code, skip_sid=skip_sid)
+    elif pending is None:
+        gevent.spawn_later(STATE_SYNC_WINDOW, _flush_state, code)
+
+def _flush_state(code):
+    with _state_lock:
+        pending = _state_pending.pop(code, None)
+    if pending:
+        state, skip_sid = pending
+        socketio.emit('sync_player_state', state, to=code, skip_sid=skip_sid)
+
+# --- Presence ---
+# Each worker heartbeats the sockets it holds into `room:<code>:seen` every PRESENCE_HEARTBEAT
+# seconds and reaps members nobody has refreshed for PRESENCE_TTL (their worker died without a
+# disconnect). PRESENCE_ROOMS records when any worker last heartbeated (or joined) each room, so a
+# room whose members were all on workers that died is still found and reaped by a live one; a room
+# found with nobody left in `seen` drops out of the index. Joins and leaves are batched per room: one broadcast per USER_LIST_DEBOUNCE window,
+# the full `update_user_list` for small rooms, only that window's `user_list_delta` for large ones.
+PRESENCE_HEARTBEAT = int(os.environ.get('PRESENCE_HEARTBEAT', 20))
+PRESENCE_TTL = int(os.environ.get('PRESENCE_TTL', 60))
+PRESENCE_ROOMS = 'presence:rooms'  # zset room -> last heartbeat or join
+PRESENCE_SWEEP_MAX = 200  # orphaned rooms looked at per heartbeat
+USER_LIST_DEBOUNCE = float(os.environ.get('USER_LIST_DEBOUNCE', 0.5))
+USER_LIST_DELTA_MIN = int(os.environ.get('USER_LIST_DELTA_MIN', 50))
+_local_sids = {}  # sid -> room for sockets connected to this worker
+_presence_pending = {}  # room -> {'joined': {sid: user}, 'left': {sid}} since the last broadcast
+_presence_lock = threading.Lock()
+
+def note_presence(code, sid, user=None):
+    """Queue a join (user given) or leave (user None) for the room's next user-list broadcast."""
+    with _presence_lock:
+        changes = _presence_pending.get(code)
+        first = changes is None
+        if first:
+            changes = _presence_pending[code] = {'joined': {}, 'left': set()}
+        if user is not None:
+            changes['joined'][sid] = user
+            changes['left'].discard(sid)
+        else:
+            changes['joined'].pop(sid, None)
+            changes['left'].add(sid)
+    if first:
+        gevent.spawn_later(USER_LIST_DEBOUNCE, _flush_user_list, code)
+
+def _flush_user_list(code):
+    with _presence_lock:
+        changes = _presence_pending.pop(code, None)
+    if not changes or not r:
+        return
+    try:
+        if r.hlen(room_key(code, 'users')) >= USER_LIST_DELTA_MIN:
+            socketio.emit('user_list_delta', {
+                'joined': [{'sid': sid, **u} for sid, u in changes['joined'].items()],
+                'left': sorted(changes['left']),
+            }, to=code)
+        else:
+            socketio.emit('update_user_list', user_list(get_room_users(code)), to=code)
+    except Exception as e:
+        logger.warning(f"User list broadcast failed for {code}: {e}")
+
+def _reap_stale(code, stale):
+    # Every worker sees the same stale members; whoever removes a sid from `seen` first reaps it
+    pipe = r.pipeline(transaction=False)
+    for sid in stale:
+        pipe.zrem(room_key(code, 'seen'), sid)
+    stale = [sid for sid, claimed in zip(stale, pipe.execute()) if claimed]
+    if not stale:
+        return
+    removed, remaining = remove_room_users(code, *stale)
+    r.delete(*[f"sid:{sid}" for sid in stale])
+    for sid in stale:
+        note_presence(code, sid)
+    logger.info(f"Reaped {removed} stale member(s) from {code}")
+    if not remaining:
+        release_if_empty(code)
+
+# KEYS: room's seen zset, PRESENCE_ROOMS. ARGV: code
+_DROP_IDLE_ROOM = LuaScript("""
+if redis.call('ZCARD', KEYS[1]) > 0 then return 0 end
+return redis.call('ZREM', KEYS[2], ARGV[1])
+""")
+
+def presence_tick(now=None):
+    """One heartbeat: refresh this worker's sockets, then reap stale members of its rooms and of
+    any room no worker has heartbeated for PRESENCE_TTL."""
+    now = now or time.time()
+    by_room = defaultdict(dict)
+    for sid, code in list(_local_sids.items()):
+        by_room[code][sid] = now
+    pipe = r.pipeline(transaction=False)
+    for code, beats in by_room.items():
+        pipe.zadd(room_key(code, 'seen'), beats)
+    if by_room:
+        pipe.zadd(PRESENCE_ROOMS, {code: now for code in by_room})
+    pipe.zrangebyscore(PRESENCE_ROOMS, 0, now - PRESENCE_TTL, start=0, num=PRESENCE_SWEEP_MAX)
+    orphaned = pipe.execute()[-1]
+    rooms = list(by_room) + [code for code in orphaned if code not in by_room]
+    pipe = r.pipeline(transaction=False)
+    for code in rooms:
+        pipe.zrangebyscore(room_key(code, 'seen'), 0, now - PRESENCE_TTL)
+    for code, stale in zip(rooms, pipe.execute()):
+        if stale:
+            _reap_stale(code, stale)
+    for code in orphaned:
+        _DROP_IDLE_ROOM([room_key(code, 'seen'), PRESENCE_ROOMS], [code])
+
+def _presence_loop():
+    """Background thread — heartbeat this worker's sockets and reap members whose worker went away."""
+    while True:
+        time.sleep(PRESENCE_HEARTBEAT * random.uniform(0.9, 1.1))
+        if not r:
+            continue
+        try:
+            presence_tick()
+        except Exception as e:
+            logger.warning(f"Presence heartbeat failed: {e}")
+
+threading.Thread(target=_presence_loop, daemon=True).start()
+
+# Split any legacy blobs in the background so startup isn't held up by a large keyspace
+threading.Thread(target=migrate_legacy_rooms, daemon=True).start()
+
+# --- Outbound HTTP ---
+# Every upstream call (R2, lrclib, cobalt, Piped, Invidious, raw streams) shares one session, so
+# connections are kept alive and pooled per host instead of paying a TCP+TLS handshake each time.
+# Timeouts are (connect, read): dead hosts fail fast while slow-but-alive ones get the full read budget.
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS', 32))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 64))
+upstream_stats = defaultdict(Counter)
+
+_http = requests.Session()
+_http.headers['User-Agent'] = 'Mozilla/5.0'
+for _prefix in ('http://', 'https://'):
+    _http.mount(_prefix, HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE))
+
+def http_request(method, url, read_timeout, **kwargs):
+    stats = upstream_stats[urlsplit(url).netloc]
+    stats['requests'] += 1
+    started = time.time()
+    try:
+        resp = _http.request(method, url, timeout=(HTTP_CONNECT_TIMEOUT, read_timeout), **kwargs)
+    except requests.Timeout:
+        stats['timeouts'] += 1
+        raise
+    except Exception:
+        stats['errors'] += 1
+        raise
+    finally:
+        stats['ms_total'] += int((time.time() - started) * 1000)
+    stats[f'status_{resp.status_code // 100}xx'] += 1
+    return resp
+
+def http_get(url, read_timeout, **kwargs):
+    return http_request('GET', url, read_timeout, **kwargs)
+
+def http_post(url, read_timeout, **kwargs):
+    return http_request('POST', url, read_timeout, **kwargs)
+
+@app.route('/api/upstream-stats')
+def get_upstream_stats():
+    return jsonify(upstream_stats)
+
+# --- Caches ---
+# Per-process counters, keyed by cache name. Anything ending in `_hit` counts as a hit.
+cache_stats = defaultdict(Counter)
+
+class LRUCache:
+    """Small in-process LRU with per-entry expiry. Each worker has its own — pair it with Redis."""
+    def __init__(self, maxsize, ttl):
+        self.maxsize, self.ttl = maxsize, ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns (hit, value) so cached None values can be told apart from misses."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False, None
+            expires, value = item
+            if expires < time.time():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.time() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def coalesced(key, fn, timeout=30):
+    """Run fn() once per key at a time; concurrent callers wait for that result. The key prefix names the cache."""
+    with _inflight_lock:
+        pending = _inflight.get(key)
+        leader = pending is None
+        if leader:
+            pending = _inflight[key] = AsyncResult()
+    if not leader:
+        cache_stats[key.split(':', 1)[0]]['coalesced'] += 1
+        return pending.get(timeout=timeout)
+    try:
+        value = fn()
+        pending.set(value)
+        return value
+    except Exception as e:
+        pending.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+def _redis_cache_get(key):
+    if not r: return None
+    try:
+        return r.get(key)
+    except Exception as e:
+        logger.debug(f"Cache read failed for {key}: {e}")
+        return None
+
+def _redis_cache_set(key, value, ttl):
+    if not r: return
+    try:
+        r.set(key, value, ex=ttl)
+    except Exception as e:
+        logger.debug(f"Cache write failed for {key}: {e}")
+
+# --- Room cache ---
+# Decoded room reads (`core` = meta + state, `room` = the document minus the playlist, `page` =
+# the default playlist page around the current track) are kept per process,
+# tagged with the room's meta.cache_rev. Every room write bumps that rev and publishes
+# "<code> <rev>" on ROOM_CHANGED_CHANNEL; each worker's listener drops entries older than what it
+# hears, and the writing worker drops its own at once. A read that raced a write is never stored
+# behind a rev already announced. Nothing is cached while the listener is not subscribed, the
+# cache is cleared each time it (re)subscribes, and entries expire after ROOM_CACHE_MAX_AGE anyway.
+ROOM_CACHE_SIZE = int(os.environ.get('ROOM_CACHE_SIZE', 2048))
+ROOM_CACHE_MAX_AGE = int(os.environ.get('ROOM_CACHE_MAX_AGE', 30))
+ROOM_CACHE_KINDS = ('core', 'room', 'page')
+_room_cache = LRUCache(ROOM_CACHE_SIZE, ROOM_CACHE_MAX_AGE)  # (code, kind) -> (rev, value)
+_room_revs = LRUCache(ROOM_CACHE_SIZE, ROOM_CACHE_MAX_AGE)  # code -> newest rev announced
+_room_cache_live = False
+
+def cached_room(code, kind, fetch):
+    """fetch(code) -> (rev, value or None), run on a miss. Misses (missing rooms) aren't cached."""
+    stats = cache_stats['room']
+    hit, entry = _room_cache.get((code, kind))
+    if hit:
+        stats['memory_hit'] += 1
+        return entry[1]
+    stats['miss'] += 1
+    rev, value = fetch(code)
+    if value is not None and _room_cache_live and rev >= (_room_revs.get(code)[1] or 0):
+        _room_cache.set((code, kind), (rev, value))
+    return value
+
+def forget_room(code):
+    for kind in ROOM_CACHE_KINDS:
+        _room_cache.pop((code, kind))
+
+def _on_room_changed(message):
+    code, _, rev = message.partition(' ')
+    rev = int(rev or 0)
+    known = _room_revs.get(code)[1]
+    # rev 0 is a (re)created room: start counting again
+    _room_revs.set(code, rev if rev == 0 or known is None else max(known, rev))
+    for kind in ROOM_CACHE_KINDS:
+        hit, entry = _room_cache.get((code, kind))
+        if hit and (rev == 0 or entry[0] < rev):
+            _room_cache.pop((code, kind))
+            cache_stats['room']['invalidated'] += 1
+
+def _room_cache_listener():
+    """Background thread — applies other workers' (and our own) room-change announcements."""
+    global _room_cache_live
+    while True:
+        client = r
+        if not client:
+            time.sleep(1)
+            continue
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(ROOM_CHANGED_CHANNEL)
+            _room_cache.clear()  # whatever was announced while we weren't listening is lost
+            _room_cache_live = True
+            while r is client:
+                message = pubsub.get_message(timeout=1)
+                if message:
+                    _on_room_changed(message['data'])
+        except Exception as e:
+            logger.warning(f"Room cache listener disconnected: {e}")
+            time.sleep(1)
+        finally:
+            _room_cache_live = False
+            _room_cache.clear()
+            pubsub.close()
+
+threading.Thread(target=_room_cache_listener, daemon=True).start()
+
+@app.route('/api/cache-stats')
+def get_cache_stats():
+    out = {}
+    for name, counters in cache_stats.items():
+        hits = sum(v for k, v in counters.items() if k.endswith('_hit'))
+        lookups = hits + counters['miss']
+        out[name] = {**counters, 'hit_rate': round(hits / lookups, 3) if lookups else None}
+    return jsonify(out)
+
+# --- Lyrics cache ---
+# Memory LRU → Redis (`lyrics:<title>|<artist>`) → lrclib.net. "No lyrics" is cached too, for less time.
+LYRICS_TTL = int(os.environ.get('LYRICS_TTL', 7 * 86400))
+LYRICS_MISS_TTL = int(os.environ.get('LYRICS_MISS_TTL', 3600))
+_lyrics_mem = LRUCache(2048, LYRICS_TTL)
+
+def _normalize(text):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', (text or '').lower()).split())
+
+def _lyrics_cache_key(title, artist):
+    return f"lyrics:{_normalize(title)}|{_normalize(artist)}"
+
+def _fetch_lyrics_upstream(title, artist):
+    """Returns LRC/plain text, or None when lrclib has nothing. Raises on transport errors so they aren't cached."""
+    resp = http_get(
+        'https://lrclib.net/api/get', 5,
+        params={'track_name': title, 'artist_name': artist},
+    )
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    d = resp.json()
+    return d.get('syncedLyrics') or d.get('plainLyrics')
+
+def _load_lyrics(key, title, artist):
+    cache_stats['lyrics']['upstream'] += 1
+    lrc = _fetch_lyrics_upstream(title, artist)
+    ttl = LYRICS_TTL if lrc else LYRICS_MISS_TTL
+    _redis_cache_set(key, json.dumps({'lrc': lrc}), ttl)
+    _lyrics_mem.set(key, lrc, ttl)
+    return lrc
+
+def fetch_lyrics(title, artist=''):
+    key = _lyrics_cache_key(title, artist)
+    stats = cache_stats['lyrics']
+    hit, lrc = _lyrics_mem.get(key)
+    if hit:
+        stats['memory_hit' if lrc else 'negative_hit'] += 1
+        return lrc
+    cached = _redis_cache_get(key)
+    if cached is not None:
+        lrc = json.loads(cached)['lrc']
+        stats['redis_hit' if lrc else 'negative_hit'] += 1
+        _lyrics_mem.set(key, lrc, LYRICS_TTL if lrc else LYRICS_MISS_TTL)
+        return lrc
+    stats['miss'] += 1
+    try:
+        return coalesced(key, lambda: _load_lyrics(key, title, artist))
+    except Exception as e:
+        logger.debug(f"Lyrics fetch skipped: {e}")
+        return None
+
+# --- Parsed lyrics documents ---
+# Playlist entries only carry a `lyricsId`. The lyrics themselves are stored once, content-addressed,
+# at `lyrics:doc:<id>` as parallel time-sorted arrays: `t` (offsets in ms) and `l` (lines),
+# so clients can binary-search the active line instead of re-parsing LRC on every timeupdate.
+_LRC_STAMP = re.compile(r'\[(\d+):(\d+(?:\.\d+)?)\]')
+_LYRICS_ID = re.compile(r'^[0-9a-f]{16}$')
+_lyrics_docs = LRUCache(512, LYRICS_TTL)
 
-def safe_set(key, val): 
-    if r: r.set(key, val, ex=86400)
+def parse_lrc(lrc):
+    timed, plain = [], []
+    for raw in lrc.splitlines():
+        stamps, pos = [], 0
+        while (m := _LRC_STAMP.match(raw, pos)):
+            stamps.append(int((int(m[1]) * 60 + float(m[2])) * 1000))
+            pos = m.end()
+        text = raw[pos:].strip()
+        if not text:
+            continue
+        if stamps:
+            timed.extend((t, text) for t in stamps)
+        elif not text.startswith('['):  # skip [ar:...] style metadata tags
+            plain.append(text)
+    if timed:
+        timed.sort(key=lambda x: x[0])
+        return {'synced': True, 't': [t for t, _ in timed], 'l': [line for _, line in timed]}
+    return {'synced': False, 't': [], 'l': plain}
 
+def store_lyrics(lrc):
+    """Parse and store lyrics, returning their id (None if there are none). Identical lyrics share one doc."""
+    if not lrc:
+        return None
+    lyrics_id = hashlib.sha1(lrc.encode()).hexdigest()[:16]
+    doc = parse_lrc(lrc)
+    _lyrics_docs.set(lyrics_id, doc)
+    _redis_cache_set(f"lyrics:doc:{lyrics_id}", json.dumps(doc, separators=(',', ':')), LYRICS_TTL)
+    return lyrics_id
+
+def get_lyrics_doc(lyrics_id):
+    stats = cache_stats['lyrics_doc']
+    hit, doc = _lyrics_docs.get(lyrics_id)
+    if hit:
+        stats['memory_hit'] += 1
+        return doc
+    raw = None
+    if r:
+        try:
+            raw = r.getex(f"lyrics:doc:{lyrics_id}", ex=LYRICS_TTL)
+        except Exception as e:
+            logger.debug(f"Lyrics doc read failed: {e}")
+    if raw is None:
+        stats['miss'] += 1
+        return None
+    stats['redis_hit'] += 1
+    doc = json.loads(raw)
+    _lyrics_docs.set(lyrics_id, doc)
+    return doc
+
+# --- Helpers ---
 def get_file_url(filename):
     r2_public = os.environ.get('R2_PUBLIC_URL', '').rstrip('/')
     if r2_public:
@@ -177,32 +1421,204 @@ def get_file_url(filename):
 def serve_file(filename):
     response = send_from_directory(UPLOAD_FOLDER, filename)
     response.headers['Access-Control-Allow-Origin'] = '*'
+    if filename.endswith('.ts'):
+        response.headers['Cache-Control'] = HLS_SEGMENT_CACHE
+    elif filename.endswith('.m3u8'):
+        response.headers['Cache-Control'] = 'no-cache'  # grows while the ingest is still running
     return response
 
-@app.route('/api/audio/<path:filename>')
-def proxy_audio(filename):
-    """Stream audio from R2 through Flask so CORS headers are present regardless of bucket settings."""
-    import requests as req
-    r2_public = os.environ.get('R2_PUBLIC_URL', '').rstrip('/')
-    if not r2_public:
-        return serve_file(filename)
-    url = f"{r2_public}/{filename}"
+# --- Audio range cache ---
+# Proxied R2 audio is fetched in fixed, aligned chunks and kept on local disk (LRU, size-capped),
+# so forty listeners starting the same track at the same moment cost one upstream fetch per chunk.
+# Concurrent misses for the same chunk share a single request; any Range is served from chunks.
+AUDIO_CACHE_DIR = os.environ.get('AUDIO_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'moodsync-audio'))
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get('AUDIO_CACHE_MAX_MB', 1024)) * 1024 * 1024
+AUDIO_CHUNK_SIZE = 1024 * 1024
+
+class AudioChunkCache:
+    def __init__(self, root, max_bytes):
+        self.root, self.max_bytes = root, max_bytes
+        self._index = OrderedDict()  # chunk path -> size, least recently used first
+        self._bytes = 0
+        self._meta = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        found = []
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                if name.endswith('.tmp'):
+                    try: os.remove(path)
+                    except OSError: pass
+                elif not name.endswith('.meta'):
+                    st = os.stat(path)
+                    found.append((st.st_mtime, path, st.st_size))
+        for _, path, size in sorted(found):
+            self._index[path] = size
+            self._bytes += size
+
+    def _base(self, filename):
+        digest = hashlib.sha1(filename.encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    def meta(self, filename, url):
+        """{'size', 'etag', 'type'} for an object — from memory, the sidecar file, or by fetching chunk 0."""
+        meta = self._meta.get(filename)
+        if meta is None:
+            try:
+                with open(self._base(filename) + '.meta') as f:
+                    meta = self._meta[filename] = json.load(f)
+            except (OSError, ValueError):
+                self.chunk(filename, url, 0)
+                meta = self._meta[filename]
+        return meta
+
+    def chunk(self, filename, url, idx):
+        path = f"{self._base(filename)}.{idx}"
+        with self._lock:
+            hit = path in self._index
+            if hit: self._index.move_to_end(path)
+        if hit:
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                cache_stats['audio']['disk_hit'] += 1
+                return data
+            except OSError:
+                self._forget(path)
+        cache_stats['audio']['miss'] += 1
+        return coalesced(f"audio:{filename}:{idx}", lambda: self._fetch(filename, url, idx, path))
+
+    def _fetch(self, filename, url, idx, path):
+        cache_stats['audio']['upstream'] += 1
+        start = idx * AUDIO_CHUNK_SIZE
+        with http_get(url, 10, headers={'Range': f'bytes={start}-{start + AUDIO_CHUNK_SIZE - 1}'}) as resp:
+            if resp.status_code == 404:
+                raise FileNotFoundError(filename)
+            if resp.status_code == 416:
+                return b''
+            if resp.status_code != 206:
+                raise RuntimeError(f"upstream answered {resp.status_code} to a range request")
+            data = resp.content
+            total = int(resp.headers.get('Content-Range', '').rsplit('/', 1)[-1])
+            meta = {
+                'size': total,
+                'etag': resp.headers.get('ETag') or f'"{hashlib.sha1(filename.encode()).hexdigest()[:16]}-{total:x}"',
+                'type': resp.headers.get('Content-Type', 'audio/mpeg'),
+            }
+        known = self._meta.get(filename)
+        if known and known['etag'] != meta['etag']:
+            self.purge(filename)  # object was replaced upstream
+        self._meta[filename] = meta
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write(self._base(filename) + '.meta', json.dumps(meta).encode())
+        self._write(path, data)
+        with self._lock:
+            self._index[path] = len(data)
+            self._bytes += len(data)
+        self._evict()
+        return data
+
+    def _write(self, path, data):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _forget(self, path):
+        with self._lock:
+            self._bytes -= self._index.pop(path, 0)
+        try: os.remove(path)
+        except OSError: pass
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self._bytes <= self.max_bytes or not self._index:
+                    return
+                path, size = self._index.popitem(last=False)
+                self._bytes -= size
+            try: os.remove(path)
+            except OSError: pass
+
+    def purge(self, filename):
+        base = self._base(filename)
+        self._meta.pop(filename, None)
+        with self._lock:
+            stale = [p for p in self._index if p.startswith(base + '.')]
+        for p in stale:
+            self._forget(p)
+
+audio_cache = AudioChunkCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES)
+
+def _parse_range(header, size):
+    """(start, end) for a single `bytes=` range, None to serve the whole object. Raises ValueError if unsatisfiable."""
+    m = re.fullmatch(r'bytes=(\d*)-(\d*)', (header or '').strip())
+    if not m or not (m[1] or m[2]):
+        return None  # absent, multi-range or malformed — fall back to a full 200
+    if m[1]:
+        start = int(m[1])
+        end = min(int(m[2]), size - 1) if m[2] else size - 1
+    else:
+        start, end = max(size - int(m[2]), 0), size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+def _serve_cached_audio(filename, url):
+    meta = audio_cache.meta(filename, url)
+    size = meta['size']
+    headers = {
+        'Content-Type': meta['type'],
+        'Accept-Ranges': 'bytes',
+        'ETag': meta['etag'],
+        'Cache-Control': 'public, max-age=86400',
+        'Access-Control-Allow-Origin': '*',
+    }
+    if_range = request.headers.get('If-Range')
+    range_header = request.headers.get('Range') if not if_range or if_range == meta['etag'] else None
+    if not range_header and request.headers.get('If-None-Match') == meta['etag']:
+        return Response(status=304, headers=headers)
+    try:
+        byte_range = _parse_range(range_header, size)
+    except ValueError:
+        return Response(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+    start, end = byte_range or (0, size - 1)
+    headers['Content-Length'] = str(max(end - start + 1, 0))
+    if byte_range:
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    def generate():
+        for idx in range(start // AUDIO_CHUNK_SIZE, end // AUDIO_CHUNK_SIZE + 1):
+            data = audio_cache.chunk(filename, url, idx)
+            base = idx * AUDIO_CHUNK_SIZE
+            lo, hi = max(start - base, 0), min(end - base, len(data) - 1)
+            for off in range(lo, hi + 1, 65536):
+                yield data[off:min(off + 65536, hi + 1)]
+    return Response(stream_with_context(generate()), status=206 if byte_range else 200, headers=headers)
+
+def _proxy_audio_passthrough(url):
     range_header = request.headers.get('Range')
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    if range_header:
-        headers['Range'] = range_header
+    headers = {'Range': range_header} if range_header else {}
     try:
-        upstream = req.get(url, headers=headers, stream=True, timeout=10)
+        upstream = http_get(url, 10, headers=headers, stream=True)
         def generate():
-            for chunk in upstream.iter_content(chunk_size=65536):
-                if chunk:
-                    yield chunk
+            try:
+                for chunk in upstream.iter_content(chunk_size=65536):
+                    if chunk:
+                        yield chunk
+            finally:
+                # Hand the connection back to the pool even if the listener hung up mid-range
+                upstream.close()
         resp_headers = {
             'Content-Type': upstream.headers.get('Content-Type', 'audio/mpeg'),
             'Accept-Ranges': 'bytes',
             'Access-Control-Allow-Origin': '*',
         }
-        for h in ('Content-Length', 'Content-Range'):
+        for h in ('Content-Length', 'Content-Range', 'ETag'):
             if h in upstream.headers:
                 resp_headers[h] = upstream.headers[h]
         return Response(stream_with_context(generate()), status=upstream.status_code, headers=resp_headers)
@@ -210,6 +1626,21 @@ def proxy_audio(filename):
         logger.error(f"Audio proxy error: {e}")
         return jsonify({'error': 'Audio unavailable'}), 502
 
+@app.route('/api/audio/<path:filename>')
+def proxy_audio(filename):
+    """Stream audio from R2 through Flask so CORS headers are present regardless of bucket settings."""
+    r2_public = os.environ.get('R2_PUBLIC_URL', '').rstrip('/')
+    if not r2_public:
+        return serve_file(filename)
+    url = f"{r2_public}/{filename}"
+    try:
+        return _serve_cached_audio(filename, url)
+    except FileNotFoundError:
+        return jsonify({'error': 'Not Found'}), 404
+    except Exception as e:
+        logger.warning(f"Audio cache bypassed for {filename}: {e}")
+        return _proxy_audio_passthrough(url)
+
 @app.route('/generate', methods=['POST', 'OPTIONS'])
 def generate():
     if request.method == 'OPTIONS': return _build_cors_preflight_response()
@@ -217,30 +1648,36 @@ def generate():
         _try_connect_redis()
         if not r: return jsonify({'error': 'DB Error: Redis is offline'}), 503
     
-    while True:
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-        if not r.exists(f"room:{code}"): 
-            break
-    
     data = {
         'playlist': [], 'title': "Sonic Space", 'users': {}, 'admin_uuid': None, 'admin_sid': None,
         'current_state': {
             'isPlaying': False, 'trackIndex': 0, 'volume': 80, 
-            'startTimestamp': 0, 'pausedAt': 0, 'isCollaborative': False, 'serverTime': time.time()
+            'startTimestamp': 0, 'pausedAt': 0, 'isCollaborative': False, 'serverTime': server_now()
         }
     }
-    safe_set(f"room:{code}", json.dumps(data))
-    return jsonify({'room_code': code})
+    for _ in range(10):
+        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+        if create_room(code, data):
+            return jsonify({'room_code': code})
+    return jsonify({'error': 'Could not allocate a room code'}), 503
 
 @app.route('/api/room/<code_in>', methods=['GET', 'OPTIONS'])
 def get_room(code_in):
     if request.method == 'OPTIONS': return _build_cors_preflight_response()
     if not r: return jsonify({'error': 'DB Error'}), 500
     
-    data = safe_get(f"room:{code_in.upper()}")
-    resp = json.loads(data) if data else {'error': 'Not Found'}
-    if 'error' not in resp: resp['serverTime'] = time.time()
-    return jsonify(resp)
+    code = code_in.upper()
+    cursor = request.args.get('cursor')
+    try:
+        limit = min(max(int(request.args.get('limit', PLAYLIST_PAGE_SIZE)), 1), PLAYLIST_PAGE_MAX)
+        page = playlist_page(code, cursor, limit)
+    except ValueError:
+        return jsonify({'error': 'Bad cursor or limit'}), 400
+    if page is None: return jsonify({'error': 'Not Found'})
+    if cursor: return jsonify(page)  # later pages carry only the playlist
+    room = load_room(code)
+    if not room: return jsonify({'error': 'Not Found'})
+    return jsonify({**room, **page, 'serverTime': server_now()})
 
 @app.route('/api/upload-local', methods=['POST', 'OPTIONS'])
 def upload_local():
@@ -255,58 +1692,195 @@ def upload_local():
         r2_url = r2_upload(tmp_path, name, content_type=f.content_type or 'audio/mpeg')
         if r2_url:
             os.remove(tmp_path)
-            return jsonify({'audioUrl': r2_url})
+            record_upload(name)
+            return jsonify({'audioUrl': r2_url, 'key': name})
         return jsonify({'audioUrl': get_file_url(name)})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/yt-search', methods=['POST', 'OPTIONS'])
-def search_yt():
+# --- Direct-to-R2 uploads ---
+# The browser PUTs straight to R2 with a presigned URL and then calls upload-complete, so the audio
+# never passes through this server. 501 from upload-url means R2 isn't configured: use /api/upload-local.
+# A finished upload's key is recorded at `uploaded:<key>` for UPLOAD_CLAIM_TTL; add-upload only takes
+# keys recorded there (once), so a client can't get playback URLs signed for other objects in the bucket.
+_AUDIO_EXTS = {'.mp3', '.wav', '.ogg', '.m4a', '.flac', '.aac', '.webm'}
+UPLOAD_CLAIM_TTL = 3600
+
+def record_upload(key):
+    if r:
+        r.set(f"uploaded:{key}", 1, ex=UPLOAD_CLAIM_TTL)
+
+def claim_upload(key):
+    """True once for a key this server recorded as uploaded."""
+    return bool(r and isinstance(key, str) and r.delete(f"uploaded:{key}"))
+
+@app.route('/api/upload-url', methods=['POST', 'OPTIONS'])
+def upload_url():
     if request.method == 'OPTIONS': return _build_cors_preflight_response()
-    q = request.json.get('query', '')
-    if not q:
-        return jsonify({'results': []})
+    client, bucket = _r2_client()
+    if not client:
+        return jsonify({'error': 'Direct upload unavailable'}), 501
+    data = request.json or {}
+    ext = os.path.splitext(data.get('filename') or '')[1].lower() or '.mp3'
+    content_type = data.get('contentType') or 'audio/mpeg'
+    size = int(data.get('size') or 0)
+    if ext not in _AUDIO_EXTS or not content_type.startswith('audio/'):
+        return jsonify({'error': 'Not an audio file'}), 400
+    if not 0 < size <= app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'error': 'File too large'}), 413
+    key = secure_filename(f"{int(time.time())}-{os.urandom(4).hex()}{ext}")
+    try:
+        upload = client.generate_presigned_url(
+            'put_object', Params={'Bucket': bucket, 'Key': key, 'ContentType': content_type},
+            ExpiresIn=R2_UPLOAD_URL_TTL
+        )
+    except Exception as e:
+        logger.error(f"Presign failed: {e}")
+        return jsonify({'error': 'Direct upload unavailable'}), 501
+    if r:
+        r.set(f"upload:{key}", content_type, ex=R2_UPLOAD_URL_TTL * 2)
+    return jsonify({'uploadUrl': upload, 'key': key, 'headers': {'Content-Type': content_type}})
 
+@app.route('/api/upload-complete', methods=['POST', 'OPTIONS'])
+def upload_complete():
+    if request.method == 'OPTIONS': return _build_cors_preflight_response()
+    client, bucket = _r2_client()
+    if not client:
+        return jsonify({'error': 'Direct upload unavailable'}), 501
+    key = secure_filename((request.json or {}).get('key') or '')
+    # Only keys this server handed out can be registered
+    if not key or (r and not r.exists(f"upload:{key}")):
+        return jsonify({'error': 'Unknown upload'}), 404
+    try:
+        head = client.head_object(Bucket=bucket, Key=key)
+    except Exception:
+        return jsonify({'error': 'Upload not found'}), 404
+    # A presigned PUT can't cap the body size, so enforce the limit here
+    if head.get('ContentLength', 0) > app.config['MAX_CONTENT_LENGTH']:
+        try: client.delete_object(Bucket=bucket, Key=key)
+        except Exception as e: logger.warning(f"Could not delete oversized upload {key}: {e}")
+        return jsonify({'error': 'File too large'}), 413
+    if r:
+        r.delete(f"upload:{key}")
+    record_upload(key)
+    logger.info(f"✅ R2 direct upload: {key}")
+    return jsonify({'audioUrl': r2_playback_url(key), 'key': key})
+
+# --- Search ---
+# Results are cached by normalized query (memory LRU → Redis `search:<query>`) so repeated and
+# popular searches skip both the round trip and the YouTube Data API quota. Entries record which
+# backend answered ('api' or 'ytmusic'); only hits on Data API results count as quota saved.
+SEARCH_TTL = int(os.environ.get('SEARCH_TTL', 6 * 3600))
+SEARCH_QUOTA_COST = 100  # YouTube Data API units per search.list call
+_search_mem = LRUCache(1024, SEARCH_TTL)
+_youtube = None
+_youtube_lock = threading.Lock()
+
+def _youtube_client():
+    """Build the Data API client once per process — discovery is slow and doesn't change."""
+    global _youtube
     api_key = os.environ.get('YOUTUBE_API_KEY')
-    if api_key:
-        try:
+    if not api_key:
+        return None
+    with _youtube_lock:
+        if _youtube is None:
             from googleapiclient.discovery import build
-            youtube = build('youtube', 'v3', developerKey=api_key)
-            resp = youtube.search().list(
-                part='snippet', q=q, type='video',
-                videoCategoryId='10', maxResults=8
-            ).execute()
-            results = []
-            for item in resp.get('items', []):
-                vid_id = item['id'].get('videoId')
-                if not vid_id:
-                    continue
-                snippet = item['snippet']
-                results.append({
-                    'id': vid_id,
-                    'title': snippet['title'],
-                    'artist': snippet['channelTitle'].replace(' - Topic', ''),
-                    'thumbnail': snippet['thumbnails'].get('high', {}).get('url')
-                               or snippet['thumbnails']['default']['url'],
-                })
-            return jsonify({'results': results})
-        except Exception as e:
-            logger.warning(f"YouTube Data API search failed: {e}")
+            _youtube = build('youtube', 'v3', developerKey=api_key, cache_discovery=False)
+    return _youtube
+
+def _search_youtube_api(q):
+    youtube = _youtube_client()
+    if not youtube:
+        return None
+    try:
+        from googleapiclient.http import build_http
+        # The shared client isn't safe for concurrent requests on its own httplib2 transport,
+        # so each call brings a fresh one — it's the discovery build that was expensive.
+        resp = youtube.search().list(
+            part='snippet', q=q, type='video',
+            videoCategoryId='10', maxResults=8
+        ).execute(http=build_http())
+        results = []
+        for item in resp.get('items', []):
+            vid_id = item['id'].get('videoId')
+            if not vid_id:
+                continue
+            snippet = item['snippet']
+            results.append({
+                'id': vid_id,
+                'title': snippet['title'],
+                'artist': snippet['channelTitle'].replace(' - Topic', ''),
+                'thumbnail': snippet['thumbnails'].get('high', {}).get('url')
+                           or snippet['thumbnails']['default']['url'],
+            })
+        return results
+    except Exception as e:
+        logger.warning(f"YouTube Data API search failed: {e}")
+        return None
 
+def _search_ytmusic(q):
     # Fallback: ytmusicapi (scraping-based, less reliable)
-    if ytmusic:
-        try:
-            results = ytmusic.search(q, filter="songs", limit=5)
-            return jsonify({'results': [{
-                'id': i['videoId'],
-                'title': i['title'],
-                'artist': i['artists'][0]['name'] if 'artists' in i else 'Unknown',
-                'thumbnail': i['thumbnails'][-1]['url'] if 'thumbnails' in i else None
-            } for i in results if 'videoId' in i]})
-        except Exception as e:
-            logger.warning(f"ytmusicapi search failed: {e}")
+    if not ytmusic:
+        return None
+    try:
+        results = ytmusic.search(q, filter="songs", limit=5)
+        return [{
+            'id': i['videoId'],
+            'title': i['title'],
+            'artist': i['artists'][0]['name'] if 'artists' in i else 'Unknown',
+            'thumbnail': i['thumbnails'][-1]['url'] if 'thumbnails' in i else None
+        } for i in results if 'videoId' in i]
+    except Exception as e:
+        logger.warning(f"ytmusicapi search failed: {e}")
+        return None
+
+def _load_search(key, q):
+    cache_stats['search']['upstream'] += 1
+    source, results = 'api', _search_youtube_api(q)
+    if results is None:
+        source, results = 'ytmusic', _search_ytmusic(q)
+    if results:  # never cache a failed or empty search
+        entry = {'source': source, 'results': results}
+        _search_mem.set(key, entry)
+        _redis_cache_set(key, json.dumps(entry), SEARCH_TTL)
+    return results
 
-    return jsonify({'results': [], 'error': 'Search unavailable'})
+def search_tracks(q):
+    """Cached search. Returns a result list, or None if every backend failed."""
+    key = f"search:{' '.join(q.casefold().split())}"  # case and spacing only: "C++" is not "C"
+    stats = cache_stats['search']
+    started = time.time()
+    hit, entry = _search_mem.get(key)
+    tier = 'memory'
+    if not hit:
+        cached = _redis_cache_get(key)
+        if cached is not None:
+            entry = json.loads(cached)
+            if isinstance(entry, list):  # written before entries recorded their source
+                entry = {'source': None, 'results': entry}
+            hit, tier = True, 'redis'
+            _search_mem.set(key, entry)
+    if hit:
+        elapsed_ms = (time.time() - started) * 1000
+        stats[f'{tier}_hit'] += 1
+        stats['hit_ms_total'] += elapsed_ms
+        if entry['source'] == 'api':
+            stats['quota_saved'] += SEARCH_QUOTA_COST
+        logger.info(f"Search cache hit ({tier}, {elapsed_ms:.1f}ms): {q!r}")
+        return entry['results']
+    stats['miss'] += 1
+    return coalesced(key, lambda: _load_search(key, q))
+
+@app.route('/api/yt-search', methods=['POST', 'OPTIONS'])
+def search_yt():
+    if request.method == 'OPTIONS': return _build_cors_preflight_response()
+    q = request.json.get('query', '')
+    if not q:
+        return jsonify({'results': []})
+    results = search_tracks(q)
+    if results is None:
+        return jsonify({'results': [], 'error': 'Search unavailable'})
+    return jsonify({'results': results})
 
 @app.route('/api/room/<code_in>/add-yt', methods=['POST', 'OPTIONS'])
 def add_yt(code_in):
@@ -315,35 +1889,22 @@ def add_yt(code_in):
     data = request.json
     uuid = data.get('uuid')
     
-    rd_data = safe_get(f"room:{room}")
-    if not rd_data: return jsonify({'error': 'Room not found'}), 404
-    rd = json.loads(rd_data)
-    
-    if rd.get('admin_uuid') != uuid and not rd['current_state'].get('isCollaborative'):
+    meta, state = load_room_core(room)
+    if not state: return jsonify({'error': 'Room not found'}), 404
+
+    if meta['admin_uuid'] != uuid and not state.get('isCollaborative'):
         return jsonify({'error': 'Permission Denied'}), 403
 
     try:
-        vid = data['id']
-        # Resolve duration if not supplied. Search results don't include it; URL-paste does.
-        duration = data.get('duration')
-        if not duration:
-            try:
-                cookies_path = _get_cookies_path()
-                opts = {'quiet': True, 'skip_download': True, 'nocheckcertificate': True,
-                        'extractor_args': {'youtube': {'player_client': ['tv'] if cookies_path else ['ios']}}}
-                if cookies_path: opts['cookiefile'] = cookies_path
-                with yt_dlp.YoutubeDL(opts) as ydl:
-                    info = ydl.extract_info(f"https://www.youtube.com/watch?v={vid}", download=False)
-                    duration = info.get('duration')
-            except Exception as e:
-                logger.warning(f"Could not resolve duration for {vid}: {e}")
-
-        lrc = fetch_lyrics(data['title'], data.get('artist', ''))
-        add_track_logic(
-            room, rd, data['title'], data['artist'],
-            url=None, art=data.get('thumbnail'), lyrics=lrc,
-            video_id=vid, duration=duration,
+        # Append with what the client sent; duration (search results don't include it) and
+        # lyrics are filled in by the enrichment workers and pushed as playlist_track_updated.
+        track = add_track_logic(
+            room, data['title'], data['artist'],
+            url=None, art=data.get('thumbnail'), lyrics_id=None,
+            video_id=data['id'], duration=data.get('duration'),
         )
+        if track:
+            enqueue_enrichment(room, track)
         return jsonify({'success': True})
     except Exception as e:
         logger.error(f"add_yt error: {e}")
@@ -355,58 +1916,228 @@ def add_upload_route(code_in):
     if request.method == 'OPTIONS': return _build_cors_preflight_response()
     room = code_in.upper()
     data = request.json
-    rd_data = safe_get(f"room:{room}")
-    if not rd_data: return jsonify({'error': 'Room not found'}), 404
-    rd = json.loads(rd_data)
-    add_track_logic(room, rd, data['title'], data['artist'], data['audioUrl'], None, None)
+    if not room_exists(room): return jsonify({'error': 'Room not found'}), 404
+    # An R2 upload is stored by key; its URL may be a presigned one that expires before the room does
+    key = data.get('audioKey')
+    if key:
+        if not claim_upload(key):
+            return jsonify({'error': 'Unknown upload'}), 400
+        add_track_logic(room, data['title'], data['artist'], None, None, None, audio_key=key)
+    else:
+        add_track_logic(room, data['title'], data['artist'], data['audioUrl'], None, None)
     return jsonify({'success': True})
 
-def fetch_lyrics(title, artist=''):
+def add_track_logic(room_code, title, artist, url, art, lyrics_id, video_id=None, duration=None, audio_key=None):
+    track = {
+        'id': os.urandom(6).hex(), 'name': title, 'artist': artist, 'audioUrl': url, 'albumArt': art,
+        'lyricsId': lyrics_id, 'videoId': video_id, 'duration': duration,
+    }
+    if audio_key:
+        track['audioKey'] = audio_key
+    result = append_track(room_code, track)
+    if not result:
+        return None
+    length, rev, started = result
+    emit_playlist_delta(room_code, 'added', rev, index=length - 1, track=playable_tracks([track])[0])
+    if started:
+        broadcast_state(room_code, started)
+    return track
+
+# --- Track enrichment ---
+# Slow lookups for a new track (yt-dlp duration, lrclib lyrics) run here instead of in the request.
+# A fixed set of workers drains a bounded queue, so a burst of adds can't pile up unbounded work;
+# when the queue is full the track just keeps the data the client supplied.
+ENRICH_CONCURRENCY = int(os.environ.get('ENRICH_CONCURRENCY', 4))
+ENRICH_QUEUE_MAX = int(os.environ.get('ENRICH_QUEUE_MAX', 256))
+_enrich_queue = Queue(maxsize=ENRICH_QUEUE_MAX)
+_enrich_workers = []
+_enrich_lock = threading.Lock()
+
+def _enrich_track(room_code, track):
+    updates = {}
+    if not track.get('duration') and track.get('videoId'):
+        try:
+            duration = get_yt_meta(track['videoId']).get('duration')
+            if duration: updates['duration'] = duration
+        except Exception as e:
+            logger.warning(f"Could not resolve duration for {track['videoId']}: {e}")
+    if not track.get('lyricsId'):
+        lyrics_id = store_lyrics(fetch_lyrics(track['name'], track.get('artist') or ''))
+        if lyrics_id: updates['lyricsId'] = lyrics_id
+    if not updates or not r:
+        return
+    result = update_track(room_code, track['id'], updates)
+    if result:
+        idx, rev = result
+        emit_playlist_delta(room_code, 'updated', rev, index=idx, track={'id': track['id'], **updates})
+
+def _enrich_worker():
+    while True:
+        room_code, track = _enrich_queue.get()
+        try:
+            _enrich_track(room_code, track)
+        except Exception as e:
+            logger.warning(f"Enrichment failed for {track.get('name')}: {e}")
+
+def enqueue_enrichment(room_code, track):
+    with _enrich_lock:
+        while len(_enrich_workers) < ENRICH_CONCURRENCY:
+            worker = threading.Thread(target=_enrich_worker, daemon=True)
+            worker.start()
+            _enrich_workers.append(worker)
     try:
-        import requests as req
-        resp = req.get(
-            'https://lrclib.net/api/get',
-            params={'track_name': title, 'artist_name': artist},
-            timeout=4
-        )
-        if resp.ok:
-            d = resp.json()
-            return d.get('syncedLyrics') or d.get('plainLyrics')
-    except Exception as e:
-        logger.debug(f"Lyrics fetch skipped: {e}")
-    return None
+        _enrich_queue.put_nowait((room_code, track))
+    except Full:
+        logger.warning(f"Enrichment queue full, skipping {track.get('name')}")
+
+# --- Prefetch ---
+# When a playing room moves to another track, the next PREFETCH_AHEAD entries are warmed in the
+# background: duration and lyrics (persisted like enrichment if still missing), the yt metadata and
+# lyrics-doc caches, and the first chunk of R2 audio in the range cache. A per-process pool is the
+# budget — if it's busy the warm-up is skipped, not queued. Paused rooms are never prefetched.
+PREFETCH_AHEAD = int(os.environ.get('PREFETCH_AHEAD', 2))
+PREFETCH_CONCURRENCY = int(os.environ.get('PREFETCH_CONCURRENCY', 2))
+_prefetch_pool = Pool(PREFETCH_CONCURRENCY)
+_prefetched = LRUCache(4096, 600)  # tracks warmed recently, so seeking back and forth is free
 
-def add_track_logic(room_code, rd, title, artist, url, art, lyrics, video_id=None, duration=None):
-    key = f"room:{room_code}"
-    with r.lock(f"lock:{key}", timeout=5):
-        fresh_rd = json.loads(safe_get(key))
-        fresh_rd['playlist'].append({
-            'name': title, 'artist': artist, 'audioUrl': url, 'albumArt': art,
-            'lyrics': lyrics, 'videoId': video_id, 'duration': duration,
-        })
-        if len(fresh_rd['playlist']) == 1:
-            start_time = time.time() + 2.0
-            fresh_rd['current_state']['isPlaying'] = True
-            fresh_rd['current_state']['startTimestamp'] = start_time
-            fresh_rd['current_state']['serverTime'] = time.time()
-            fresh_rd['current_state']['trackIndex'] = 0
-        safe_set(key, json.dumps(fresh_rd))
-        socketio.emit('refresh_playlist', fresh_rd, to=room_code)
-        if len(fresh_rd['playlist']) == 1: 
-            socketio.emit('sync_player_state', fresh_rd['current_state'], to=room_code)
+def _prefetch_track(room_code, track):
+    if track.get('id'):
+        _enrich_track(room_code, track)
+    if track.get('videoId'):
+        get_yt_meta(track['videoId'])
+    if track.get('lyricsId'):
+        get_lyrics_doc(track['lyricsId'])
+    url = track.get('audioUrl') or ''
+    r2_public = os.environ.get('R2_PUBLIC_URL', '').rstrip('/')
+    key = track.get('audioKey') or (url[len(r2_public) + 1:] if r2_public and url.startswith(r2_public + '/') else None)
+    if r2_public and key:
+        audio_cache.meta(key, f"{r2_public}/{key}")
+
+def _prefetch(room_code, tracks):
+    for track in tracks:
+        try:
+            _prefetch_track(room_code, track)
+            cache_stats['prefetch']['tracks'] += 1
+        except Exception as e:
+            logger.warning(f"Prefetch failed for {track.get('name')}: {e}")
+
+def schedule_prefetch(room_code, state):
+    if not r or not state.get('isPlaying'):
+        return
+    if _prefetch_pool.full():
+        cache_stats['prefetch']['skipped_busy'] += 1
+        return
+    start = state.get('trackIndex', 0) + 1
+    tracks = []
+    ids = r.zrange(room_key(room_code, 'order'), start, start + PREFETCH_AHEAD - 1)
+    for raw in (r.hmget(room_key(room_code, 'tracks'), ids) if ids else []):
+        if not raw:
+            continue
+        track = decode_room_value(raw)
+        key = track.get('id') or track.get('videoId') or track.get('audioUrl')
+        if not key or _prefetched.get(key)[0]:
+            continue
+        _prefetched.set(key, True)
+        tracks.append(track)
+    if tracks:
+        cache_stats['prefetch']['scheduled'] += 1
+        _prefetch_pool.spawn(_prefetch, room_code, tracks)
 
 def _get_cookies_path():
-    """Copy secret cookies to /tmp so yt-dlp can write back to it."""
+    """Copy secret cookies to /tmp so yt-dlp can write back to it. Only re-copies when the secret changes."""
     secret = '/etc/secrets/cookies.txt'
     writable = '/tmp/yt_cookies.txt'
     if os.path.exists(secret):
         try:
-            shutil.copy2(secret, writable)
+            if not os.path.exists(writable) or os.path.getmtime(secret) > os.path.getmtime(writable):
+                shutil.copy2(secret, writable)
             return writable
         except Exception as e:
             logger.warning(f"Could not copy cookies: {e}")
     return None
 
+# --- YouTube metadata cache ---
+# Memory LRU → Redis (`ytmeta:<video id>`) → yt-dlp extract_info. Shared by add-yt, /api/yt-info and the bulk lookup.
+YT_META_TTL = int(os.environ.get('YT_META_TTL', 7 * 86400))
+YT_META_CONCURRENCY = int(os.environ.get('YT_META_CONCURRENCY', 8))
+YT_BULK_MAX = 50
+_YT_ID = re.compile(r'(?:v=|youtu\.be/|shorts/|embed/|live/)([\w-]{11})')
+_YT_BARE_ID = re.compile(r'^[\w-]{11}$')
+_yt_meta_mem = LRUCache(4096, YT_META_TTL)
+
+def parse_video_id(url):
+    url = (url or '').strip()
+    if _YT_BARE_ID.match(url):
+        return url
+    m = _YT_ID.search(url)
+    return m.group(1) if m else None
+
+def _extract_yt_info(url, fmt=None):
+    cookies_path = _get_cookies_path()
+    opts = {
+        'quiet': True, 'skip_download': True, 'nocheckcertificate': True,
+        'extractor_args': {'youtube': {'player_client': ['tv'] if cookies_path else ['ios']}},
+    }
+    if fmt:
+        opts['format'] = fmt
+    if cookies_path:
+        opts['cookiefile'] = cookies_path
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        return ydl.extract_info(url, download=False)
+
+def _store_yt_meta(info):
+    meta = {
+        'id': info.get('id'),
+        'title': info.get('title'),
+        'artist': (info.get('uploader') or 'Unknown').replace(' - Topic', ''),
+        'thumbnail': info.get('thumbnail'),
+        'duration': info.get('duration'),
+    }
+    if meta['id']:
+        _yt_meta_mem.set(meta['id'], meta)
+        _redis_cache_set(f"ytmeta:{meta['id']}", json.dumps(meta), YT_META_TTL)
+    return meta
+
+def _load_yt_meta(video_id):
+    cache_stats['ytmeta']['upstream'] += 1
+    return _store_yt_meta(_extract_yt_info(f"https://www.youtube.com/watch?v={video_id}"))
+
+def get_yt_meta(video_id, cached=None):
+    """Title/artist/thumbnail/duration for a video id. Raises if yt-dlp can't resolve it."""
+    stats = cache_stats['ytmeta']
+    hit, meta = _yt_meta_mem.get(video_id)
+    if hit:
+        stats['memory_hit'] += 1
+        return meta
+    if cached is None:
+        cached = _redis_cache_get(f"ytmeta:{video_id}")
+    if cached is not None:
+        stats['redis_hit'] += 1
+        meta = json.loads(cached)
+        _yt_meta_mem.set(video_id, meta)
+        return meta
+    stats['miss'] += 1
+    return coalesced(f"ytmeta:{video_id}", lambda: _load_yt_meta(video_id))
+
+def get_yt_meta_bulk(video_ids):
+    """Resolve many ids at once: one Redis MGET, then concurrent yt-dlp lookups for the rest. Failures map to None."""
+    ids = list(dict.fromkeys(video_ids))
+    cached = [None] * len(ids)
+    if r and ids:
+        try:
+            cached = r.mget([f"ytmeta:{v}" for v in ids])
+        except Exception as e:
+            logger.debug(f"Bulk meta read failed: {e}")
+
+    def resolve(pair):
+        vid, raw = pair
+        try:
+            return vid, get_yt_meta(vid, cached=raw)
+        except Exception as e:
+            logger.warning(f"Could not resolve metadata for {vid}: {e}")
+            return vid, None
+    return dict(Pool(YT_META_CONCURRENCY).imap_unordered(resolve, zip(ids, cached)))
+
 _PIPED_APIS = [
     ('https://pipedapi.kavin.rocks', 25),
     ('https://pipedapi.adminforge.de', 20),
@@ -424,27 +2155,215 @@ _INVIDIOUS_APIS = [
     ('https://vid.puffyan.us', 20),
 ]
 
+# --- Streaming ingest ---
+# The upstream response is piped straight into ffmpeg's stdin and the encoded MP3 is read off its
+# stdout as it is produced, into `<path>.part`. Nothing waits for the whole download, the raw stream
+# never touches disk, and readers can follow the file while the transcode is still running.
+INGEST_CHUNK = 65536
+INGEST_HEADERS = {'Content-Type': 'audio/mpeg', 'Cache-Control': 'no-store', 'Access-Control-Allow-Origin': '*'}
+FFMPEG_MP3 = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+              '-vn', '-acodec', 'libmp3lame', '-q:a', '2', '-f', 'mp3', 'pipe:1']
+
+class StreamingIngest:
+    def __init__(self, stream_url, path):
+        self.stream_url, self.path = stream_url, path
+        self.part_path = path + '.part'
+        self.size = 0
+        self.error = None
+        self.done = Event()
+        self._grew = Event()
+        self._out = open(self.part_path, 'wb')  # exists before anyone can follow() it
+        self.greenlet = gevent.spawn(self._run)
+
+    def _feed(self, proc):
+        try:
+            with http_get(self.stream_url, 180, stream=True) as resp:
+                resp.raise_for_status()
+                for chunk in resp.iter_content(chunk_size=INGEST_CHUNK):
+                    proc.stdin.write(chunk)
+                    proc.stdin.flush()  # a slow source's small chunks would otherwise wait in the pipe buffer
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; its return code says why
+        except Exception as e:
+            self.error = e
+        finally:
+            try: proc.stdin.close()
+            except OSError: pass
+
+    def _run(self):
+        started = time.time()
+        proc = subprocess.Popen(FFMPEG_MP3, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        feeder = gevent.spawn(self._feed, proc)
+        try:
+            with self._out as out:
+                while True:
+                    data = proc.stdout.read1(INGEST_CHUNK)
+                    if not data:
+                        break
+                    out.write(data)
+                    out.flush()
+                    if not self.size:
+                        logger.info(f"⏱️ First encoded bytes after {time.time() - started:.1f}s")
+                    self.size += len(data)
+                    self._wake()
+            feeder.join()
+            if self.error:
+                raise self.error
+            if proc.wait() != 0:
+                raise RuntimeError(f"ffmpeg exited {proc.returncode}: {proc.stderr.read().decode(errors='replace')[-300:]}")
+            if not self.size:
+                raise RuntimeError("ffmpeg produced no output")
+            os.replace(self.part_path, self.path)
+        except BaseException as e:
+            self.error = e
+            feeder.kill()
+            if proc.poll() is None:
+                proc.kill()
+            try: os.remove(self.part_path)
+            except OSError: pass
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            proc.wait()
+            self.done.set()
+            self._wake()
+
+    def _wake(self):
+        grew, self._grew = self._grew, Event()
+        grew.set()
+
+    def follow(self, start=0):
+        """Yield the encoded bytes from `start` on, waiting for more until the transcode ends."""
+        try:
+            f = open(self.path if self.done.is_set() else self.part_path, 'rb')
+        except FileNotFoundError:
+            f = open(self.path, 'rb')  # finished between the check and the open
+        with f:
+            f.seek(start)
+            while True:
+                grew = self._grew
+                data = f.read(INGEST_CHUNK)
+                if data:
+                    yield data
+                elif self.done.is_set():
+                    if self.error:
+                        raise RuntimeError(f"ingest failed: {self.error}")
+                    return
+                else:
+                    grew.wait(timeout=5)
+
+    def wait(self):
+        self.done.wait()
+        if self.error:
+            raise self.error
+        return self.path
+
+    def publish(self):
+        """Move the finished file to R2 if configured. Returns where it lives: 'r2:<key>' or a local path."""
+        name = os.path.basename(self.path)
+        if r2_upload(self.path, name):
+            os.remove(self.path)
+            return f"r2:{name}"
+        return f"/uploads/{name}"
+
+    def response(self):
+        return Response(stream_with_context(self.follow()), headers=INGEST_HEADERS)
+
 def _download_stream(stream_url):
     """Download a raw audio stream URL and convert to mp3. Returns local_mp3_path or raises."""
-    import requests as req, subprocess, tempfile
-    with tempfile.NamedTemporaryFile(suffix='.tmp', delete=False) as tmp:
-        raw_path = tmp.name
-    try:
-        with req.get(stream_url, stream=True, timeout=180,
-                     headers={'User-Agent': 'Mozilla/5.0'}) as resp:
-            resp.raise_for_status()
-            with open(raw_path, 'wb') as fout:
-                for chunk in resp.iter_content(chunk_size=65536):
-                    fout.write(chunk)
-        mp3_path = raw_path + '.mp3'
-        subprocess.run(
-            ['ffmpeg', '-y', '-i', raw_path, '-vn', '-acodec', 'libmp3lame', '-q:a', '2', mp3_path],
-            check=True, capture_output=True
-        )
-        return mp3_path
-    finally:
-        try: os.remove(raw_path)
-        except: pass
+    with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as tmp:
+        mp3_path = tmp.name
+    try:
+        return StreamingIngest(stream_url, mp3_path).wait()
+    except Exception:
+        try: os.remove(mp3_path)
+        except OSError: pass
+        raise
+
+# --- Segmented (HLS) ingest ---
+# With INGEST_FORMAT=hls, ffmpeg cuts the same piped input into fixed-length AAC segments plus an
+# EVENT playlist under uploads/hls/<video_id>/. Segment names never change content, so they are
+# served and uploaded as immutable; a player joining mid-track only pulls the segments around its
+# position. Playback can begin as soon as the first segment is listed in the manifest.
+INGEST_FORMAT = os.environ.get('INGEST_FORMAT', 'mp3')
+HLS_SEGMENT_SECONDS = int(os.environ.get('HLS_SEGMENT_SECONDS', 6))
+HLS_SEGMENT_CACHE = 'public, max-age=31536000, immutable'
+HLS_MANIFEST = 'index.m3u8'
+HLS_LOCAL_GRACE = int(os.environ.get('HLS_LOCAL_GRACE', 600))
+
+def _ffmpeg_hls(out_dir):
+    return ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0', '-vn', '-c:a', 'aac', '-b:a', '160k',
+            '-f', 'hls', '-hls_time', str(HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'event',
+            '-hls_segment_filename', os.path.join(out_dir, 'seg%05d.ts'), os.path.join(out_dir, HLS_MANIFEST)]
+
+class SegmentedIngest(StreamingIngest):
+    def __init__(self, stream_url, out_dir):
+        self.stream_url, self.out_dir = stream_url, out_dir
+        self.path = os.path.join(out_dir, HLS_MANIFEST)
+        self.size = 0  # segments written so far
+        self.error = None
+        self.done = Event()
+        self.ready = Event()  # manifest lists at least one segment
+        os.makedirs(out_dir, exist_ok=True)
+        self.greenlet = gevent.spawn(self._run)
+
+    def _segments(self):
+        return sorted(n for n in os.listdir(self.out_dir) if n.endswith('.ts'))
+
+    def _run(self):
+        proc = subprocess.Popen(_ffmpeg_hls(self.out_dir), stdin=subprocess.PIPE,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        feeder = gevent.spawn(self._feed, proc)
+        try:
+            while proc.poll() is None:
+                if not self.ready.is_set() and os.path.exists(self.path):
+                    self.ready.set()
+                gevent.sleep(0.25)
+            feeder.join()
+            if self.error:
+                raise self.error
+            if proc.returncode != 0:
+                raise RuntimeError(f"ffmpeg exited {proc.returncode}: {proc.stderr.read().decode(errors='replace')[-300:]}")
+            self.size = len(self._segments())
+            if not self.size or not os.path.exists(self.path):
+                raise RuntimeError("ffmpeg produced no segments")
+        except BaseException as e:
+            self.error = e
+            feeder.kill()
+            if proc.poll() is None:
+                proc.kill()
+            shutil.rmtree(self.out_dir, ignore_errors=True)
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            proc.wait()
+            self.done.set()
+            self.ready.set()
+
+    def publish(self):
+        """Upload segments then the manifest to R2. Presigned URLs can't cover the segments the
+        manifest points at, so without a public bucket URL the files stay in uploads/.
+        Listeners already redirected to the local manifest keep pulling segments from it, so after
+        an upload the local copy stays for one play of the track plus HLS_LOCAL_GRACE; by then the
+        ingest record sends everyone else to R2."""
+        prefix = os.path.relpath(self.out_dir, UPLOAD_FOLDER).replace(os.sep, '/')
+        if os.environ.get('R2_PUBLIC_URL'):
+            uploaded = all(r2_upload(os.path.join(self.out_dir, n), f"{prefix}/{n}", 'video/mp2t', HLS_SEGMENT_CACHE)
+                           for n in self._segments())
+            url = uploaded and r2_upload(self.path, f"{prefix}/{HLS_MANIFEST}", 'application/vnd.apple.mpegurl',
+                                         'public, max-age=86400')
+            if url:
+                gevent.spawn_later(self.size * HLS_SEGMENT_SECONDS + HLS_LOCAL_GRACE,
+                                   shutil.rmtree, self.out_dir, ignore_errors=True)
+                return f"r2:{prefix}/{HLS_MANIFEST}"
+        return f"/uploads/{prefix}/{HLS_MANIFEST}"
+
+    def response(self):
+        self.ready.wait(timeout=RESOLVE_DEADLINE)
+        if self.error or not os.path.exists(self.path):
+            return jsonify({'error': 'Audio unavailable'}), 503
+        prefix = os.path.relpath(self.out_dir, UPLOAD_FOLDER).replace(os.sep, '/')
+        return redirect(f"/uploads/{prefix}/{HLS_MANIFEST}")
 
 def _ytdlp_download(video_id, output_path, cookies_path):
     """Direct yt-dlp download. With cookies, uses the 'web' client; without, falls back to 'ios'."""
@@ -470,15 +2389,11 @@ def _ytdlp_download(video_id, output_path, cookies_path):
         logger.warning(f"yt-dlp ({'cookies' if cookies_path else 'no-cookies'}) failed: {e}")
     return False
 
-def _cobalt_download(video_id, output_path):
-    """
-    cobalt.tools: dedicated download service that handles YouTube bot detection.
-    Returns True and writes mp3 directly to output_path on success.
-    """
-    import requests as req
-    try:
-        resp = req.post(
-            'https://api.cobalt.tools/',
+def _cobalt_stream_url(video_id):
+    """cobalt.tools: dedicated download service that handles YouTube bot detection. Returns an mp3 URL or None."""
+    try:
+        resp = http_post(
+            'https://api.cobalt.tools/', 30,
             json={
                 'url': f'https://www.youtube.com/watch?v={video_id}',
                 'downloadMode': 'audio',
@@ -487,78 +2402,450 @@ def _cobalt_download(video_id, output_path):
             headers={
                 'Accept': 'application/json',
                 'Content-Type': 'application/json',
-                'User-Agent': 'Mozilla/5.0',
             },
-            timeout=30
         )
         if not resp.ok:
             logger.warning(f"cobalt.tools → {resp.status_code}: {resp.text[:200]}")
-            return False
+            return None
         data = resp.json()
         status = data.get('status')
         url = data.get('url')
         if status in ('tunnel', 'redirect', 'stream') and url:
-            with req.get(url, stream=True, timeout=180,
-                         headers={'User-Agent': 'Mozilla/5.0'}) as dl:
-                dl.raise_for_status()
-                with open(output_path, 'wb') as f:
-                    for chunk in dl.iter_content(chunk_size=65536):
-                        f.write(chunk)
             logger.info(f"✅ cobalt.tools → {status}")
-            return True
+            return url
         logger.warning(f"cobalt.tools → unexpected response: {data}")
     except Exception as e:
         logger.warning(f"cobalt.tools failed: {e}")
+    return None
+
+def _cobalt_download(video_id, output_path):
+    """Returns True and writes mp3 directly to output_path on success."""
+    url = _cobalt_stream_url(video_id)
+    if not url:
+        return False
+    try:
+        with http_get(url, 180, stream=True) as dl:
+            dl.raise_for_status()
+            with open(output_path, 'wb') as f:
+                for chunk in dl.iter_content(chunk_size=65536):
+                    f.write(chunk)
+        return True
+    except Exception as e:
+        logger.warning(f"cobalt.tools download failed: {e}")
     return False
 
+def _ytdlp_stream_url(video_id):
+    """Best audio-only stream URL via yt-dlp, without downloading. Returns None on failure."""
+    try:
+        info = _extract_yt_info(f"https://www.youtube.com/watch?v={video_id}", fmt='bestaudio/best')
+        url = info.get('url')
+        if url:
+            logger.info(f"✅ yt-dlp stream → {video_id} ({info.get('ext', '?')}, {info.get('abr', '?')}kbps)")
+        return url
+    except Exception as e:
+        logger.warning(f"yt-dlp stream lookup failed: {e}")
+    return None
+
+def _piped_stream_url(api, timeout, video_id):
+    try:
+        r = http_get(f'{api}/streams/{video_id}', timeout)
+        if not r.ok:
+            logger.warning(f"Piped {api} → {r.status_code}")
+            return None
+        streams = r.json().get('audioStreams', [])
+        if not streams:
+            logger.warning(f"Piped {api} → no audioStreams")
+            return None
+        best = max(streams, key=lambda s: s.get('bitrate', 0))
+        url = best.get('url', '')
+        if url:
+            logger.info(f"✅ Piped {api} ({best.get('mimeType','?')}, {best.get('bitrate',0)}bps)")
+            return url
+    except Exception as e:
+        logger.warning(f"Piped {api} failed: {e}")
+    return None
+
+def _invidious_stream_url(api, timeout, video_id):
+    try:
+        r = http_get(f'{api}/api/v1/videos/{video_id}', timeout)
+        if not r.ok:
+            logger.warning(f"Invidious {api} → {r.status_code}")
+            return None
+        data = r.json()
+        formats = [f for f in data.get('adaptiveFormats', [])
+                   if 'audio' in f.get('type', '')]
+        if not formats:
+            logger.warning(f"Invidious {api} → no audio formats")
+            return None
+        best = max(formats, key=lambda f: int(f.get('bitrate', 0)))
+        url = best.get('url', '')
+        if url:
+            logger.info(f"✅ Invidious {api} ({best.get('type','?')}, {best.get('bitrate',0)}bps)")
+            return url
+    except Exception as e:
+        logger.warning(f"Invidious {api} failed: {e}")
+    return None
+
+# --- Instance health ---
+# Piped/Invidious instances come and go. Each one's record lives in Redis (`health:<api>`) so every
+# worker shares it: success/failure counts, latency EWMA, last success/failure. Instances are tried
+# best-score first. After BREAKER_THRESHOLD consecutive failures the breaker opens and the instance
+# is skipped; once the cooldown passes a single probe is let through (SET NX), and the cooldown
+# doubles each time that probe fails again.
+BREAKER_THRESHOLD = int(os.environ.get('BREAKER_THRESHOLD', 3))
+BREAKER_COOLDOWN = int(os.environ.get('BREAKER_COOLDOWN', 60))
+BREAKER_MAX_COOLDOWN = 1800
+HEALTH_TTL = 7 * 86400
+
+def _health_key(api):
+    return f"health:{api}"
+
+def _health_state(h, now):
+    open_until = float(h.get('open_until') or 0)
+    if not open_until:
+        return 'closed'
+    return 'open' if open_until > now else 'half-open'
+
+def _health_score(h):
+    ok, fail = int(h.get('ok') or 0), int(h.get('fail') or 0)
+    success_rate = (ok + 1) / (ok + fail + 2)  # smoothed so new instances start at 0.5
+    return success_rate / (1 + float(h.get('ewma_ms') or 1000) / 1000)
+
+def _load_health(apis):
+    if not r:
+        return [{} for _ in apis]
+    try:
+        pipe = r.pipeline()
+        for api, _ in apis:
+            pipe.hgetall(_health_key(api))
+        return pipe.execute()
+    except Exception as e:
+        logger.debug(f"Health read failed: {e}")
+        return [{} for _ in apis]
+
+def ranked_instances(apis):
+    """(api, timeout, state) best score first, half-open ones last, open ones left out."""
+    now = time.time()
+    scored = []
+    for (api, timeout), h in zip(apis, _load_health(apis)):
+        state = _health_state(h, now)
+        if state != 'open':
+            scored.append((state == 'half-open', -_health_score(h), api, timeout, state))
+    scored.sort(key=lambda x: (x[0], x[1]))
+    return [(api, timeout, state) for _, _, api, timeout, state in scored]
+
+# One script per result, so workers recording at the same time can't overwrite each other's counts.
+# KEYS: health hash, probe key. ARGV: outcome, ms, now, threshold, cooldown, max cooldown, ttl
+# 'cancelled' is a hedge that lost the race: it says nothing about failure, but its latency was at
+# least `ms`, so a slower EWMA moves up to it. Returns the consecutive failures if the breaker tripped.
+_RECORD_HEALTH = LuaScript("""
+local h, outcome, ms, now = KEYS[1], ARGV[1], tonumber(ARGV[2]), ARGV[3]
+local ewma = tonumber(redis.call('HGET', h, 'ewma_ms'))
+local tripped = 0
+if outcome == 'ok' then
+  redis.call('HINCRBY', h, 'ok', 1)
+  redis.call('HSET', h, 'ewma_ms', math.floor((ewma or ms) * 0.7 + ms * 0.3 + 0.5), 'last_success', now,
+             'consecutive_failures', 0, 'open_until', 0, 'trips', 0)
+elseif outcome == 'fail' then
+  redis.call('HINCRBY', h, 'fail', 1)
+  redis.call('HSET', h, 'last_failure', now)
+  local failures = redis.call('HINCRBY', h, 'consecutive_failures', 1)
+  if failures >= tonumber(ARGV[4]) then
+    local trips = redis.call('HINCRBY', h, 'trips', 1)
+    local cooldown = math.min(tonumber(ARGV[5]) * 2 ^ (trips - 1), tonumber(ARGV[6]))
+    redis.call('HSET', h, 'open_until', string.format('%.3f', tonumber(now) + cooldown))
+    tripped = failures
+  end
+else
+  redis.call('HINCRBY', h, 'cancelled', 1)
+  if ewma and ms > ewma then redis.call('HSET', h, 'ewma_ms', math.floor(ewma * 0.7 + ms * 0.3 + 0.5)) end
+end
+redis.call('DEL', KEYS[2])
+redis.call('EXPIRE', h, ARGV[7])
+return tripped
+""")
+
+def record_instance_result(api, outcome, ms):
+    """outcome: 'ok', 'fail' or 'cancelled'."""
+    if not r: return
+    key = _health_key(api)
+    try:
+        failures = _RECORD_HEALTH([key, f"{key}:probe"], [outcome, round(ms), f"{time.time():.3f}", BREAKER_THRESHOLD,
+                                                          BREAKER_COOLDOWN, BREAKER_MAX_COOLDOWN, HEALTH_TTL])
+        if failures:
+            logger.warning(f"Circuit open for {api} after {failures} failures")
+    except Exception as e:
+        logger.debug(f"Health write failed for {api}: {e}")
+
+def call_instance(api, state, fn, *args):
+    """Run one instance lookup and record how it went, also when a hedge that won elsewhere kills it.
+    A half-open instance only gets one probe at a time."""
+    if state == 'half-open' and r and not r.set(f"{_health_key(api)}:probe", 1, nx=True, ex=60):
+        return None
+    started = time.time()
+    outcome = 'fail'
+    try:
+        result = fn(*args)
+        if result:
+            outcome = 'ok'
+        return result
+    except gevent.GreenletExit:
+        outcome = 'cancelled'
+        raise
+    finally:
+        record_instance_result(api, outcome, (time.time() - started) * 1000)
+
+@app.route('/api/instance-health')
+def instance_health():
+    now = time.time()
+    out = {}
+    for group, apis in (('piped', _PIPED_APIS), ('invidious', _INVIDIOUS_APIS)):
+        out[group] = sorted((
+            {'api': api, 'state': _health_state(h, now), 'score': round(_health_score(h), 4), **h}
+            for (api, _), h in zip(apis, _load_health(apis))
+        ), key=lambda x: -x['score'])
+    return jsonify(out)
+
 def _get_piped_audio(video_id):
     """Return stream URL from a Piped instance, or None."""
-    import requests as req
-    for api, timeout in _PIPED_APIS:
-        try:
-            r = req.get(f'{api}/streams/{video_id}', timeout=timeout,
-                        headers={'User-Agent': 'Mozilla/5.0'})
-            if not r.ok:
-                logger.warning(f"Piped {api} → {r.status_code}")
-                continue
-            streams = r.json().get('audioStreams', [])
-            if not streams:
-                logger.warning(f"Piped {api} → no audioStreams")
-                continue
-            best = max(streams, key=lambda s: s.get('bitrate', 0))
-            url = best.get('url', '')
-            if url:
-                logger.info(f"✅ Piped {api} ({best.get('mimeType','?')}, {best.get('bitrate',0)}bps)")
-                return url
-        except Exception as e:
-            logger.warning(f"Piped {api} failed: {e}")
+    for api, timeout, state in ranked_instances(_PIPED_APIS):
+        url = call_instance(api, state, _piped_stream_url, api, timeout, video_id)
+        if url:
+            return url
     return None
 
 def _get_invidious_audio(video_id):
     """Return stream URL from an Invidious instance, or None."""
-    import requests as req
-    for api, timeout in _INVIDIOUS_APIS:
+    for api, timeout, state in ranked_instances(_INVIDIOUS_APIS):
+        url = call_instance(api, state, _invidious_stream_url, api, timeout, video_id)
+        if url:
+            return url
+    return None
+
+# --- Audio source resolution ---
+# Instead of walking yt-dlp → cobalt → Piped → Invidious one by one (minutes in the worst case),
+# candidates are hedged: the next one starts every RESOLVE_HEDGE_DELAY seconds, or right away when
+# everything in flight has failed. The first stream URL wins and the rest are killed.
+RESOLVE_DEADLINE = float(os.environ.get('RESOLVE_DEADLINE', 20))
+RESOLVE_HEDGE_DELAY = float(os.environ.get('RESOLVE_HEDGE_DELAY', 1.5))
+
+def _audio_source_candidates(video_id):
+    candidates = [('yt-dlp', partial(_ytdlp_stream_url, video_id)), ('cobalt', partial(_cobalt_stream_url, video_id))]
+    candidates += [(f'piped:{api}', partial(call_instance, api, state, _piped_stream_url, api, timeout, video_id))
+                   for api, timeout, state in ranked_instances(_PIPED_APIS)]
+    candidates += [(f'invidious:{api}', partial(call_instance, api, state, _invidious_stream_url, api, timeout, video_id))
+                   for api, timeout, state in ranked_instances(_INVIDIOUS_APIS)]
+    return candidates
+
+def hedged_first(candidates, deadline, delay):
+    """Run (name, fn) candidates with staggered starts; return (name, value) for the first truthy value, or None."""
+    winner = AsyncResult()
+    finished = Event()
+    running, pending = [], list(candidates)
+    end = time.time() + deadline
+
+    def attempt(name, fn):
         try:
-            r = req.get(f'{api}/api/v1/videos/{video_id}', timeout=timeout,
-                        headers={'User-Agent': 'Mozilla/5.0'})
-            if not r.ok:
-                logger.warning(f"Invidious {api} → {r.status_code}")
-                continue
-            data = r.json()
-            formats = [f for f in data.get('adaptiveFormats', [])
-                       if 'audio' in f.get('type', '')]
-            if not formats:
-                logger.warning(f"Invidious {api} → no audio formats")
-                continue
-            best = max(formats, key=lambda f: int(f.get('bitrate', 0)))
-            url = best.get('url', '')
-            if url:
-                logger.info(f"✅ Invidious {api} ({best.get('type','?')}, {best.get('bitrate',0)}bps)")
-                return url
+            value = fn()
+            if value and not winner.ready():
+                winner.set((name, value))
         except Exception as e:
-            logger.warning(f"Invidious {api} failed: {e}")
+            logger.warning(f"Source {name} failed: {e}")
+        finally:
+            finished.set()
+
+    next_start = 0
+    try:
+        while not winner.ready():
+            now = time.time()
+            if now >= end:
+                break
+            running = [g for g in running if not g.dead]
+            # A candidate that finished without winning is as good as a timeout: start the next one now
+            if pending and (not running or now >= next_start or finished.is_set()):
+                finished.clear()
+                name, fn = pending.pop(0)
+                running.append(gevent.spawn(attempt, name, fn))
+                next_start = now + delay
+                continue
+            if not pending and not running:
+                break
+            if not pending:
+                finished.clear()
+            finished.wait(min(end, next_start) - now if pending else end - now)
+    finally:
+        gevent.killall(running, block=False)
+    return winner.get() if winner.ready() else None
+
+def resolve_audio_source(video_id, deadline=None):
+    """{'source', 'url', 'ms'} from whichever backend answers first, or None if none did in time."""
+    started = time.time()
+    result = hedged_first(_audio_source_candidates(video_id), deadline or RESOLVE_DEADLINE, RESOLVE_HEDGE_DELAY)
+    elapsed = int((time.time() - started) * 1000)
+    if not result:
+        logger.warning(f"No audio source for {video_id} within {elapsed}ms")
+        return None
+    source, url = result
+    logger.info(f"🏁 {video_id} resolved by {source} in {elapsed}ms")
+    return {'source': source, 'url': url, 'ms': elapsed}
+
+@app.route('/api/audio-source/<video_id>', methods=['GET', 'OPTIONS'])
+def audio_source(video_id):
+    if request.method == 'OPTIONS': return _build_cors_preflight_response()
+    if not _YT_BARE_ID.match(video_id):
+        return jsonify({'error': 'Invalid video id'}), 400
+    result = resolve_audio_source(video_id)
+    if not result:
+        return jsonify({'error': 'No audio source responded in time'}), 504
+    return jsonify(result)
+
+# --- Live track streams ---
+# /api/stream/<video_id> resolves a source, starts one ingest per video and streams the MP3 to every
+# listener while it is being encoded (or, in HLS mode, redirects to the growing manifest). When the
+# transcode finishes the output goes to R2 (or stays in uploads/) and later requests redirect to it.
+# `ingest:<id>` holds where the output lives, 'r2:<key>' or a path under uploads/. R2 keys are
+# signed per request: a presigned URL stored there would expire before the record does.
+# Workers share uploads/, so a video is ingested by whichever worker claims `ingest:<id>:owner`;
+# listeners that land on another worker meanwhile follow the owner's output on that volume (the
+# growing .part file, or the HLS manifest) instead of resolving the source again.
+INGEST_MAX = int(os.environ.get('INGEST_MAX', 4))
+INGEST_TTL = 7 * 86400
+INGEST_CLAIM_TTL = 900
+INGEST_POLL = 0.25
+_ingests = {}
+_ingests_lock = threading.Lock()
+
+def _ingest_path(video_id):
+    return os.path.join(UPLOAD_FOLDER, secure_filename(f"yt-{video_id}.mp3"))
+
+def _hls_dir(video_id):
+    return os.path.join(UPLOAD_FOLDER, 'hls', secure_filename(video_id))
+
+def _open_shared(path):
+    """The owner's output, growing or finished. The open handle keeps reading the same file when
+    the owner renames it into place or removes it after moving it to R2."""
+    for candidate in (path + '.part', path):
+        try:
+            return open(candidate, 'rb')
+        except FileNotFoundError:
+            pass
     return None
 
+def _follow_shared(video_id, f):
+    """Yield another worker's ingest output as it grows. Once its claim is gone the file is complete."""
+    with f:
+        while True:
+            data = f.read(INGEST_CHUNK)
+            if data:
+                yield data
+            elif r and r.exists(f"ingest:{video_id}:owner"):
+                gevent.sleep(INGEST_POLL)
+            else:
+                while data := f.read(INGEST_CHUNK):
+                    yield data
+                if not (r and r.exists(f"ingest:{video_id}")):
+                    raise RuntimeError(f"ingest of {video_id} failed on its owner")
+                return
+
+def follow_shared_ingest(video_id):
+    """Serve an ingest another worker owns: a redirect once it's published, its HLS manifest, or its
+    MP3 followed as it is written. None if none of those showed up within RESOLVE_DEADLINE or the
+    owner gave up."""
+    end = time.time() + RESOLVE_DEADLINE
+    manifest = os.path.join(_hls_dir(video_id), HLS_MANIFEST)
+    while True:
+        done = r.get(f"ingest:{video_id}")
+        url = done and ingest_playback_url(done)
+        if url:
+            return redirect(url)
+        if INGEST_FORMAT == 'hls':
+            if os.path.exists(manifest):
+                return redirect(f"/uploads/hls/{secure_filename(video_id)}/{HLS_MANIFEST}")
+        else:
+            f = _open_shared(_ingest_path(video_id))
+            if f:
+                return Response(stream_with_context(_follow_shared(video_id, f)), headers=INGEST_HEADERS)
+        if time.time() >= end or not r.exists(f"ingest:{video_id}:owner"):
+            return None
+        gevent.sleep(INGEST_POLL)
+
+def ingest_playback_url(location):
+    """Playback URL for a stored ingest location, or None if it can no longer be served."""
+    if location.startswith('r2:'):
+        return r2_playback_url(location[3:])
+    if 'X-Amz-Signature=' in location:
+        return None  # a presigned URL stored by older builds; it may have expired, so ingest again
+    return location
+
+def _finish_ingest(video_id, ingest):
+    try:
+        ingest.wait()
+        location = ingest.publish()
+        if r:
+            r.set(f"ingest:{video_id}", location, ex=INGEST_TTL)
+        logger.info(f"✅ Ingested {video_id} ({ingest.size} {'segments' if isinstance(ingest, SegmentedIngest) else 'bytes'}) → {location}")
+    except Exception as e:
+        logger.warning(f"Ingest of {video_id} failed: {e}")
+    finally:
+        with _ingests_lock:
+            _ingests.pop(video_id, None)
+        if r:
+            r.delete(f"ingest:{video_id}:owner")
+
+def start_ingest(video_id):
+    """The running ingest for a video, a new one, or None if no source resolved, the budget is spent
+    or another worker is already ingesting it."""
+    with _ingests_lock:
+        pending = _ingests.get(video_id)
+        owner = pending is None
+        if owner:
+            if len(_ingests) >= INGEST_MAX:
+                return None
+            pending = _ingests[video_id] = AsyncResult()  # later callers wait on this while the source resolves
+    if not owner:
+        return pending.get()
+    if r and not r.set(f"ingest:{video_id}:owner", WORKER_ID, nx=True, ex=INGEST_CLAIM_TTL):
+        with _ingests_lock:
+            _ingests.pop(video_id, None)
+        pending.set(None)
+        return None
+    try:
+        source = resolve_audio_source(video_id)
+        if not source:
+            raise LookupError('no source')
+        if INGEST_FORMAT == 'hls':
+            ingest = SegmentedIngest(source['url'], _hls_dir(video_id))
+        else:
+            ingest = StreamingIngest(source['url'], _ingest_path(video_id))
+    except Exception:
+        with _ingests_lock:
+            _ingests.pop(video_id, None)
+        if r:
+            r.delete(f"ingest:{video_id}:owner")
+        pending.set(None)
+        return None
+    pending.set(ingest)
+    gevent.spawn(_finish_ingest, video_id, ingest)
+    return ingest
+
+@app.route('/api/stream/<video_id>', methods=['GET', 'OPTIONS'])
+def stream_track(video_id):
+    if request.method == 'OPTIONS': return _build_cors_preflight_response()
+    if not _YT_BARE_ID.match(video_id):
+        return jsonify({'error': 'Invalid video id'}), 400
+    done = r.get(f"ingest:{video_id}") if r else None
+    url = done and ingest_playback_url(done)
+    if url:
+        return redirect(url)
+    ingest = start_ingest(video_id)
+    if not ingest and r and r.exists(f"ingest:{video_id}:owner"):
+        followed = follow_shared_ingest(video_id)
+        if followed:
+            return followed
+    if not ingest:
+        return jsonify({'error': 'Audio unavailable'}), 503
+    return ingest.response()
+
 def _build_cors_preflight_response():
     response = jsonify({})
     response.headers.add("Access-Control-Allow-Origin", "*")
@@ -575,128 +2862,125 @@ def on_join(data):
     join_room(room)
     
     if not r: return
-    
-    key = f"room:{room}"
-    with r.lock(f"lock:{key}", timeout=5):
-        rd_data = safe_get(key)
-        if not rd_data: return
-        rd = json.loads(rd_data)
-        is_admin = False
-        if not rd.get('admin_uuid'):
-            rd['admin_uuid'] = uuid
-            rd['admin_sid'] = sid
-            is_admin = True
-        elif rd['admin_uuid'] == uuid:
-            rd['admin_sid'] = sid
-            is_admin = True
-        rd['users'][sid] = {'name': username, 'isAdmin': is_admin, 'uuid': uuid}
-        rd['current_state']['serverTime'] = time.time()
-        safe_set(key, json.dumps(rd))
-        r.set(f"sid:{sid}", room, ex=86400)
-        emit('role_update', {'isAdmin': is_admin}, to=sid)
-        emit('load_current_state', rd['current_state'], to=sid)
-        emit('update_user_list', [{'sid': k, **v} for k, v in rd['users'].items()], to=room)
+
+    joined = join_member(room, sid, uuid, username)
+    if not joined: return
+    user, state = joined
+    _local_sids[sid] = room
+    state['serverTime'] = server_now()
+    emit('role_update', {'isAdmin': user['isAdmin']}, to=sid)
+    emit('refresh_playlist', playlist_page(room), to=sid)
+    emit('load_current_state', state, to=sid)
+    emit('update_user_list', user_list(get_room_users(room)), to=sid)
+    note_presence(room, sid, user)
 
 @socketio.on('update_player_state')
 def on_update(data):
     sid = request.sid
     room = data['room_code'].upper()
-    key = f"room:{room}"
-    rd_data = safe_get(key)
-    if not rd_data: return
-    rd = json.loads(rd_data)
-    if rd.get('admin_sid') != sid and not rd['current_state'].get('isCollaborative'): return
-
-    new_state = data['state']
-    if new_state.get('isPlaying') and not rd['current_state']['isPlaying']:
-        if 'startTimestamp' not in new_state: new_state['startTimestamp'] = time.time() + 1.5
-    if new_state.get('isPlaying') is False:
-        new_state['pausedAt'] = new_state.get('currentTime', 0)
-    new_state['serverTime'] = time.time()
-    rd['current_state'].update(new_state)
-    safe_set(key, json.dumps(rd))
-    emit('sync_player_state', rd['current_state'], to=room, include_self=False)
+    result = update_player_state(room, sid, data['state'], data.get('baseVersion'))
+    if not result: return
+    status, state = result
+    if status < 0:
+        # Made against a version someone else has since replaced — send the sender the current one
+        return {'rejected': True, 'state': state}
+    # Play/pause and track changes go out now; seeks and volume are coalesced per room
+    broadcast_state(room, state, skip_sid=sid, immediate=bool(status))
+    if status:
+        schedule_prefetch(room, state)
+    return {'version': state['version']}
+
+@socketio.on('get_playlist')
+def on_get_playlist(data):
+    """Resync path for clients that missed a playlist delta."""
+    room = data['room_code'].upper()
+    if not room_exists(room): return None
+    return playlist_snapshot(room)
 
 @socketio.on('get_server_time')
-def get_server_time(data): return {'serverTime': time.time()}
+def get_server_time(data): return {'serverTime': server_now()}
+
+TIME_SYNC_MAX_BATCH = 16
+
+@socketio.on('time_sync')
+def on_time_sync(data):
+    """NTP-style exchange. Each client send time t0 comes back with our receive (t1) and send (t2)
+    times; a client may batch several t0s into one message. Every sample gets its own stamps: t1
+    when it is taken up, t2 once its reply is ready. Clients burst these on connect, keep the
+    lowest-RTT sample, then resync sparsely."""
+    t1 = server_now()
+    t0s = (data or {}).get('t0') or []
+    if not isinstance(t0s, list):
+        t0s = [t0s]
+    samples = []
+    for t0 in t0s[:TIME_SYNC_MAX_BATCH]:
+        samples.append({'t0': t0, 't1': t1, 't2': server_now()})
+        t1 = server_now()
+    return {'samples': samples}
 
 @socketio.on('toggle_settings')
 def on_toggle(data):
     room = data['room_code'].upper()
-    key = f"room:{room}"
-    rd = json.loads(safe_get(key))
-    rd['current_state']['isCollaborative'] = data['value']
-    safe_set(key, json.dumps(rd))
-    emit('sync_player_state', rd['current_state'], to=room)
+    state = merge_room_state(room, {'isCollaborative': bool(data['value'])}, request.sid)
+    if not state: return
+    broadcast_state(room, state)
 
 @socketio.on('remove_track')
 def on_remove_track(data):
     sid = request.sid
     room = data['room_code'].upper()
-    key = f"room:{room}"
-    with r.lock(f"lock:{key}", timeout=5):
-        rd_data = safe_get(key)
-        if not rd_data: return
-        rd = json.loads(rd_data)
-        if rd.get('admin_sid') != sid and not rd['current_state'].get('isCollaborative'):
-            return
-        idx = data.get('track_index', -1)
-        playlist = rd.get('playlist', [])
-        if idx < 0 or idx >= len(playlist):
-            return
-        playlist.pop(idx)
-        current = rd['current_state'].get('trackIndex', 0)
-        if idx < current:
-            rd['current_state']['trackIndex'] = max(0, current - 1)
-        elif idx == current:
-            rd['current_state']['trackIndex'] = min(current, len(playlist) - 1) if playlist else 0
-            if not playlist:
-                rd['current_state']['isPlaying'] = False
-        rd['playlist'] = playlist
-        safe_set(key, json.dumps(rd))
-        emit('refresh_playlist', rd, to=room)
-        emit('sync_player_state', rd['current_state'], to=room)
+    result = remove_track(room, sid, data.get('track_id'), data.get('track_index'))
+    if not result: return
+    rev, state, idx, track_id = result
+    emit_playlist_delta(room, 'removed', rev, index=idx, id=track_id)
+    broadcast_state(room, state)
+    schedule_prefetch(room, state)
+
+@socketio.on('move_track')
+def on_move_track(data):
+    sid = request.sid
+    room = data['room_code'].upper()
+    track_id = data.get('track_id')
+    if not isinstance(track_id, str): return
+    result = move_track(room, sid, track_id, data.get('to_index', 0))
+    if not result: return
+    rev, from_idx, to_idx, state = result
+    emit_playlist_delta(room, 'moved', rev, id=track_id, index=from_idx, to=to_idx)
+    if state:
+        broadcast_state(room, state)
+        schedule_prefetch(room, state)
 
 @socketio.on('transfer_admin')
 def on_transfer_admin(data):
     sid = request.sid
     room = data['room_code'].upper()
-    key = f"room:{room}"
     new_sid = data.get('new_sid')
-    with r.lock(f"lock:{key}", timeout=5):
-        rd_data = safe_get(key)
-        if not rd_data: return
-        rd = json.loads(rd_data)
-        if rd.get('admin_sid') != sid: return
-        if new_sid not in rd['users']: return
-        new_uuid = rd['users'][new_sid].get('uuid')
-        rd['admin_sid'] = new_sid
-        rd['admin_uuid'] = new_uuid
-        for s, u in rd['users'].items():
-            u['isAdmin'] = (s == new_sid)
-        safe_set(key, json.dumps(rd))
-        emit('role_update', {'isAdmin': False}, to=sid)
-        emit('role_update', {'isAdmin': True}, to=new_sid)
-        emit('admin_transferred', {'new_admin_uuid': new_uuid}, to=room)
-        emit('update_user_list', [{'sid': k, **v} for k, v in rd['users'].items()], to=room)
+    if not isinstance(new_sid, str): return
+    result = transfer_admin(room, sid, new_sid)
+    if not result: return
+    new_uuid, users = result
+    emit('role_update', {'isAdmin': False}, to=sid)
+    emit('role_update', {'isAdmin': True}, to=new_sid)
+    emit('admin_transferred', {'new_admin_uuid': new_uuid}, to=room)
+    emit('update_user_list', user_list(users), to=room)
 
 @socketio.on('disconnect')
 def on_disconnect():
     sid = request.sid
+    _local_sids.pop(sid, None)
     if not r: return
     room = r.get(f"sid:{sid}")
     if not room: return
     r.delete(f"sid:{sid}")
-    key = f"room:{room}"
     try:
-        with r.lock(f"lock:{key}", timeout=5):
-            data = safe_get(key)
-            if data:
-                rd = json.loads(data)
-                if sid in rd['users']:
-                    del rd['users'][sid]
-                    safe_set(key, json.dumps(rd))
-                    emit('update_user_list', [{'sid': k, **v} for k, v in rd['users'].items()], to=room)
+        # HDEL is atomic, so leaving doesn't need the room lock
+        removed, remaining = remove_room_users(room, sid)
+        if not removed:
+            return
+        if remaining:
+            note_presence(room, sid)
+        elif release_if_empty(room):
+            logger.info(f"Room {room} is empty, expiring in {ROOM_EMPTY_GRACE}s")
     except: pass
 
 @app.route('/api/lyrics', methods=['GET', 'OPTIONS'])
@@ -706,44 +2990,38 @@ def get_lyrics():
     artist = request.args.get('artist', '')
     if not title:
         return jsonify({'lrc': None})
-    try:
-        import requests as req
-        resp = req.get(
-            'https://lrclib.net/api/get',
-            params={'track_name': title, 'artist_name': artist},
-            timeout=5
-        )
-        if resp.ok:
-            d = resp.json()
-            return jsonify({'lrc': d.get('syncedLyrics') or d.get('plainLyrics')})
-    except Exception as e:
-        logger.warning(f"Lyrics fetch failed: {e}")
-    return jsonify({'lrc': None})
+    lrc = fetch_lyrics(title, artist)
+    return jsonify({'lrc': lrc, 'lyricsId': store_lyrics(lrc), 'lyrics': parse_lrc(lrc) if lrc else None})
+
+@app.route('/api/lyrics/<lyrics_id>', methods=['GET', 'OPTIONS'])
+def get_lyrics_by_id(lyrics_id):
+    if request.method == 'OPTIONS': return _build_cors_preflight_response()
+    doc = get_lyrics_doc(lyrics_id) if _LYRICS_ID.match(lyrics_id) else None
+    if doc is None:
+        return jsonify({'error': 'Not Found'}), 404
+    resp = jsonify(doc)
+    # Content-addressed, so a given id never changes
+    resp.headers['Cache-Control'] = 'public, max-age=86400, immutable'
+    return resp
 
 @app.route('/api/yt-info', methods=['POST', 'OPTIONS'])
 def yt_info():
     if request.method == 'OPTIONS': return _build_cors_preflight_response()
     url = request.json.get('url', '')
     try:
-        cookies_path = _get_cookies_path()
-        opts = {
-            'quiet': True, 'skip_download': True, 'nocheckcertificate': True,
-            'extractor_args': {'youtube': {'player_client': ['tv'] if cookies_path else ['ios']}},
-        }
-        if cookies_path:
-            opts['cookiefile'] = cookies_path
-        with yt_dlp.YoutubeDL(opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            return jsonify({
-                'id': info.get('id'),
-                'title': info.get('title'),
-                'artist': info.get('uploader', 'Unknown').replace(' - Topic', ''),
-                'thumbnail': info.get('thumbnail'),
-                'duration': info.get('duration'),
-            })
+        vid = parse_video_id(url)
+        return jsonify(get_yt_meta(vid) if vid else _store_yt_meta(_extract_yt_info(url)))
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/yt-info/bulk', methods=['POST', 'OPTIONS'])
+def yt_info_bulk():
+    if request.method == 'OPTIONS': return _build_cors_preflight_response()
+    ids = [v for v in (request.json.get('ids') or []) if isinstance(v, str) and _YT_BARE_ID.match(v)]
+    if len(ids) > YT_BULK_MAX:
+        return jsonify({'error': f'At most {YT_BULK_MAX} ids per request'}), 400
+    return jsonify({'results': get_yt_meta_bulk(ids)})
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
     socketio.run(app, host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,56 @@
+# bench_room_codec.py - Encode/decode time and stored size of a room under each ROOM_CODEC
+#
+#   python bench_room_codec.py
+#
+# Encodes a room the way _write_room stores it (state, one value per user, one per track) and
+# decodes it back the way load_room does. No Redis needed. Codecs whose package isn't installed
+# (orjson for fastjson, msgpack) are skipped.
+import time
+
+import app
+
+ROUNDS = 20
+SIZES = (10, 100, 1000)
+
+def _fake_room(n_tracks):
+    tracks = [{
+        'id': f"{i:012x}", 'name': f"Track {i}", 'artist': f"Artist {i}", 'audioUrl': None,
+        'albumArt': f"https://i.ytimg.com/vi/{i:011d}/hqdefault.jpg", 'lyricsId': f"{i:016x}",
+        'videoId': f"{i:011d}", 'duration': 210,
+    } for i in range(n_tracks)]
+    users = [{'name': f"user{i}", 'isAdmin': i == 0, 'uuid': f"uuid-{i:08d}"} for i in range(20)]
+    state = {
+        'isPlaying': True, 'trackIndex': 0, 'volume': 80, 'startTimestamp': time.time(), 'pausedAt': 0,
+        'isCollaborative': False, 'serverTime': time.time(), 'version': 42, 'updatedBy': 'x' * 20,
+    }
+    return [state, *users, *tracks]
+
+def measure(codec, parts):
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        encoded = [codec.dumps(p) for p in parts]
+    encode_ms = (time.perf_counter() - started) / ROUNDS * 1000
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        decoded = [codec.loads(e) for e in encoded]
+    decode_ms = (time.perf_counter() - started) / ROUNDS * 1000
+    assert decoded == parts == [app.decode_room_value(e) for e in encoded]
+    size = sum(len(e.encode('utf-8', 'surrogateescape')) for e in encoded)
+    return encode_ms, decode_ms, size
+
+def main():
+    codecs = []
+    for cls in (app.JSONCodec, app.FastJSONCodec, app.MsgpackCodec):
+        try:
+            codecs.append(cls())
+        except ImportError as e:
+            print(f"skipping {cls.name}: {e}")
+    print(f"{'tracks':>6} {'codec':>9} | {'encode ms':>9} {'decode ms':>9} | {'bytes':>9}")
+    for n in SIZES:
+        parts = _fake_room(n)
+        for codec in codecs:
+            encode_ms, decode_ms, size = measure(codec, parts)
+            print(f"{n:>6} {codec.name:>9} | {encode_ms:>9.2f} {decode_ms:>9.2f} | {size:>9}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# bench_room_contention.py - N concurrent clients updating one room: lock + read/modify/write vs Lua script
+#
+#   REDIS_URL=redis://localhost:6379 python bench_room_contention.py
+#
+# Each client writes its own field of current_state OPS times. A mutation path that loses writes
+# ends with some clients' last value missing; one that serializes badly shows up in the latencies.
+#   unlocked  load_room_core + SET of the state, no lock (how update_player_state used to work)
+#   locked    the same inside r.lock(...) (how join/remove/transfer/add used to work)
+#   script    app.merge_room_state - one atomic script call per update (update_player_state runs the
+#             same way but only takes player fields, so it can't carry a field per client)
+import os, time
+import gevent
+import redis
+
+import app
+
+OPS = 50
+CLIENTS = (1, 10, 50)
+
+def unlocked_update(code, sid, fields):
+    meta, state = app.load_room_core(code)
+    state.update(fields)
+    pipe = app.r.pipeline()
+    pipe.set(app.room_key(code, 'state'), app.encode_room_value(state))
+    pipe.hincrby(app.room_key(code, 'meta'), 'cache_rev', 1)
+    *_, rev = pipe.execute()
+    app.r.publish(app.ROOM_CHANGED_CHANNEL, f"{code} {rev}")
+    app.forget_room(code)
+
+def locked_update(code, sid, fields):
+    with app.r.lock(f"lock:room:{code}", timeout=5, blocking_timeout=30):
+        unlocked_update(code, sid, fields)
+
+def script_update(code, sid, fields):
+    app.merge_room_state(code, fields)
+
+def _fresh_room(code):
+    app.r.delete(*app._room_keys(code))
+    app.create_room(code, {
+        'title': 'Bench', 'users': {}, 'playlist': [],
+        'current_state': {'isPlaying': True, 'trackIndex': 0, 'isCollaborative': True, 'serverTime': time.time()},
+    })
+
+def run(fn, n_clients):
+    code = f"BENCHC{n_clients}"
+    _fresh_room(code)
+    latencies = []
+
+    def client(i):
+        for op in range(OPS):
+            started = time.perf_counter()
+            fn(code, f"sid{i}", {f"c{i}": op})
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    gevent.joinall([gevent.spawn(client, i) for i in range(n_clients)], raise_error=True)
+    elapsed = time.perf_counter() - started
+    _, state = app.load_room_core(code)
+    lost = sum(1 for i in range(n_clients) if state.get(f"c{i}") != OPS - 1)
+    app.r.delete(*app._room_keys(code))
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return len(latencies) / elapsed, pct(0.5), pct(0.99), lost
+
+def main():
+    app.r = redis.Redis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379'),
+                                decode_responses=True, encoding_errors='surrogateescape')
+    print(f"{'clients':>7} {'mode':>9} | {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>8} | {'lost':>9}")
+    for n in CLIENTS:
+        for name, fn in (('unlocked', unlocked_update), ('locked', locked_update), ('script', script_update)):
+            throughput, p50, p99, lost = run(fn, n)
+            print(f"{n:>7} {name:>9} | {throughput:>8.0f} {p50:>8.2f} {p99:>8.2f} | {lost:>4}/{n:<4}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# bench_room_storage.py - Bytes moved per update_player_state: legacy room blob vs split room keys
+#
+#   REDIS_URL=redis://localhost:6379 python bench_room_storage.py
+#
+# Counts request bytes sent to Redis and payload bytes read back per player update, for rooms of
+# increasing playlist size: the legacy blob read/modify/write against app.update_player_state.
+import os, json, time
+import redis
+
+import app
+
+ROUNDS = 50
+SIZES = (10, 100, 300)
+
+class CountingConnection(redis.Connection):
+    sent = 0
+    received = 0
+
+    def send_packed_command(self, command, check_health=True):
+        chunks = [command] if isinstance(command, (bytes, bytearray, memoryview)) else command
+        CountingConnection.sent += sum(len(c) for c in chunks)
+        return super().send_packed_command(command, check_health)
+
+    def read_response(self, *args, **kwargs):
+        resp = super().read_response(*args, **kwargs)
+        CountingConnection.received += _payload_size(resp)
+        return resp
+
+def _payload_size(resp):
+    if isinstance(resp, (list, tuple)):
+        return sum(_payload_size(x) for x in resp)
+    if isinstance(resp, (str, bytes)):
+        return len(resp)
+    return 8
+
+def _reset():
+    CountingConnection.sent = CountingConnection.received = 0
+
+def _fake_track(i):
+    lrc = '\n'.join(f"[{m:02d}:{s:02d}.00] line {m}-{s} of the song lyrics go here" for m in range(3) for s in range(0, 60, 3))
+    return {
+        'name': f"Track {i}", 'artist': f"Artist {i}", 'audioUrl': None,
+        'albumArt': f"https://i.ytimg.com/vi/{i:011d}/hqdefault.jpg",
+        'lyrics': lrc, 'videoId': f"{i:011d}", 'duration': 210,
+    }
+
+def _fake_room(n_tracks):
+    return {
+        'playlist': [_fake_track(i) for i in range(n_tracks)], 'title': "Sonic Space",
+        'users': {f"sid{i}": {'name': f"user{i}", 'isAdmin': i == 0, 'uuid': f"uuid{i}"} for i in range(20)},
+        'admin_uuid': 'uuid0', 'admin_sid': 'sid0',
+        'current_state': {
+            'isPlaying': True, 'trackIndex': 0, 'volume': 80,
+            'startTimestamp': time.time(), 'pausedAt': 0, 'isCollaborative': False, 'serverTime': time.time()
+        }
+    }
+
+def legacy_update(code, new_state):
+    key = f"room:{code}"
+    rd = json.loads(app.r.get(key))
+    rd['current_state'].update(new_state)
+    app.r.set(key, json.dumps(rd), ex=86400)
+
+def split_update(code, new_state):
+    app.update_player_state(code, 'sid0', new_state)
+
+def measure(fn, code):
+    _reset()
+    for i in range(ROUNDS):
+        fn(code, {'isPlaying': True, 'startTimestamp': time.time() - i, 'serverTime': time.time()})
+    return CountingConnection.sent / ROUNDS, CountingConnection.received / ROUNDS
+
+def main():
+    pool = redis.ConnectionPool.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379'),
+                                         connection_class=CountingConnection, decode_responses=True,
+                                         encoding_errors='surrogateescape')
+    app.r = redis.Redis(connection_pool=pool)
+    print(f"{'tracks':>6} | {'legacy sent':>12} {'legacy recv':>12} | {'split sent':>10} {'split recv':>10} | {'ratio':>7}")
+    for n in SIZES:
+        legacy_code, split_code = f"BENCHL{n}", f"BENCHS{n}"
+        rd = _fake_room(n)
+        app.r.set(f"room:{legacy_code}", json.dumps(rd), ex=600)
+        app.create_room(split_code, rd)
+        try:
+            l_sent, l_recv = measure(legacy_update, legacy_code)
+            s_sent, s_recv = measure(split_update, split_code)
+            ratio = (l_sent + l_recv) / max(1, s_sent + s_recv)
+            print(f"{n:>6} | {l_sent:>12.0f} {l_recv:>12.0f} | {s_sent:>10.0f} {s_recv:>10.0f} | {ratio:>6.0f}x")
+        finally:
+            app.r.delete(f"room:{legacy_code}", *app._room_keys(split_code))
+
+if __name__ == '__main__':
+    main()
@@ -3,44 +3,66 @@ import { useEffect, useState, useRef } from 'react';
 import { useRoomStore } from '@/lib/room-store';
 import { motion } from 'framer-motion';
 
-// Helper to parse LRC format: [00:12.50] Hello World -> { time: 12.5, text: "Hello World" }
-const parseLRC = (lrc: string) => {
+const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5001';
+
+// Server-parsed lyrics: parallel arrays of offsets (ms, ascending) and lines.
+type LyricsDoc = { synced: boolean; t: number[]; l: string[] };
+
+// Older tracks still carry raw LRC text: [00:12.50] Hello World -> t: 12500, l: "Hello World"
+const parseLRC = (lrc: string): LyricsDoc => {
     const regex = /^\[(\d{2}):(\d{2}(?:\.\d+)?)\](.*)/;
-    const lines = lrc.split('\n');
-    const result = [];
-    for (const line of lines) {
+    const timed: [number, string][] = [];
+    for (const line of lrc.split('\n')) {
         const match = line.match(regex);
         if (match) {
-            const min = parseInt(match[1]);
-            const sec = parseFloat(match[2]);
             const text = match[3].trim();
-            if (text) result.push({ time: min * 60 + sec, text });
+            if (text) timed.push([(parseInt(match[1]) * 60 + parseFloat(match[2])) * 1000, text]);
         }
     }
-    return result;
+    return { synced: timed.length > 0, t: timed.map(x => x[0]), l: timed.map(x => x[1]) };
+};
+
+// Index of the last line starting at or before `ms`, or -1 before the first line.
+const findLine = (t: number[], ms: number) => {
+    let lo = 0, hi = t.length - 1, found = -1;
+    while (lo <= hi) {
+        const mid = (lo + hi) >> 1;
+        if (t[mid] <= ms) { found = mid; lo = mid + 1; } else { hi = mid - 1; }
+    }
+    return found;
+};
+
+const fetchLyrics = async (track: { lyricsId?: string | null; name: string; artist: string }): Promise<LyricsDoc | null> => {
+    const res = await fetch(`${API_URL}/api/lyrics/${track.lyricsId}`);
+    if (res.ok) return res.json();
+    // Doc expired server-side — resolve again by title/artist
+    const params = new URLSearchParams({ title: track.name, artist: track.artist });
+    const fallback = await fetch(`${API_URL}/api/lyrics?${params}`);
+    return fallback.ok ? (await fallback.json()).lyrics : null;
 };
 
 export default function Lyrics() {
     const { playlist, currentTrackIndex, currentTime } = useRoomStore();
     const currentTrack = playlist[currentTrackIndex];
-    const [lines, setLines] = useState<{time: number, text: string}[]>([]);
+    const [doc, setDoc] = useState<LyricsDoc | null>(null);
     const [activeLine, setActiveLine] = useState(0);
     const scrollRef = useRef<HTMLDivElement>(null);
+    const lines = doc?.synced ? doc.l : [];
 
     useEffect(() => {
-        if (currentTrack?.lyrics) {
-            setLines(parseLRC(currentTrack.lyrics));
-        } else {
-            setLines([]);
+        setDoc(null);
+        if (!currentTrack) return;
+        if (currentTrack.lyricsId) {
+            let cancelled = false;
+            fetchLyrics(currentTrack).then(d => { if (!cancelled) setDoc(d); }).catch(() => {});
+            return () => { cancelled = true; };
         }
-    }, [currentTrack]);
+        if (currentTrack.lyrics) setDoc(parseLRC(currentTrack.lyrics));
+    }, [currentTrack?.lyricsId, currentTrack?.lyrics]);
 
     useEffect(() => {
-        // Find current active line
-        const index = lines.findIndex((line, i) => {
-            const nextLine = lines[i + 1];
-            return currentTime >= line.time && (!nextLine || currentTime < nextLine.time);
-        });
+        if (!doc?.synced) return;
+        const index = findLine(doc.t, currentTime * 1000);
         if (index !== -1) {
             setActiveLine(index);
             // Auto scroll
@@ -51,9 +73,9 @@ export default function Lyrics() {
                 }
             }
         }
-    }, [currentTime, lines]);
+    }, [currentTime, doc]);
 
-    if (!currentTrack?.lyrics || lines.length === 0) return (
+    if (lines.length === 0) return (
         <div className="h-full flex items-center justify-center text-gray-500/50 text-2xl font-bold tracking-widest uppercase select-none">
             No Lyrics
         </div>
@@ -74,7 +96,7 @@ export default function Lyrics() {
                         }}
                         className="text-xl md:text-3xl font-bold transition-all duration-300"
                     >
-                        {line.text}
+                        {line}
                     </motion.p>
                 ))}
             </div>
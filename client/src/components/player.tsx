@@ -27,7 +27,7 @@ export default function Player({
     
     const {
         currentTime, isAdmin, isSeeking, setIsSeeking, _emitStateUpdate,
-        player, statusMessage, clockOffset, lastSyncTime,
+        player, statusMessage, clockOffset, isDisconnected,
         repeatMode, isShuffle, toggleRepeat, toggleShuffle,
     } = useRoomStore();
     
@@ -55,14 +55,9 @@ export default function Player({
             return;
         }
 
-        const driftCheck = setInterval(() => {
-            const timeSinceLastSync = Date.now() - lastSyncTime;
-            if (timeSinceLastSync > 6000) setDriftWarning('Syncing...');
-            else setDriftWarning(null);
-        }, 500);
-
-        return () => clearInterval(driftCheck);
-    }, [isPlaying, player, lastSyncTime]);
+        // Clock resyncs are sparse now, so their age says nothing — the socket being down does
+        setDriftWarning(isDisconnected ? 'Syncing...' : null);
+    }, [isPlaying, player, isDisconnected]);
 
     const handleSeekEnd = (e: React.MouseEvent<HTMLInputElement>) => {
         if (!isAdmin || !player) return;
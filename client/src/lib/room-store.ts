@@ -9,9 +9,11 @@ if (!API_URL) {
 }
 
 export interface Song {
-    name: string; artist: string; isUpload?: boolean;
-    audioUrl: string | null; albumArt: string | null; lyrics?: string | null;
+    id?: string; name: string; artist: string; isUpload?: boolean;
+    audioUrl: string | null; albumArt: string | null; lyricsId?: string | null;
+    lyrics?: string | null;  // raw LRC on tracks added before lyricsId existed
     videoId?: string | null; duration?: number | null;
+    audioKey?: string | null;  // R2 object key; the server signs audioUrl from it on every read
 }
 
 interface AudioNodes {
@@ -27,7 +29,10 @@ interface RoomState {
     player: PlayerController | null;
     audioElement: HTMLAudioElement | null;  // kept for Web Audio EQ routing on upload tracks
     playlist: Song[]; 
-    currentTrackIndex: number; 
+    playlistRev: number;
+    playlistOffset: number;        // position of playlist[0] in the room's playlist; > 0 only while the rest pages in
+    stateVersion: number;          // version of the last player state applied
+    currentTrackIndex: number;     // into `playlist`; add playlistOffset for the server's trackIndex
     isPlaying: boolean; 
     roomCode: string; 
     playlistTitle: string; 
@@ -58,6 +63,7 @@ interface RoomState {
     initPlayer: (container: HTMLElement) => void;
     primePlayer: () => void;
     setRoomData: (data: any) => void;
+    applyPlaylistPage: (page: any) => void;
     setLoading: (l: boolean) => void;
     setError: (e: string | null) => void;
     setNeedsInteraction: (n: boolean) => void;
@@ -71,6 +77,7 @@ interface RoomState {
     setVolume: (v: number) => void;
     selectTrack: (index: number) => void;
     removeTrack: (index: number) => void;
+    moveTrack: (index: number, to: number) => void;
     toggleRepeat: () => void;
     toggleShuffle: () => void;
     uploadFile: (file: File, title?: string, artist?: string) => Promise<any>;
@@ -89,17 +96,72 @@ const getUserId = () => {
     return id;
 };
 
+// Direct-to-R2: the server only signs the PUT, the file never passes through it.
+// Resolves null when the server has no R2 configured, so the caller falls back to /api/upload-local.
+// The R2 key goes into the track: a presigned playback URL expires, the server re-signs the key per read.
+interface Uploaded { audioUrl: string; key?: string }
+
+const uploadDirect = async (file: File): Promise<Uploaded | null> => {
+    const res = await fetch(`${API_URL}/api/upload-url`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, contentType: file.type || 'audio/mpeg', size: file.size })
+    });
+    if (res.status === 501) return null;
+    if (!res.ok) throw new Error('Upload failed');
+    const { uploadUrl, key, headers } = await res.json();
+    const put = await fetch(uploadUrl, { method: 'PUT', headers, body: file });
+    if (!put.ok) throw new Error('Upload failed');
+    const done = await fetch(`${API_URL}/api/upload-complete`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ key })
+    });
+    if (!done.ok) throw new Error('Upload failed');
+    return done.json();
+};
+
+const uploadViaServer = async (file: File): Promise<Uploaded> => {
+    const fd = new FormData(); fd.append('file', file);
+    const res = await fetch(`${API_URL}/api/upload-local`, { method: 'POST', body: fd });
+    if (!res.ok) throw new Error('Upload failed');
+    return res.json();
+};
+
+// Playlist pages: the room endpoint and join send the current track with a window around it, and
+// a cursor (before/after) for each side still missing. That window is shown straight away (with its
+// offset) and the rest is fetched page by page and swapped in once complete; a newer load supersedes
+// one still running.
+const PLAYLIST_PAGE_LIMIT = 200;
+let playlistLoad = 0;
+let playlistLoading = false;
+let playlistRevSeen = 0;             // newest delta rev that arrived while a load was running
+
+const fetchPlaylistPage = async (code: string, cursor: string) => {
+    const res = await fetch(`${API_URL}/api/room/${code}?cursor=${encodeURIComponent(cursor)}&limit=${PLAYLIST_PAGE_LIMIT}`);
+    if (!res.ok) throw new Error('Playlist page failed');
+    return res.json();
+};
+
 // --- Sync Engine Globals ---
+const TIME_SYNC_BURST = 8;            // samples on connect / after the offset jumps
+const TIME_SYNC_RESYNC_SAMPLES = 3;
+const TIME_SYNC_MIN_MS = 10_000;
+const TIME_SYNC_MAX_MS = 300_000;
+const TIME_SYNC_STABLE_MS = 5;        // offset moved less than this → back off further
+const TIME_SYNC_JUMP_MS = 50;         // moved more than this → full burst next time
+const TIME_SYNC_TIMEOUT_MS = 3000;
 let syncInterval: NodeJS.Timeout | null = null;
-let ntpInterval: NodeJS.Timeout | null = null;
+let ntpTimer: NodeJS.Timeout | null = null;
 let lastKnownServerStart: number | null = null;
 let isActuallyPlaying = false;
+let applyServerState: ((state: any) => void) | null = null;
 
 export const useRoomStore = createWithEqualityFn<RoomState>()((set, get) => ({
     socket: null,
     player: null,
     audioElement: null,
-    playlist: [], currentTrackIndex: 0, isPlaying: false, 
+    playlist: [], playlistRev: 0, playlistOffset: 0, stateVersion: 0, currentTrackIndex: 0, isPlaying: false, 
     roomCode: '', playlistTitle: '', users: [], username: '',
     isAdmin: false, volume: 80, isLoading: false, 
     currentTime: 0, duration: 0, statusMessage: null,
@@ -122,7 +184,8 @@ export const useRoomStore = createWithEqualityFn<RoomState>()((set, get) => ({
 
     connect: (code, name) => {
         if (get().socket) return;
-        set({ username: name, roomCode: code });
+        // Versions and revs are per room: start from nothing so the new room's (maybe lower) ones apply
+        set({ username: name, roomCode: code, stateVersion: 0, playlistRev: 0, playlistOffset: 0 });
         
         console.log(`Connecting to socket at: ${API_URL}`);
         
@@ -133,28 +196,47 @@ export const useRoomStore = createWithEqualityFn<RoomState>()((set, get) => ({
         });
         set({ socket });
 
-        // 1. NTP Logic
-        const syncClock = () => {
-            const start = Date.now();
-            socket.emit('get_server_time', {}, (data: any) => {
-                const end = Date.now();
-                const latency = (end - start) / 2; 
-                const preciseServerTime = (data.serverTime * 1000);
-                const offset = preciseServerTime - (end - latency);
-                
-                const current = get().clockOffset;
-                set({ 
-                    clockOffset: current === 0 ? offset : (current * 0.8 + offset * 0.2),
-                    lastSyncTime: Date.now() // Update sync time on heartbeat
-                });
+        // 1. Clock sync: a burst of pings on connect, keeping the lowest-RTT sample (the one least
+        // distorted by queuing), then sparse resyncs that back off while the offset holds steady
+        // and go back to a full burst if it moves.
+        const ping = () => new Promise<{ offset: number; rtt: number } | null>((resolve) => {
+            const t0 = Date.now();
+            socket.timeout(TIME_SYNC_TIMEOUT_MS).emit('time_sync', { t0: [t0] }, (err: any, res: any) => {
+                const t3 = Date.now();
+                const sample = res?.samples?.[0];
+                if (err || !sample) return resolve(null);
+                const t1 = sample.t1 * 1000, t2 = sample.t2 * 1000;
+                resolve({ offset: ((t1 - t0) + (t2 - t3)) / 2, rtt: (t3 - t0) - (t2 - t1) });
             });
+        });
+        const syncClock = async (samples: number, delay: number) => {
+            let best: { offset: number; rtt: number } | null = null;
+            for (let i = 0; i < samples; i++) {
+                const s = await ping();
+                if (s && (!best || s.rtt < best.rtt)) best = s;
+            }
+            let nextSamples = TIME_SYNC_RESYNC_SAMPLES;
+            if (best) {
+                const moved = Math.abs(best.offset - get().clockOffset);
+                set({ clockOffset: best.offset, lastSyncTime: Date.now() });
+                if (samples === TIME_SYNC_BURST || moved < TIME_SYNC_STABLE_MS) {
+                    delay = Math.min(delay * 2, TIME_SYNC_MAX_MS);
+                } else {
+                    delay = TIME_SYNC_MIN_MS;
+                    if (moved > TIME_SYNC_JUMP_MS) nextSamples = TIME_SYNC_BURST;
+                }
+            } else {
+                delay = TIME_SYNC_MIN_MS;
+            }
+            if (ntpTimer) clearTimeout(ntpTimer);
+            if (socket.connected) ntpTimer = setTimeout(() => syncClock(nextSamples, delay), delay);
         };
 
         socket.on('connect', () => {
             socket.emit('join_room', { room_code: code, username: name, uuid: get().userId });
             set({ isDisconnected: false });
-            syncClock(); 
-            ntpInterval = setInterval(syncClock, 5000); 
+            if (ntpTimer) clearTimeout(ntpTimer);
+            syncClock(TIME_SYNC_BURST, TIME_SYNC_MIN_MS / 2);
             
             if (syncInterval) clearInterval(syncInterval);
             syncInterval = setInterval(get().syncLoop, 200); 
@@ -163,6 +245,11 @@ export const useRoomStore = createWithEqualityFn<RoomState>()((set, get) => ({
         const handleState = (state: any) => {
             const { player, currentTrackIndex } = get();
 
+            // Versions only grow, so anything older than what we've applied arrived out of order
+            if (typeof state.version === 'number') {
+                if (state.version < get().stateVersion) return;
+                set({ stateVersion: state.version });
+            }
             set({ lastSyncTime: Date.now() });
             if (!player) return;
 
@@ -170,10 +257,13 @@ export const useRoomStore = createWithEqualityFn<RoomState>()((set, get) => ({
 
             if (state.trackIndex !== undefined) {
                 const freshPlaylist = get().playlist;
-                const track = freshPlaylist[state.trackIndex];
+                // The id is authoritative; the index only if we don't have that track (yet)
+                const byId = state.trackId ? freshPlaylist.findIndex(t => t.id === state.trackId) : -1;
+                const trackIndex = byId >= 0 ? byId : state.trackIndex - get().playlistOffset;
+                const track = freshPlaylist[trackIndex];
                 const sourceMissing = player.activeSource === 'none';
-                if (state.trackIndex !== currentTrackIndex || sourceMissing) {
-                    set({ currentTrackIndex: state.trackIndex });
+                if (trackIndex !== currentTrackIndex || sourceMissing) {
+                    set({ currentTrackIndex: trackIndex });
                     if (track) player.loadTrack(track);
                     get().updateMediaSession();
                 }
@@ -200,18 +290,43 @@ export const useRoomStore = createWithEqualityFn<RoomState>()((set, get) => ({
             }
         };
 
+        applyServerState = handleState;
         socket.on('sync_player_state', handleState);
         socket.on('load_current_state', handleState);
-        socket.on('refresh_playlist', (d) => {
-            set({ playlist: d.playlist, playlistTitle: d.title });
+        // Playlist sync: a page on join (the rest is paged in), a full snapshot on resync, then
+        // revisioned deltas. Any delta that isn't exactly rev+1 means we missed something → resync.
+        const applySnapshot = (d: any) => {
+            if (!d) return;
+            get().applyPlaylistPage(d);
             if (d.current_state) handleState(d.current_state);
-        });
+        };
+        const resyncPlaylist = () => socket.emit('get_playlist', { room_code: code }, applySnapshot);
+        const applyDelta = (d: any, mutate: (p: Song[]) => void) => {
+            if (playlistLoading) { playlistRevSeen = Math.max(playlistRevSeen, d.rev); return; }
+            if (d.rev <= get().playlistRev) return;
+            if (d.rev !== get().playlistRev + 1) { resyncPlaylist(); return; }
+            const playlist = [...get().playlist];
+            mutate(playlist);
+            set({ playlist, playlistRev: d.rev });
+        };
+        socket.on('refresh_playlist', applySnapshot);
+        socket.on('playlist_track_added', (d) => applyDelta(d, p => p.splice(d.index, 0, d.track)));
+        socket.on('playlist_track_removed', (d) => applyDelta(d, p => {
+            const at = d.id ? p.findIndex(t => t.id === d.id) : -1;
+            p.splice(at >= 0 ? at : d.index, 1);
+        }));
+        socket.on('playlist_track_moved', (d) => applyDelta(d, p => { p.splice(d.to, 0, ...p.splice(d.index, 1)); }));
+        socket.on('playlist_track_updated', (d) => applyDelta(d, p => { p[d.index] = { ...p[d.index], ...d.track }; }));
         socket.on('status_update', (d) => {
             set({ statusMessage: d.message });
             if(d.error) setTimeout(() => set({ statusMessage: null }), 3000);
         });
         socket.on('role_update', (d) => set({ isAdmin: d.isAdmin }));
         socket.on('update_user_list', (u) => set({ users: u }));
+        socket.on('user_list_delta', (d: { joined: any[]; left: string[] }) => {
+            const gone = new Set([...d.left, ...d.joined.map(u => u.sid)]);
+            set({ users: [...get().users.filter(u => !gone.has(u.sid)), ...d.joined] });
+        });
         socket.on('disconnect', () => set({ isDisconnected: true }));
         socket.on('admin_transferred', (d) => {
             if (d.new_admin_uuid === get().userId) set({ isAdmin: true });
@@ -220,20 +335,24 @@ export const useRoomStore = createWithEqualityFn<RoomState>()((set, get) => ({
     },
 
     disconnect: () => {
+        playlistLoad++;  // drop whatever page load is still running
+        playlistLoading = false;
         get().socket?.disconnect();
         get().player?.pause();
         if (syncInterval) clearInterval(syncInterval);
-        if (ntpInterval) clearInterval(ntpInterval);
-        set({ socket: null });
+        if (ntpTimer) clearTimeout(ntpTimer);
+        set({ socket: null, stateVersion: 0, playlistRev: 0, playlistOffset: 0 });
     },
 
     setRoomData: (data) => {
         if (data.serverTime) {
             const offset = (data.serverTime * 1000) - Date.now();
-            set({ clockOffset: offset, playlistTitle: data.title, playlist: data.playlist, lastSyncTime: Date.now() });
+            set({ clockOffset: offset, lastSyncTime: Date.now() });
         }
+        get().applyPlaylistPage(data);
         if (data.current_state) {
             set({ isCollaborative: data.current_state.isCollaborative });
+            set({ stateVersion: data.current_state.version ?? 0 });  // the snapshot's own room, not the last one's
             if (data.current_state.startTimestamp) {
                 lastKnownServerStart = data.current_state.startTimestamp;
                 isActuallyPlaying = data.current_state.isPlaying;
@@ -241,14 +360,63 @@ export const useRoomStore = createWithEqualityFn<RoomState>()((set, get) => ({
             }
         }
         const player = get().player;
-        const trackIdx = data.current_state?.trackIndex ?? 0;
-        const track = data.playlist?.[trackIdx];
+        // Start the current track from the first page rather than waiting for the whole playlist
+        const trackIdx = (data.current_state?.trackIndex ?? 0) - get().playlistOffset;
+        const track = get().playlist[trackIdx];
         if (player && track && player.activeSource === 'none') {
             set({ currentTrackIndex: trackIdx });
             player.loadTrack(track);
         }
     },
 
+    applyPlaylistPage: (page) => {
+        if (!page?.playlist) return;
+        const load = ++playlistLoad;
+        const rev = page.playlistRev ?? 0;
+        const offset = page.playlistOffset ?? 0;
+        // Keep the same track selected while the window (and its offset) changes under it
+        const shift = get().playlistOffset - offset;
+        set({ playlistTitle: page.title, playlist: page.playlist, playlistRev: rev, playlistOffset: offset,
+              currentTrackIndex: get().currentTrackIndex + shift });
+        if (!page.before && !page.after) {
+            playlistLoading = false;
+            return;
+        }
+        playlistLoading = true;
+        playlistRevSeen = rev;
+        const code = get().roomCode;
+        const resync = () => get().socket?.emit('get_playlist', { room_code: code }, get().applyPlaylistPage);
+        (async () => {
+            const before: Song[][] = [], after: Song[][] = [];
+            let prev = page.before, next = page.after;
+            try {
+                while (prev || next) {
+                    const [b, a] = await Promise.all([prev && fetchPlaylistPage(code, prev), next && fetchPlaylistPage(code, next)]);
+                    if (load !== playlistLoad) return;
+                    // A page from a different rev means the playlist changed mid-load
+                    if ([b, a].some(p => p && (p.error || (p.playlistRev ?? 0) !== rev))) throw new Error('Playlist changed');
+                    if (b) { before.unshift(b.playlist); prev = b.before; }
+                    if (a) { after.push(a.playlist); next = a.after; }
+                }
+            } catch {
+                if (load !== playlistLoad) return;
+                playlistLoading = false;
+                resync();
+                return;
+            }
+            playlistLoading = false;
+            set({ playlist: [...before.flat(), ...page.playlist, ...after.flat()], playlistOffset: 0,
+                  currentTrackIndex: get().currentTrackIndex + get().playlistOffset });
+            if (playlistRevSeen > rev) { resync(); return; }
+            const { player, currentTrackIndex } = get();
+            const track = get().playlist[currentTrackIndex];
+            if (player && track && player.activeSource === 'none') {
+                player.loadTrack(track);
+                get().updateMediaSession();
+            }
+        })();
+    },
+
     initPlayer: (container: HTMLElement) => {
         if (get().player) return;
         const player = new PlayerController(container);
@@ -358,17 +526,15 @@ export const useRoomStore = createWithEqualityFn<RoomState>()((set, get) => ({
         if (!get().isAdmin) return;
         const serverNow = (Date.now() + get().clockOffset) / 1000;
         get()._emitStateUpdate({ 
-            trackIndex: index, 
+            trackIndex: index + get().playlistOffset, 
+            trackId: get().playlist[index]?.id, 
             isPlaying: true, 
             startTimestamp: serverNow + 1.0 
         });
     },
 
     uploadFile: async (file, title, artist) => {
-        const fd = new FormData(); fd.append('file', file);
-        const res = await fetch(`${API_URL}/api/upload-local`, { method: 'POST', body: fd });
-        if (!res.ok) throw new Error('Upload failed');
-        const { audioUrl } = await res.json();
+        const { audioUrl, key } = (await uploadDirect(file)) ?? (await uploadViaServer(file));
         
         await fetch(`${API_URL}/api/room/${get().roomCode}/add-upload`, {
             method: 'POST', 
@@ -377,6 +543,7 @@ export const useRoomStore = createWithEqualityFn<RoomState>()((set, get) => ({
                 title: title || file.name, 
                 artist: artist || 'Local', 
                 audioUrl, 
+                audioKey: key,
                 uuid: get().userId 
             })
         });
@@ -395,7 +562,7 @@ export const useRoomStore = createWithEqualityFn<RoomState>()((set, get) => ({
         const isLast = currentTrackIndex >= playlist.length - 1;
         if (isLast) {
             if (repeatMode === 'all') { get().selectTrack(0); }
-            else { get()._emitStateUpdate({ isPlaying: false, pausedAt: 0, trackIndex: 0 }); }
+            else { get()._emitStateUpdate({ isPlaying: false, pausedAt: 0, trackIndex: get().playlistOffset, trackId: playlist[0].id }); }
         } else {
             get().selectTrack(currentTrackIndex + 1);
         }
@@ -404,7 +571,13 @@ export const useRoomStore = createWithEqualityFn<RoomState>()((set, get) => ({
     setVolume: (v) => { set({ volume: v }); const p = get().player; if (p) p.volume = v / 100; },
     removeTrack: (index) => {
         if (!get().isAdmin) return;
-        get().socket?.emit('remove_track', { room_code: get().roomCode, track_index: index });
+        const track = get().playlist[index];
+        get().socket?.emit('remove_track', { room_code: get().roomCode, track_id: track?.id, track_index: index + get().playlistOffset });
+    },
+    moveTrack: (index, to) => {
+        const track = get().playlist[index];
+        if (!get().isAdmin || !track?.id) return;
+        get().socket?.emit('move_track', { room_code: get().roomCode, track_id: track.id, to_index: to + get().playlistOffset });
     },
     toggleRepeat: () => {
         const modes: Array<'off' | 'one' | 'all'> = ['off', 'all', 'one'];
@@ -414,7 +587,14 @@ export const useRoomStore = createWithEqualityFn<RoomState>()((set, get) => ({
     },
     toggleShuffle: () => set(s => ({ isShuffle: !s.isShuffle })),
     toggleCollaborative: (val) => get().socket?.emit('toggle_settings', { room_code: get().roomCode, value: val }),
-    _emitStateUpdate: (state) => get().socket?.emit('update_player_state', { room_code: get().roomCode, state }),
+    _emitStateUpdate: (state) => get().socket?.emit(
+        'update_player_state',
+        { room_code: get().roomCode, state, baseVersion: get().stateVersion },
+        (ack: any) => {
+            if (ack?.rejected) applyServerState?.(ack.state);  // someone else moved first: snap to their state
+            else if (ack?.version > get().stateVersion) set({ stateVersion: ack.version });
+        },
+    ),
     updateMediaSession: () => {
         if (typeof navigator === 'undefined' || !('mediaSession' in navigator)) return;
         const track = get().playlist[get().currentTrackIndex];
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import fakeredis
+import gevent
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('REDIS_URL', 'redis://127.0.0.1:1')  # nothing listens there: app.r stays None
+
+import app as moodsync  # noqa: E402
+
+# Tests install their own app.r; keep the reconnect thread from swapping it back out, and let its
+# first attempt (already under way) finish before any test runs.
+moodsync._try_connect_redis = lambda: False
+gevent.sleep(0.2)
+
+
+@pytest.fixture
+def app_module():
+    return moodsync
+
+
+@pytest.fixture
+def redis_db(monkeypatch):
+    """A fresh fakeredis (with Lua, via lupa) installed as app.r, and empty in-process caches."""
+    db = fakeredis.FakeRedis(decode_responses=True, encoding_errors='surrogateescape')
+    monkeypatch.setattr(moodsync, 'r', db)
+    moodsync._room_cache.clear()
+    moodsync._room_revs.clear()
+    moodsync.cache_stats.clear()
+    yield db
+    moodsync._room_cache.clear()
+    moodsync._room_revs.clear()
+
+
+@pytest.fixture
+def room(redis_db):
+    """A new room with nobody in it. Returns its code."""
+    code = 'TEST01'
+    assert moodsync.create_room(code, {
+        'title': 'Test', 'users': {}, 'playlist': [],
+        'current_state': {'isPlaying': False, 'trackIndex': 0, 'volume': 80, 'isCollaborative': True},
+    })
+    return code
@@ -0,0 +1,75 @@
+import re
+
+import pytest
+
+BODY = bytes(range(256)) * 40  # 10240 bytes
+
+
+class FakeUpstream:
+    def __init__(self, body):
+        self.body, self.ranges = body, []
+
+    def __call__(self, url, timeout, headers=None, **kwargs):
+        start, end = map(int, re.fullmatch(r'bytes=(\d+)-(\d+)', headers['Range']).groups())
+        self.ranges.append(start)
+        if start >= len(self.body):
+            return FakeResponse(416, b'', {})
+        data = self.body[start:end + 1]
+        return FakeResponse(206, data, {'Content-Range': f'bytes {start}-{start + len(data) - 1}/{len(self.body)}',
+                                        'ETag': '"v1"', 'Content-Type': 'audio/mpeg'})
+
+
+class FakeResponse:
+    def __init__(self, status_code, content, headers):
+        self.status_code, self.content, self.headers = status_code, content, headers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def upstream(app_module, monkeypatch, tmp_path):
+    fake = FakeUpstream(BODY)
+    monkeypatch.setattr(app_module, 'http_get', fake)
+    monkeypatch.setattr(app_module, 'AUDIO_CHUNK_SIZE', 4096)
+    monkeypatch.setattr(app_module, 'audio_cache', app_module.AudioChunkCache(str(tmp_path), 1 << 20))
+    monkeypatch.setenv('R2_PUBLIC_URL', 'https://r2.example')
+    return fake
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None), ('bytes=0-99', (0, 99)), ('bytes=100-', (100, 999)), ('bytes=-10', (990, 999)),
+    ('bytes=900-5000', (900, 999)), ('bytes=0-1,5-6', None), ('items=0-1', None),
+])
+def test_parse_range(app_module, header, expected):
+    assert app_module._parse_range(header, 1000) == expected
+
+
+def test_unsatisfiable_range(app_module):
+    with pytest.raises(ValueError):
+        app_module._parse_range('bytes=1000-', 1000)
+
+
+def test_ranges_are_served_from_cached_chunks(app_module, upstream):
+    client = app_module.app.test_client()
+    resp = client.get('/api/audio/song.mp3', headers={'Range': 'bytes=4000-4199'})
+    assert resp.status_code == 206 and resp.data == BODY[4000:4200]
+    assert resp.headers['Content-Range'] == f'bytes 4000-4199/{len(BODY)}'
+
+    resp = client.get('/api/audio/song.mp3')
+    assert resp.status_code == 200 and resp.data == BODY
+    assert sorted(upstream.ranges) == [0, 4096, 8192]  # each chunk fetched once
+
+
+def test_unchanged_object_answers_not_modified(app_module, upstream):
+    client = app_module.app.test_client()
+    etag = client.get('/api/audio/song.mp3', headers={'Range': 'bytes=0-0'}).headers['ETag']
+    assert client.get('/api/audio/song.mp3', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_range_past_the_end(app_module, upstream):
+    resp = app_module.app.test_client().get('/api/audio/song.mp3', headers={'Range': f'bytes={len(BODY)}-'})
+    assert resp.status_code == 416 and resp.headers['Content-Range'] == f'bytes */{len(BODY)}'
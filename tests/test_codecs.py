@@ -0,0 +1,31 @@
+import pytest
+
+VALUE = {
+    'title': 'Ünïcødé 🎵', 'isPlaying': True, 'volume': 80, 'startTimestamp': 1792213955.1234567,
+    'nested': {'ids': ['a', 'b'], 'ratio': 0.1}, 'empty': '',
+}
+
+
+@pytest.fixture(params=['json', 'fastjson', 'msgpack'])
+def codec(app_module, request):
+    return app_module._load_codec(request.param)
+
+
+def test_round_trip(codec):
+    assert codec.loads(codec.dumps(VALUE)) == VALUE
+
+
+def test_any_codec_is_readable(app_module, codec):
+    assert app_module.decode_room_value(codec.dumps(VALUE)) == VALUE
+
+
+def test_round_trip_through_redis(app_module, codec, redis_db):
+    redis_db.set('value', codec.dumps(VALUE))
+    assert app_module.decode_room_value(redis_db.get('value')) == VALUE
+
+
+def test_lua_reads_and_rewrites_every_codec(app_module, codec, room, redis_db):
+    if codec.header and not redis_db.eval("return cmsgpack ~= nil and 1 or 0", 0):
+        pytest.skip('this Redis has no cmsgpack')
+    rewrite = app_module.RoomScript("return enc(dec(ARGV[2]))", writes=False)
+    assert app_module.decode_room_value(rewrite(room, codec.dumps(VALUE))) == VALUE
@@ -0,0 +1,41 @@
+import pytest
+
+
+@pytest.fixture
+def lookups(app_module, monkeypatch):
+    app_module._lyrics_docs.clear()
+    monkeypatch.setattr(app_module, 'get_yt_meta', lambda vid: {'duration': 215})
+    monkeypatch.setattr(app_module, 'fetch_lyrics', lambda title, artist: '[00:01.00]la' if title == 'Song' else None)
+    sent = []
+    monkeypatch.setattr(app_module, 'emit_playlist_delta', lambda *a, **kw: sent.append((a, kw)))
+    yield sent
+    app_module._lyrics_docs.clear()
+
+
+def stored(app_module, room, track_id):
+    return app_module.decode_room_value(app_module.r.hget(f'room:{room}:tracks', track_id))
+
+
+def test_missing_duration_and_lyrics_are_filled_in(app_module, room, lookups):
+    track = {'id': 't1', 'name': 'Song', 'artist': 'Band', 'videoId': 'aaaaaaaaaaa'}
+    app_module.append_track(room, track)
+    app_module._enrich_track(room, track)
+
+    saved = stored(app_module, room, 't1')
+    assert saved['duration'] == 215 and app_module.get_lyrics_doc(saved['lyricsId'])['l'] == ['la']
+    (args, kwargs), = lookups
+    assert args[:2] == (room, 'updated') and kwargs['index'] == 0
+    assert kwargs['track'] == {'id': 't1', 'duration': 215, 'lyricsId': saved['lyricsId']}
+
+
+def test_nothing_new_means_no_write(app_module, room, lookups):
+    track = {'id': 't2', 'name': 'Unknown', 'duration': 100}
+    app_module.append_track(room, track)
+    app_module._enrich_track(room, track)
+    assert lookups == []
+
+
+def test_removed_track_is_not_resurrected(app_module, room, lookups):
+    app_module._enrich_track(room, {'id': 'gone', 'name': 'Song', 'videoId': 'aaaaaaaaaaa'})
+    assert lookups == []
+    assert not app_module.r.hexists(f'room:{room}:tracks', 'gone')
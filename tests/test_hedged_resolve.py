@@ -0,0 +1,48 @@
+import time
+
+import gevent
+
+
+def slow(value, delay, log=None, name=None):
+    def fn():
+        if log is not None:
+            log.append(name)
+        gevent.sleep(delay)
+        if isinstance(value, Exception):
+            raise value
+        return value
+    return fn
+
+
+def test_fastest_candidate_wins_and_the_rest_are_killed(app_module):
+    finished = []
+
+    def never():
+        gevent.sleep(5)
+        finished.append('slow')
+    started = time.time()
+    result = app_module.hedged_first([('slow', never), ('fast', slow('url', 0.01))], deadline=2, delay=0.02)
+    assert result == ('fast', 'url')
+    assert time.time() - started < 1
+    gevent.sleep(0.05)
+    assert finished == []
+
+
+def test_next_candidate_starts_at_once_when_one_fails(app_module):
+    started = []
+    candidates = [('a', slow(IOError('down'), 0, started, 'a')), ('b', slow(None, 0, started, 'b')),
+                  ('c', slow('url', 0, started, 'c'))]
+    before = time.time()
+    assert app_module.hedged_first(candidates, deadline=2, delay=1) == ('c', 'url')
+    assert started == ['a', 'b', 'c']
+    assert time.time() - before < 0.5  # no waiting out the hedge delay after failures
+
+
+def test_gives_up_at_the_deadline(app_module):
+    before = time.time()
+    assert app_module.hedged_first([('stuck', slow('url', 5))], deadline=0.05, delay=1) is None
+    assert time.time() - before < 0.5
+
+
+def test_nothing_answers(app_module):
+    assert app_module.hedged_first([('a', slow(None, 0)), ('b', slow(None, 0))], deadline=1, delay=0.1) is None
@@ -0,0 +1,24 @@
+import os
+
+
+def test_local_segments_outlive_the_upload(app_module, tmp_path, monkeypatch):
+    out_dir = tmp_path / 'hls' / 'abcdefghijk'
+    out_dir.mkdir(parents=True)
+    for name in ('seg00000.ts', 'seg00001.ts', app_module.HLS_MANIFEST):
+        (out_dir / name).write_bytes(b'x')
+    uploaded, scheduled = [], []
+    monkeypatch.setenv('R2_PUBLIC_URL', 'https://cdn.example')
+    monkeypatch.setattr(app_module, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(app_module, 'r2_upload', lambda local, key, *a: uploaded.append(key) or f"https://cdn.example/{key}")
+    monkeypatch.setattr(app_module.gevent, 'spawn_later', lambda delay, fn, *a, **k: scheduled.append((delay, fn, a, k)))
+
+    ingest = object.__new__(app_module.SegmentedIngest)
+    ingest.out_dir, ingest.path, ingest.size = str(out_dir), str(out_dir / app_module.HLS_MANIFEST), 2
+    assert ingest.publish() == 'r2:hls/abcdefghijk/index.m3u8'
+    assert uploaded[-1] == 'hls/abcdefghijk/index.m3u8' and len(uploaded) == 3
+
+    assert os.path.exists(ingest.path)  # listeners on the local manifest can still finish
+    [(delay, fn, args, kwargs)] = scheduled
+    assert delay >= 2 * app_module.HLS_SEGMENT_SECONDS
+    fn(*args, **kwargs)
+    assert not out_dir.exists()
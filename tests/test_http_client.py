@@ -0,0 +1,53 @@
+import pytest
+import requests
+
+
+class FakeSession:
+    def __init__(self, outcome):
+        self.outcome, self.calls = outcome, []
+
+    def request(self, method, url, timeout, **kwargs):
+        self.calls.append((method, url, timeout))
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        resp = requests.Response()
+        resp.status_code = self.outcome
+        return resp
+
+
+@pytest.fixture
+def session(app_module, monkeypatch):
+    app_module.upstream_stats.clear()
+
+    def install(outcome):
+        fake = FakeSession(outcome)
+        monkeypatch.setattr(app_module, '_http', fake)
+        return fake
+    yield install
+    app_module.upstream_stats.clear()
+
+
+def test_requests_share_the_session_with_split_timeouts(app_module, session):
+    fake = session(200)
+    app_module.http_get('https://api.example/a', 7)
+    app_module.http_post('https://api.example/b', 3)
+    assert fake.calls == [('GET', 'https://api.example/a', (app_module.HTTP_CONNECT_TIMEOUT, 7)),
+                          ('POST', 'https://api.example/b', (app_module.HTTP_CONNECT_TIMEOUT, 3))]
+    stats = app_module.upstream_stats['api.example']
+    assert stats['requests'] == 2 and stats['status_2xx'] == 2
+
+
+def test_timeouts_and_errors_are_counted_per_host(app_module, session):
+    session(requests.ReadTimeout())
+    with pytest.raises(requests.Timeout):
+        app_module.http_get('https://slow.example/x', 1)
+    session(requests.ConnectionError())
+    with pytest.raises(requests.ConnectionError):
+        app_module.http_get('https://slow.example/x', 1)
+    stats = app_module.upstream_stats['slow.example']
+    assert (stats['requests'], stats['timeouts'], stats['errors']) == (2, 1, 1)
+
+
+def test_pool_is_mounted_for_both_schemes(app_module):
+    for prefix in ('http://', 'https://'):
+        assert app_module._http.get_adapter(prefix + 'x.example')._pool_maxsize == app_module.HTTP_POOL_SIZE
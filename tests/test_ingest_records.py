@@ -0,0 +1,40 @@
+import pytest
+
+VID = 'abcdefghijk'
+
+
+@pytest.fixture
+def signer(app_module, monkeypatch):
+    signed = []
+    monkeypatch.setattr(app_module, 'r2_playback_url', lambda key: signed.append(key) or f"https://r2.example/{key}?sig={len(signed)}")
+    monkeypatch.setattr(app_module, 'start_ingest', lambda vid: None)
+    return signed
+
+
+def test_finished_ingest_redirects_to_a_fresh_signature(app_module, redis_db, signer):
+    redis_db.set(f"ingest:{VID}", f"r2:yt-{VID}.mp3")
+    http = app_module.app.test_client()
+    first = http.get(f'/api/stream/{VID}').headers['Location']
+    second = http.get(f'/api/stream/{VID}').headers['Location']
+    assert signer == [f"yt-{VID}.mp3"] * 2
+    assert first != second
+
+
+def test_stored_presigned_url_is_not_served(app_module, redis_db, signer):
+    redis_db.set(f"ingest:{VID}", 'https://acct.r2.cloudflarestorage.com/x.mp3?X-Amz-Signature=abc')
+    resp = app_module.app.test_client().get(f'/api/stream/{VID}')
+    assert resp.status_code == 503  # falls through to a new ingest, which this test refuses
+
+
+def test_local_locations_pass_through(app_module):
+    assert app_module.ingest_playback_url('/uploads/yt-x.mp3') == '/uploads/yt-x.mp3'
+
+
+def test_publish_records_the_key_not_a_url(app_module, tmp_path, monkeypatch):
+    path = tmp_path / f"yt-{VID}.mp3"
+    path.write_bytes(b'mp3')
+    monkeypatch.setattr(app_module, 'r2_upload', lambda local, name, *a, **k: f"https://r2.example/{name}?sig=1")
+    ingest = object.__new__(app_module.StreamingIngest)
+    ingest.path = str(path)
+    assert ingest.publish() == f"r2:yt-{VID}.mp3"
+    assert not path.exists()
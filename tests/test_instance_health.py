@@ -0,0 +1,51 @@
+from functools import partial
+
+import gevent
+
+
+def test_breaker_trips_after_threshold_and_success_resets(app_module, redis_db):
+    for _ in range(app_module.BREAKER_THRESHOLD):
+        app_module.record_instance_result('https://a', 'fail', 100)
+    h = redis_db.hgetall('health:https://a')
+    assert h['fail'] == str(app_module.BREAKER_THRESHOLD) and h['trips'] == '1'
+    assert app_module.ranked_instances([('https://a', 5)]) == []
+
+    app_module.record_instance_result('https://a', 'ok', 200)
+    h = redis_db.hgetall('health:https://a')
+    assert (h['consecutive_failures'], h['open_until'], h['ewma_ms']) == ('0', '0', '200')
+
+
+def test_concurrent_results_are_all_counted(app_module, redis_db):
+    gevent.joinall([gevent.spawn(app_module.record_instance_result, 'https://b', 'ok' if i % 2 else 'fail', 50)
+                    for i in range(40)])
+    h = redis_db.hgetall('health:https://b')
+    assert (h['ok'], h['fail']) == ('20', '20')
+
+
+def test_hedge_losers_are_recorded_and_release_their_probe(app_module, redis_db):
+    def slow():
+        gevent.sleep(5)
+        return 'late'
+
+    redis_db.hset('health:https://slow', 'open_until', 1)  # half-open: calls need the probe key
+    candidates = [
+        ('slow', partial(app_module.call_instance, 'https://slow', 'half-open', slow)),
+        ('fast', partial(app_module.call_instance, 'https://fast', 'closed', lambda: 'url')),
+    ]
+    assert app_module.hedged_first(candidates, deadline=2, delay=0.05) == ('fast', 'url')
+    gevent.sleep(0.05)  # the killed loser records on its way out
+    assert redis_db.hget('health:https://slow', 'cancelled') == '1'
+    assert redis_db.hget('health:https://slow', 'fail') is None
+    assert not redis_db.exists('health:https://slow:probe')
+    assert redis_db.hget('health:https://fast', 'ok') == '1'
+
+
+def test_failed_call_is_recorded_even_when_it_raises(app_module, redis_db):
+    def broken():
+        raise ValueError('boom')
+
+    try:
+        app_module.call_instance('https://c', 'closed', broken)
+    except ValueError:
+        pass
+    assert redis_db.hget('health:https://c', 'fail') == '1'
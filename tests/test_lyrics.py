@@ -0,0 +1,47 @@
+import gevent
+import pytest
+
+
+@pytest.fixture
+def lrclib(app_module, redis_db, monkeypatch):
+    app_module._lyrics_mem.clear()
+    app_module._lyrics_docs.clear()
+    calls = []
+
+    def upstream(answer, delay=0):
+        def fetch(title, artist):
+            calls.append(title)
+            gevent.sleep(delay)
+            return answer
+        monkeypatch.setattr(app_module, '_fetch_lyrics_upstream', fetch)
+        return calls
+    yield upstream
+    app_module._lyrics_mem.clear()
+    app_module._lyrics_docs.clear()
+
+
+def test_concurrent_misses_share_one_upstream_call(app_module, lrclib):
+    calls = lrclib('[00:01.00]hello', delay=0.05)
+    jobs = [gevent.spawn(app_module.fetch_lyrics, 'Song', 'Artist') for _ in range(5)]
+    gevent.joinall(jobs)
+    assert [j.value for j in jobs] == ['[00:01.00]hello'] * 5
+    assert calls == ['Song']
+
+
+def test_missing_lyrics_are_cached_for_less_time(app_module, lrclib, redis_db):
+    calls = lrclib(None)
+    assert app_module.fetch_lyrics('Nothing', 'Nobody') is None
+    assert app_module.fetch_lyrics('nothing!', 'NOBODY') is None
+    assert calls == ['Nothing']
+    assert app_module.cache_stats['lyrics']['negative_hit'] == 1
+    assert 0 < redis_db.ttl(app_module._lyrics_cache_key('Nothing', 'Nobody')) <= app_module.LYRICS_MISS_TTL
+
+
+def test_transport_errors_are_not_cached(app_module, lrclib, monkeypatch):
+    def broken(title, artist):
+        raise IOError('down')
+    monkeypatch.setattr(app_module, '_fetch_lyrics_upstream', broken)
+    assert app_module.fetch_lyrics('Song', 'Artist') is None
+    calls = lrclib('text')
+    assert app_module.fetch_lyrics('Song', 'Artist') == 'text'
+    assert calls == ['Song']
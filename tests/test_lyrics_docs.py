@@ -0,0 +1,25 @@
+import pytest
+
+
+@pytest.fixture
+def docs(app_module, redis_db):
+    app_module._lyrics_docs.clear()
+    yield
+    app_module._lyrics_docs.clear()
+
+
+def test_parse_lrc_sorts_timed_lines(app_module):
+    doc = app_module.parse_lrc('[ar:Someone]\n[00:02.50]second\n[00:01.00][00:03.00]again\n\n')
+    assert doc == {'synced': True, 't': [1000, 2500, 3000], 'l': ['again', 'second', 'again']}
+
+
+def test_parse_lrc_keeps_plain_lyrics(app_module):
+    assert app_module.parse_lrc('line one\nline two') == {'synced': False, 't': [], 'l': ['line one', 'line two']}
+
+
+def test_stored_lyrics_are_shared_by_content(app_module, docs):
+    first = app_module.store_lyrics('[00:01.00]hi')
+    assert app_module.store_lyrics('[00:01.00]hi') == first
+    app_module._lyrics_docs.clear()  # as if another worker stored it
+    assert app_module.get_lyrics_doc(first)['l'] == ['hi']
+    assert app_module.store_lyrics('') is None
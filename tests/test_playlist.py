@@ -0,0 +1,62 @@
+import pytest
+
+
+def add(app_module, code, *ids):
+    for track_id in ids:
+        app_module.append_track(code, {'id': track_id, 'title': track_id})
+
+
+def order(redis_db, code):
+    return redis_db.zrange(f'room:{code}:order', 0, -1)
+
+
+@pytest.mark.parametrize('cursor, expected', [('a3', ('after', '3')), ('b1.5', ('before', '1.5'))])
+def test_parse_playlist_cursor(app_module, cursor, expected):
+    assert app_module.parse_playlist_cursor(cursor) == expected
+
+
+@pytest.mark.parametrize('cursor', ['', 'x1', 'a', 'ainf', 'anan', 'b1e999', 'a1;'])
+def test_parse_playlist_cursor_rejects_garbage(app_module, cursor):
+    with pytest.raises(ValueError):
+        app_module.parse_playlist_cursor(cursor)
+
+
+def test_cursor_pages_cover_the_playlist(app_module, room):
+    ids = ['t%d' % i for i in range(7)]
+    add(app_module, room, *ids)
+    page = app_module.playlist_page(room, limit=3)
+    seen = [t['id'] for t in page['playlist']]
+    while page['after']:
+        page = app_module.playlist_page(room, page['after'], limit=3)
+        seen += [t['id'] for t in page['playlist']]
+    assert seen == ids
+
+
+def test_move_between_adjacent_scores_renumbers(app_module, room, redis_db):
+    add(app_module, room, 'a', 'b', 'c')
+    redis_db.zadd(f'room:{room}:order', {'a': 1, 'b': 1 + 1e-12, 'c': 2})
+    rev, from_idx, to_idx, _ = app_module.move_track(room, 'sid', 'c', 1)
+    assert (from_idx, to_idx) == (2, 1)
+    assert order(redis_db, room) == ['a', 'c', 'b']
+    scores = [s for _, s in redis_db.zrange(f'room:{room}:order', 0, -1, withscores=True)]
+    assert scores[1] - scores[0] > 1e-9 and scores[2] - scores[1] > 1e-9
+
+
+def test_move_keeps_the_current_track_playing(app_module, room, redis_db):
+    add(app_module, room, 'a', 'b', 'c')
+    rev, _, _, state = app_module.move_track(room, 'sid', 'a', 2)
+    assert order(redis_db, room) == ['b', 'c', 'a']
+    assert state['trackId'] == 'a' and state['trackIndex'] == 2
+
+
+def test_legacy_playlist_upgrade_bumps_cache_rev(app_module, room, redis_db):
+    redis_db.rpush(f'room:{room}:playlist', *[app_module.encode_room_value({'title': t}) for t in ('x', 'y')])
+    rev = int(redis_db.hget(f'room:{room}:meta', 'cache_rev') or 0)
+    app_module._room_cache.set((room, 'core'), (rev, {'stale': True}))
+
+    app_module._UPGRADE_PLAYLIST(room)
+
+    assert not redis_db.exists(f'room:{room}:playlist')
+    assert [t['title'] for t in app_module.playlist_snapshot(room)['playlist']] == ['x', 'y']
+    assert int(redis_db.hget(f'room:{room}:meta', 'cache_rev')) > rev
+    assert not app_module._room_cache.get((room, 'core'))[0]
@@ -0,0 +1,39 @@
+import pytest
+
+
+@pytest.fixture
+def client(app_module, room, monkeypatch):
+    monkeypatch.setattr(app_module, 'schedule_prefetch', lambda *a: None)
+    c = app_module.socketio.test_client(app_module.app)
+    c.emit('join_room', {'room_code': room, 'username': 'alice', 'uuid': 'ua'})
+    c.get_received()
+    yield c
+    c.disconnect()
+
+
+def deltas(client):
+    return [(m['name'], m['args'][0]) for m in client.get_received() if m['name'].startswith('playlist_track_')]
+
+
+def add(app_module, room, name):
+    return app_module.add_track_logic(room, name, 'Artist', f'/uploads/{name}.mp3', None, None)
+
+
+def test_changes_go_out_as_numbered_deltas(app_module, room, client):
+    a, b = add(app_module, room, 'a'), add(app_module, room, 'b')
+    client.emit('move_track', {'room_code': room, 'track_id': b['id'], 'to_index': 0})
+    client.emit('remove_track', {'room_code': room, 'track_id': a['id']})
+
+    sent = deltas(client)
+    assert [name for name, _ in sent] == ['playlist_track_added', 'playlist_track_added',
+                                          'playlist_track_moved', 'playlist_track_removed']
+    assert [d['rev'] for _, d in sent] == [1, 2, 3, 4]
+    assert sent[1][1]['index'] == 1 and sent[1][1]['track']['name'] == 'b'
+    assert (sent[2][1]['index'], sent[2][1]['to']) == (1, 0)
+    assert (sent[3][1]['id'], sent[3][1]['index']) == (a['id'], 1)
+    assert app_module.playlist_snapshot(room)['playlistRev'] == 4
+
+
+def test_no_full_refresh_for_single_changes(app_module, room, client):
+    add(app_module, room, 'a')
+    assert 'refresh_playlist' not in [m['name'] for m in client.get_received()]
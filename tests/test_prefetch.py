@@ -0,0 +1,32 @@
+import pytest
+
+
+@pytest.fixture
+def warmed(app_module, room, monkeypatch):
+    app_module._prefetched.clear()
+    seen = []
+    monkeypatch.setattr(app_module, '_prefetch', lambda code, tracks: seen.extend(t['id'] for t in tracks))
+    for i in range(5):
+        app_module.append_track(room, {'id': f't{i}', 'name': f'Song {i}'})
+    yield seen
+    app_module._prefetch_pool.join()
+    app_module._prefetched.clear()
+
+
+def test_warms_the_next_tracks(app_module, room, warmed):
+    app_module.schedule_prefetch(room, {'isPlaying': True, 'trackIndex': 1})
+    app_module._prefetch_pool.join()
+    assert warmed == ['t2', 't3'][:app_module.PREFETCH_AHEAD]
+
+
+def test_recently_warmed_tracks_are_skipped(app_module, room, warmed):
+    app_module.schedule_prefetch(room, {'isPlaying': True, 'trackIndex': 1})
+    app_module.schedule_prefetch(room, {'isPlaying': True, 'trackIndex': 2})
+    app_module._prefetch_pool.join()
+    assert warmed == ['t2', 't3', 't4'][:app_module.PREFETCH_AHEAD + 1]
+
+
+def test_paused_rooms_are_not_prefetched(app_module, room, warmed):
+    app_module.schedule_prefetch(room, {'isPlaying': False, 'trackIndex': 0})
+    app_module._prefetch_pool.join()
+    assert warmed == []
@@ -0,0 +1,27 @@
+import time
+
+
+def test_room_whose_workers_all_died_is_reaped(app_module, redis_db, room, monkeypatch):
+    monkeypatch.setattr(app_module, '_local_sids', {})  # this worker holds none of the room's sockets
+    app_module.join_member(room, 'sid-a', 'ua', 'alice')
+    app_module.join_member(room, 'sid-b', 'ub', 'bob')
+    assert redis_db.zscore(app_module.PRESENCE_ROOMS, room)
+
+    app_module.presence_tick(time.time())  # nothing is stale yet
+    assert len(app_module.get_room_users(room)) == 2
+
+    app_module.presence_tick(time.time() + app_module.PRESENCE_TTL + 1)
+    assert app_module.get_room_users(room) == {}
+    assert not redis_db.exists('sid:sid-a', 'sid:sid-b')
+    assert redis_db.zscore(app_module.PRESENCE_ROOMS, room) is None
+    assert 0 < redis_db.ttl(app_module.room_key(room, 'state')) <= app_module.ROOM_EMPTY_GRACE
+
+
+def test_heartbeat_keeps_local_members(app_module, redis_db, room, monkeypatch):
+    monkeypatch.setattr(app_module, '_local_sids', {'sid-a': room})
+    app_module.join_member(room, 'sid-a', 'ua', 'alice')
+    app_module.join_member(room, 'sid-gone', 'ug', 'ghost')
+    later = time.time() + app_module.PRESENCE_TTL + 1
+    app_module.presence_tick(later)
+    assert list(app_module.get_room_users(room)) == ['sid-a']
+    assert redis_db.zscore(app_module.PRESENCE_ROOMS, room) == later
@@ -0,0 +1,106 @@
+import pytest
+
+
+class FakeR2:
+    def __init__(self):
+        self.signed = 0
+        self.objects, self.deleted = {}, []
+
+    def generate_presigned_url(self, op, Params, ExpiresIn):
+        self.signed += 1
+        return f"https://r2.example/{Params['Key']}?sig={self.signed}"
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': self.objects[Key]}
+
+    def delete_object(self, Bucket, Key):
+        self.deleted.append(Key)
+
+
+@pytest.fixture
+def r2(app_module, monkeypatch):
+    client = FakeR2()
+    monkeypatch.delenv('R2_PUBLIC_URL', raising=False)
+    monkeypatch.setattr(app_module, '_r2_client', lambda: (client, 'bucket'))
+    return client
+
+
+def test_uploads_are_stored_by_key_and_signed_per_read(app_module, room, redis_db, r2):
+    app_module.record_upload('1-ab.mp3')
+    http = app_module.app.test_client()
+    resp = http.post(f'/api/room/{room}/add-upload', json={
+        'title': 'Upload', 'artist': 'Me', 'audioUrl': 'https://r2.example/1-ab.mp3?sig=old', 'audioKey': '1-ab.mp3',
+    })
+    assert resp.get_json() == {'success': True}
+
+    stored = app_module.decode_room_value(next(iter(redis_db.hvals(app_module.room_key(room, 'tracks')))))
+    assert stored['audioKey'] == '1-ab.mp3' and stored['audioUrl'] is None
+
+    first = http.get(f'/api/room/{room}').get_json()['playlist'][0]['audioUrl']
+    second = app_module.playlist_page(room)['playlist'][0]['audioUrl']
+    assert first.startswith('https://r2.example/1-ab.mp3?sig=') and first != second
+
+
+def test_public_bucket_urls_need_no_signing(app_module, room, r2, monkeypatch):
+    monkeypatch.setenv('R2_PUBLIC_URL', 'https://cdn.example/')
+    app_module.add_track_logic(room, 'Upload', 'Me', None, None, None, audio_key='k.mp3')
+    assert app_module.playlist_snapshot(room)['playlist'][0]['audioUrl'] == 'https://cdn.example/k.mp3'
+    assert r2.signed == 0
+
+
+@pytest.mark.parametrize('key', ['../x', 'someone-elses.mp3', ['1-ab.mp3']])
+def test_keys_not_uploaded_here_are_rejected(app_module, room, r2, key):
+    resp = app_module.app.test_client().post(f'/api/room/{room}/add-upload', json={
+        'title': 't', 'artist': 'a', 'audioUrl': '/uploads/x.mp3', 'audioKey': key})
+    assert resp.status_code == 400
+    assert app_module.playlist_snapshot(room)['playlist'] == [] and r2.signed == 0
+
+
+def test_direct_upload_flow(app_module, room, redis_db, r2):
+    http = app_module.app.test_client()
+    resp = http.post('/api/upload-url', json={'filename': 'song.MP3', 'contentType': 'audio/mpeg', 'size': 1000})
+    key = resp.get_json()['key']
+    assert resp.status_code == 200 and key.endswith('.mp3') and resp.get_json()['uploadUrl']
+
+    r2.objects[key] = 1000
+    done = http.post('/api/upload-complete', json={'key': key}).get_json()
+    assert done['key'] == key and done['audioUrl'].startswith(f'https://r2.example/{key}')
+
+    add = {'title': 't', 'artist': 'a', 'audioUrl': done['audioUrl'], 'audioKey': key}
+    assert http.post(f'/api/room/{room}/add-upload', json=add).status_code == 200
+    assert http.post(f'/api/room/{room}/add-upload', json=add).status_code == 400  # claimed once
+    assert [t['audioKey'] for t in app_module.playlist_snapshot(room)['playlist']] == [key]
+
+
+@pytest.mark.parametrize('body, status', [
+    ({'filename': 'notes.txt', 'contentType': 'text/plain', 'size': 10}, 400),
+    ({'filename': 'song.mp3', 'contentType': 'audio/mpeg', 'size': 0}, 413),
+    ({'filename': 'song.mp3', 'contentType': 'audio/mpeg', 'size': 10 ** 12}, 413),
+])
+def test_upload_url_rejects_bad_files(app_module, redis_db, r2, body, status):
+    assert app_module.app.test_client().post('/api/upload-url', json=body).status_code == status
+
+
+def test_upload_complete_only_takes_issued_keys(app_module, redis_db, r2):
+    r2.objects['forged.mp3'] = 10
+    resp = app_module.app.test_client().post('/api/upload-complete', json={'key': 'forged.mp3'})
+    assert resp.status_code == 404 and not redis_db.exists('uploaded:forged.mp3')
+
+
+def test_oversized_upload_is_deleted(app_module, redis_db, r2):
+    http = app_module.app.test_client()
+    key = http.post('/api/upload-url', json={'filename': 'a.mp3', 'contentType': 'audio/mpeg', 'size': 10}).get_json()['key']
+    r2.objects[key] = app_module.app.config['MAX_CONTENT_LENGTH'] + 1
+    assert http.post('/api/upload-complete', json={'key': key}).status_code == 413
+    assert r2.deleted == [key] and not redis_db.exists(f'uploaded:{key}')
+
+
+def test_r2_client_is_built_once(app_module, monkeypatch):
+    import boto3
+    built = []
+    monkeypatch.setattr(boto3, 'client', lambda *a, **kw: built.append(kw) or object())
+    monkeypatch.setattr(app_module, '_r2_clients', {})
+    for name, value in {'R2_ACCOUNT_ID': 'acct', 'R2_ACCESS_KEY_ID': 'key', 'R2_SECRET_ACCESS_KEY': 'secret'}.items():
+        monkeypatch.setenv(name, value)
+    first, bucket = app_module._r2_client()
+    assert app_module._r2_client() == (first, bucket) and len(built) == 1
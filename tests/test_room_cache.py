@@ -0,0 +1,43 @@
+import pytest
+
+
+@pytest.fixture
+def live(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, '_room_cache_live', True)
+
+
+def test_reads_are_served_from_memory(app_module, room, live):
+    app_module.load_room_core(room)
+    app_module.load_room_core(room)
+    assert app_module.cache_stats['room']['miss'] == 1
+    assert app_module.cache_stats['room']['memory_hit'] == 1
+
+
+def test_own_write_is_visible_at_once(app_module, room, live):
+    assert app_module.load_room_core(room)[1]['volume'] == 80
+    app_module.merge_room_state(room, {'volume': 30})
+    assert app_module.load_room_core(room)[1]['volume'] == 30
+
+
+def test_announced_rev_invalidates_older_entries(app_module, room, live, redis_db):
+    app_module.merge_room_state(room, {'volume': 30})  # rev 0 would mean a recreated room
+    app_module.load_room_core(room)
+    rev = int(redis_db.hget(f'room:{room}:meta', 'cache_rev'))
+    app_module._on_room_changed(f'{room} {rev}')
+    assert app_module._room_cache.get((room, 'core'))[0]
+
+    app_module._on_room_changed(f'{room} {rev + 1}')
+    assert not app_module._room_cache.get((room, 'core'))[0]
+    assert app_module.cache_stats['room']['invalidated'] == 1
+
+
+def test_read_racing_an_announced_write_is_not_stored(app_module, room, live):
+    app_module._on_room_changed(f'{room} 1000')
+    app_module.load_room_core(room)
+    assert not app_module._room_cache.get((room, 'core'))[0]
+
+
+def test_nothing_is_cached_without_the_listener(app_module, room, monkeypatch):
+    monkeypatch.setattr(app_module, '_room_cache_live', False)
+    app_module.load_room_core(room)
+    assert not app_module._room_cache.get((room, 'core'))[0]
@@ -0,0 +1,29 @@
+def ttls(app_module, redis_db, code):
+    return {p: redis_db.ttl(app_module.room_key(code, p)) for p in app_module.ROOM_PARTS
+            if redis_db.exists(app_module.room_key(code, p))}
+
+
+def test_new_room_starts_on_the_empty_grace(app_module, redis_db, room):
+    assert ttls(app_module, redis_db, room)
+    assert all(0 < t <= app_module.ROOM_EMPTY_GRACE for t in ttls(app_module, redis_db, room).values())
+
+
+def test_code_is_claimed_once(app_module, room):
+    assert not app_module.create_room(room, {'current_state': {}})
+
+
+def test_join_extends_and_leaving_shortens(app_module, redis_db, room):
+    app_module.join_member(room, 'sid1', 'u1', 'alice')
+    assert all(t > app_module.ROOM_EMPTY_GRACE for t in ttls(app_module, redis_db, room).values())
+
+    app_module.remove_room_users(room, 'sid1')
+    assert app_module.release_if_empty(room)
+    assert all(0 < t <= app_module.ROOM_EMPTY_GRACE for t in ttls(app_module, redis_db, room).values())
+
+
+def test_writes_to_an_empty_room_do_not_extend_it(app_module, redis_db, room):
+    redis_db.expire(app_module.room_key(room, 'state'), 100)
+    redis_db.expire(app_module.room_key(room, 'meta'), 100)
+    app_module.append_track(room, {'id': 't1', 'name': 'x'})  # e.g. an add-upload nobody is listening to
+    assert all(0 < t <= 100 for t in ttls(app_module, redis_db, room).values())
+    assert redis_db.exists(app_module.room_key(room, 'tracks'))
@@ -0,0 +1,53 @@
+import json
+
+
+def state_of(app_module, code):
+    return app_module.load_room_core(code)[1]
+
+
+def test_only_the_admin_toggles_settings(app_module, room):
+    app_module.join_member(room, 'admin', 'ua', 'alice')
+    app_module.join_member(room, 'guest', 'ub', 'bob')
+    assert app_module.merge_room_state(room, {'isCollaborative': False}, 'guest') is None
+    assert state_of(app_module, room)['isCollaborative'] is True
+
+    state = app_module.merge_room_state(room, {'isCollaborative': False}, 'admin')
+    assert state['isCollaborative'] is False and state['updatedBy'] == 'admin'
+
+
+def test_toggle_event_is_permission_checked(app_module, room):
+    admin = app_module.socketio.test_client(app_module.app)
+    guest = app_module.socketio.test_client(app_module.app)
+    admin.emit('join_room', {'room_code': room, 'username': 'alice', 'uuid': 'ua'})
+    guest.emit('join_room', {'room_code': room, 'username': 'bob', 'uuid': 'ub'})
+    guest.emit('toggle_settings', {'room_code': room, 'value': False})
+    assert state_of(app_module, room)['isCollaborative'] is True
+    admin.emit('toggle_settings', {'room_code': room, 'value': False})
+    assert state_of(app_module, room)['isCollaborative'] is False
+    admin.disconnect()
+    guest.disconnect()
+
+
+def test_clock_fields_round_trip_exactly_through_lua(app_module, room, monkeypatch):
+    monkeypatch.setattr(app_module, 'server_now', lambda: 1792213953.0564642)
+    app_module.join_member(room, 'admin', 'ua', 'alice')
+    status, state = app_module.update_player_state(room, 'admin', {'isPlaying': True, 'startTimestamp': 1792213955.1234567})
+    stored = state_of(app_module, room)
+    assert stored['startTimestamp'] == 1792213955.1234567
+    assert stored['serverTime'] == 1792213953.0564642
+
+
+def test_exact_json_encoder_in_lua(app_module, redis_db):
+    src = app_module._LUA_ROOM_PRELUDE.split('local function enc(')[0]
+    out = redis_db.eval(src + "return exact_json({startTimestamp = 1792213955.1234567, name = 'x'})", 0)
+    assert json.loads(out) == {'startTimestamp': 1792213955.1234567, 'name': 'x'}
+
+
+def test_transfer_without_a_target_is_ignored(app_module, room):
+    admin = app_module.socketio.test_client(app_module.app)
+    admin.emit('join_room', {'room_code': room, 'username': 'alice', 'uuid': 'ua'})
+    for new_sid in (None, 42):
+        admin.emit('transfer_admin', {'room_code': room, 'new_sid': new_sid})
+    admin.emit('transfer_admin', {'room_code': room})
+    assert app_module.load_room_core(room)[0]['admin_uuid'] == 'ua'
+    admin.disconnect()
@@ -0,0 +1,49 @@
+import json
+
+
+def test_legacy_blob_is_split_on_first_read(app_module, redis_db):
+    blob = {
+        'title': 'Old', 'admin_uuid': 'ua', 'users': {}, 'playlistRev': 4,
+        'playlist': [{'title': 'one'}, {'title': 'two', 'id': 'kept'}],
+        'current_state': {'isPlaying': False, 'trackIndex': 1, 'volume': 50},
+    }
+    redis_db.set('room:OLD001', json.dumps(blob))
+
+    room = app_module.load_room('OLD001')
+
+    assert room['title'] == 'Old' and room['admin_uuid'] == 'ua' and room['playlistRev'] == 4
+    assert room['current_state']['volume'] == 50
+    assert not redis_db.exists('room:OLD001')
+    tracks = app_module.playlist_snapshot('OLD001')['playlist']
+    assert [t['title'] for t in tracks] == ['one', 'two']
+    assert tracks[0]['id'] and tracks[1]['id'] == 'kept'
+    assert redis_db.ttl('room:OLD001:meta') <= app_module.ROOM_EMPTY_GRACE
+
+
+def test_missing_room_reads_as_none(app_module, redis_db):
+    assert app_module.load_room('NOPE01') is None
+    assert app_module.load_room_core('NOPE01') == (None, None)
+
+
+def test_create_room_refuses_a_taken_code(app_module, room):
+    assert not app_module.create_room(room, {'title': 'Again'})
+    assert app_module.load_room(room)['title'] == 'Test'
+
+
+def test_migrated_room_keeps_no_dead_members(app_module, redis_db):
+    blob = {
+        'title': 'Old', 'admin_uuid': 'ua', 'admin_sid': 'old-sid', 'playlist': [],
+        'users': {'old-sid': {'name': 'alice', 'isAdmin': True, 'uuid': 'ua'}},
+        'current_state': {'isPlaying': False, 'trackIndex': 0},
+    }
+    redis_db.set('room:OLD002', json.dumps(blob))
+
+    room = app_module.load_room('OLD002')
+    app_module.presence_tick(now=10 ** 10)
+
+    assert room['users'] == {} and not room['admin_sid']
+    assert not redis_db.exists('room:OLD002:users')
+    assert 0 < redis_db.ttl('room:OLD002:meta') <= app_module.ROOM_EMPTY_GRACE
+    # the admin comes back on their uuid
+    user, _ = app_module.join_member('OLD002', 'new-sid', 'ua', 'alice')
+    assert user['isAdmin']
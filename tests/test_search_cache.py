@@ -0,0 +1,61 @@
+import pytest
+
+
+@pytest.fixture
+def search(app_module, redis_db, monkeypatch):
+    app_module._search_mem.clear()
+    calls = []
+
+    def backends(api_results, ytmusic_results):
+        monkeypatch.setattr(app_module, '_search_youtube_api', lambda q: calls.append('api') or api_results)
+        monkeypatch.setattr(app_module, '_search_ytmusic', lambda q: calls.append('ytmusic') or ytmusic_results)
+        return calls
+    yield backends
+    app_module._search_mem.clear()
+
+
+RESULTS = [{'id': 'abcdefghijk', 'title': 'Song', 'artist': 'Artist', 'thumbnail': None}]
+
+
+def test_repeat_search_is_served_from_cache(app_module, search):
+    calls = search(RESULTS, None)
+    assert app_module.search_tracks('Song') == RESULTS
+    assert app_module.search_tracks('  song ') == RESULTS
+    assert calls == ['api']
+    assert app_module.cache_stats['search']['memory_hit'] == 1
+
+
+def test_quota_saved_only_counts_data_api_results(app_module, search):
+    search(RESULTS, None)
+    app_module.search_tracks('from api')
+    app_module.search_tracks('from api')
+    assert app_module.cache_stats['search']['quota_saved'] == app_module.SEARCH_QUOTA_COST
+
+    search(None, RESULTS)
+    app_module.search_tracks('from ytmusic')
+    app_module.search_tracks('from ytmusic')
+    assert app_module.cache_stats['search']['quota_saved'] == app_module.SEARCH_QUOTA_COST
+
+
+def test_redis_tier_keeps_the_source(app_module, search, redis_db):
+    search(None, RESULTS)
+    app_module.search_tracks('other worker')
+    app_module._search_mem.clear()  # as if another worker had cached it
+    assert app_module.search_tracks('other worker') == RESULTS
+    assert app_module.cache_stats['search']['redis_hit'] == 1
+    assert app_module.cache_stats['search']['quota_saved'] == 0
+
+
+def test_failed_search_is_not_cached(app_module, search):
+    calls = search(None, None)
+    assert app_module.search_tracks('nothing') is None
+    assert app_module.search_tracks('nothing') is None
+    assert calls == ['api', 'ytmusic', 'api', 'ytmusic']
+
+
+def test_punctuation_is_part_of_the_key(app_module, search):
+    calls = search(RESULTS, None)
+    for q in ('C++', 'C', 'c#', '!!!', '???'):
+        app_module.search_tracks(q)
+    app_module.search_tracks('c++ ')
+    assert calls == ['api'] * 5
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+
+VIDEO = 'abcdefghijk'
+
+
+@pytest.fixture
+def shared(app_module, redis_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(app_module, 'INGEST_POLL', 0.01)
+    monkeypatch.setattr(app_module, 'RESOLVE_DEADLINE', 0.2)
+    monkeypatch.setattr(app_module, 'resolve_audio_source', lambda vid: pytest.fail('re-resolved the source'))
+    redis_db.set(f'ingest:{VIDEO}:owner', 'other-worker')
+    return tmp_path
+
+
+def test_follows_the_owners_part_file_until_it_finishes(app_module, redis_db, shared):
+    part = shared / f'yt-{VIDEO}.mp3.part'
+    part.write_bytes(b'first')
+    with app_module.app.test_request_context():
+        resp = app_module.follow_shared_ingest(VIDEO)
+        assert resp.status_code == 200 and resp.mimetype == 'audio/mpeg'
+        chunks = resp.response
+
+        assert next(chunks) == b'first'
+        with open(part, 'ab') as f:
+            f.write(b'second')
+        assert next(chunks) == b'second'
+
+        part.rename(shared / f'yt-{VIDEO}.mp3')
+        redis_db.set(f'ingest:{VIDEO}', f'/uploads/yt-{VIDEO}.mp3')
+        redis_db.delete(f'ingest:{VIDEO}:owner')
+        assert list(chunks) == []
+
+
+def test_follower_fails_when_the_owner_gives_up(app_module, redis_db, shared):
+    (shared / f'yt-{VIDEO}.mp3.part').write_bytes(b'partial')
+    with app_module.app.test_request_context():
+        chunks = app_module.follow_shared_ingest(VIDEO).response
+        assert next(chunks) == b'partial'
+        redis_db.delete(f'ingest:{VIDEO}:owner')
+        with pytest.raises(RuntimeError):
+            next(chunks)
+
+
+def test_published_ingest_redirects_to_its_location(app_module, redis_db, shared):
+    redis_db.set(f'ingest:{VIDEO}', f'/uploads/yt-{VIDEO}.mp3')
+    with app_module.app.test_request_context():
+        resp = app_module.follow_shared_ingest(VIDEO)
+    assert resp.status_code == 302 and resp.location.endswith(f'/uploads/yt-{VIDEO}.mp3')
+
+
+def test_hls_follower_redirects_to_the_local_manifest(app_module, shared, monkeypatch):
+    monkeypatch.setattr(app_module, 'INGEST_FORMAT', 'hls')
+    out = shared / 'hls' / VIDEO
+    threading.Timer(0.05, lambda: (out.mkdir(parents=True), (out / app_module.HLS_MANIFEST).write_text('#EXTM3U\n'))).start()
+    with app_module.app.test_request_context():
+        resp = app_module.follow_shared_ingest(VIDEO)
+    assert resp.status_code == 302 and resp.location.endswith(f'/uploads/hls/{VIDEO}/index.m3u8')
+
+
+def test_gives_up_after_the_deadline_without_output(app_module, shared):
+    with app_module.app.test_request_context():
+        assert app_module.follow_shared_ingest(VIDEO) is None
@@ -0,0 +1,38 @@
+import gevent
+import pytest
+
+
+@pytest.fixture
+def emitted(app_module, monkeypatch):
+    app_module._state_pending.clear()
+    sent = []
+    monkeypatch.setattr(app_module.socketio, 'emit', lambda event, data, **kw: sent.append((event, data, kw.get('skip_sid'))))
+    monkeypatch.setattr(app_module, 'STATE_SYNC_WINDOW', 0.01)
+    yield sent
+    app_module._state_pending.clear()
+
+
+def state(version):
+    return {'version': version, 'isPlaying': True}
+
+
+def test_coalesced_states_send_only_the_newest(app_module, emitted):
+    for version in (1, 3, 2):
+        app_module.broadcast_state('ROOM', state(version), 'sid-%d' % version, immediate=False)
+    assert emitted == []
+    gevent.sleep(0.05)
+    assert emitted == [('sync_player_state', state(3), 'sid-3')]
+
+
+def test_immediate_state_replaces_an_older_pending_one(app_module, emitted):
+    app_module.broadcast_state('ROOM', state(1), immediate=False)
+    app_module.broadcast_state('ROOM', state(2), 'sid')
+    gevent.sleep(0.05)
+    assert emitted == [('sync_player_state', state(2), 'sid')]
+
+
+def test_immediate_stale_state_sends_the_newer_pending_one(app_module, emitted):
+    app_module.broadcast_state('ROOM', state(5), 'sid-5', immediate=False)
+    app_module.broadcast_state('ROOM', state(4), 'sid-4')
+    gevent.sleep(0.05)
+    assert emitted == [('sync_player_state', state(5), 'sid-5')]
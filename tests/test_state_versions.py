@@ -0,0 +1,35 @@
+def test_every_write_bumps_the_version(app_module, room):
+    first = app_module.update_player_state(room, 'a', {'volume': 10})[1]
+    second = app_module.merge_room_state(room, {'volume': 20})
+    assert second['version'] == first['version'] + 1
+
+
+def test_stale_positional_change_is_rejected(app_module, room):
+    status, state = app_module.update_player_state(room, 'a', {'isPlaying': True}, base_version=0)
+    assert status == 1 and state['version'] == 1 and state['updatedBy'] == 'a'
+
+    status, current = app_module.update_player_state(room, 'b', {'isPlaying': False}, base_version=0)
+    assert status == -1 and current['isPlaying'] is True and current['version'] == 1
+
+
+def test_stale_non_positional_change_is_applied(app_module, room):
+    app_module.update_player_state(room, 'a', {'isPlaying': True}, base_version=0)
+    status, state = app_module.update_player_state(room, 'b', {'volume': 40}, base_version=0)
+    assert status == 0 and state['volume'] == 40 and state['isPlaying'] is True
+
+
+def test_last_writer_is_never_stale(app_module, room):
+    app_module.update_player_state(room, 'a', {'isPlaying': True}, base_version=0)
+    status, state = app_module.update_player_state(room, 'a', {'isPlaying': False}, base_version=0)
+    assert status == 1 and state['isPlaying'] is False and state['version'] == 2
+
+
+def test_forged_version_and_settings_are_ignored(app_module, room):
+    app_module.join_member(room, 'admin', 'ua', 'alice')
+    app_module.join_member(room, 'guest', 'ub', 'bob')
+    status, state = app_module.update_player_state(
+        room, 'guest', {'volume': 30, 'version': -50, 'updatedBy': 'admin', 'isCollaborative': False, 'admin_sid': 'guest'})
+    assert state['version'] == 1 and state['updatedBy'] == 'guest'
+    assert state['isCollaborative'] is True and 'admin_sid' not in state
+    assert state['volume'] == 30
+    assert app_module.load_room_core(room)[0]['admin_sid'] == 'admin'
@@ -0,0 +1,99 @@
+import sys
+
+import gevent
+import pytest
+from gevent.event import Event
+
+VIDEO = 'abcdefghijk'
+CAT = [sys.executable, '-c', 'import os\nwhile (data := os.read(0, 65536)): os.write(1, data)']  # unbuffered copy
+
+
+class FakeUpstream:
+    """A source that sends its first chunk at once and the rest when released."""
+    def __init__(self, first, rest):
+        self.first, self.rest = first, rest
+        self.release = Event()
+        self.requests = 0
+
+    def __call__(self, url, timeout, stream=False, **kwargs):
+        self.requests += 1
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield self.first
+        self.release.wait()
+        yield self.rest
+
+
+@pytest.fixture
+def ingest_env(app_module, redis_db, monkeypatch, tmp_path):
+    for name in ('R2_ACCOUNT_ID', 'R2_ACCESS_KEY_ID', 'R2_SECRET_ACCESS_KEY', 'R2_PUBLIC_URL'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(app_module, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(app_module, 'INGEST_FORMAT', 'mp3')
+    monkeypatch.setattr(app_module, 'FFMPEG_MP3', CAT)  # "transcodes" by copying
+    resolved = []
+    monkeypatch.setattr(app_module, 'resolve_audio_source', lambda vid: resolved.append(vid) or {'url': 'https://up.example/a'})
+    upstream = FakeUpstream(b'first-bytes', b'rest-of-track')
+    monkeypatch.setattr(app_module, 'http_get', upstream)
+    app_module._ingests.clear()
+    yield upstream, resolved
+    upstream.release.set()
+    app_module._ingests.clear()
+
+
+def test_chunks_stream_while_transcoding_and_the_ingest_is_shared(app_module, redis_db, ingest_env, tmp_path):
+    upstream, resolved = ingest_env
+    ingest = app_module.start_ingest(VIDEO)
+    listener = ingest.follow()
+
+    assert next(listener) == b'first-bytes'  # before the source has finished
+    assert not ingest.done.is_set()
+    assert app_module.start_ingest(VIDEO) is ingest
+    assert redis_db.get(f'ingest:{VIDEO}:owner') == app_module.WORKER_ID
+
+    upstream.release.set()
+    assert b''.join(listener) == b'rest-of-track'
+    assert ingest.wait() == str(tmp_path / f'yt-{VIDEO}.mp3')
+    gevent.sleep(0.05)  # _finish_ingest publishes
+
+    assert (upstream.requests, resolved) == (1, [VIDEO])
+    assert (tmp_path / f'yt-{VIDEO}.mp3').read_bytes() == b'first-bytesrest-of-track'
+    assert not (tmp_path / f'yt-{VIDEO}.mp3.part').exists()
+    assert redis_db.get(f'ingest:{VIDEO}') == f'/uploads/yt-{VIDEO}.mp3'
+    assert not redis_db.exists(f'ingest:{VIDEO}:owner') and VIDEO not in app_module._ingests
+
+
+def test_stream_route_serves_then_redirects(app_module, ingest_env):
+    upstream, resolved = ingest_env
+    upstream.release.set()
+    http = app_module.app.test_client()
+    resp = http.get(f'/api/stream/{VIDEO}')
+    assert resp.status_code == 200 and resp.mimetype == 'audio/mpeg'
+    assert resp.data == b'first-bytesrest-of-track'
+    gevent.sleep(0.05)
+
+    again = http.get(f'/api/stream/{VIDEO}')
+    assert again.status_code == 302 and again.location.endswith(f'/uploads/yt-{VIDEO}.mp3')
+    assert resolved == [VIDEO]
+
+
+def test_failed_transcode_cleans_up(app_module, redis_db, ingest_env, monkeypatch, tmp_path):
+    upstream, _ = ingest_env
+    monkeypatch.setattr(app_module, 'FFMPEG_MP3', [sys.executable, '-c', 'import sys; sys.stdin.read(); sys.exit(1)'])
+    upstream.release.set()
+    ingest = app_module.start_ingest(VIDEO)
+    with pytest.raises(RuntimeError):
+        list(ingest.follow())
+    gevent.sleep(0.05)
+    assert not list(tmp_path.glob('yt-*'))
+    assert not redis_db.exists(f'ingest:{VIDEO}') and not redis_db.exists(f'ingest:{VIDEO}:owner')
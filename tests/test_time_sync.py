@@ -0,0 +1,20 @@
+import itertools
+
+
+def test_each_batched_sample_is_stamped_on_its_own(app_module, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(app_module, 'server_now', lambda: next(clock))
+    client = app_module.socketio.test_client(app_module.app)
+    samples = client.emit('time_sync', {'t0': [1, 2, 3]}, callback=True)['samples']
+    assert [s['t0'] for s in samples] == [1, 2, 3]
+    stamps = [x for s in samples for x in (s['t1'], s['t2'])]
+    assert stamps == sorted(stamps) and len(set(stamps)) == len(stamps)
+    client.disconnect()
+
+
+def test_single_and_oversized_batches(app_module):
+    client = app_module.socketio.test_client(app_module.app)
+    assert len(client.emit('time_sync', {'t0': 5}, callback=True)['samples']) == 1
+    big = client.emit('time_sync', {'t0': list(range(100))}, callback=True)['samples']
+    assert len(big) == app_module.TIME_SYNC_MAX_BATCH
+    client.disconnect()
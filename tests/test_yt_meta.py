@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def extract(app_module, redis_db, monkeypatch):
+    app_module._yt_meta_mem.clear()
+    calls = []
+
+    def fake(url, fmt=None):
+        vid = url.rsplit('=', 1)[1]
+        calls.append(vid)
+        if vid.startswith('bad'):
+            raise IOError('unavailable')
+        return {'id': vid, 'title': f'Title {vid}', 'uploader': 'Band - Topic', 'duration': 200}
+    monkeypatch.setattr(app_module, '_extract_yt_info', fake)
+    yield calls
+    app_module._yt_meta_mem.clear()
+
+
+def test_lookups_are_cached_by_video_id(app_module, extract):
+    meta = app_module.get_yt_meta('aaaaaaaaaaa')
+    assert meta['artist'] == 'Band' and meta['duration'] == 200
+    assert app_module.get_yt_meta('aaaaaaaaaaa') == meta
+    assert extract == ['aaaaaaaaaaa']
+
+
+def test_redis_tier_is_shared_between_workers(app_module, extract, redis_db):
+    redis_db.set('ytmeta:bbbbbbbbbbb', json.dumps({'id': 'bbbbbbbbbbb', 'title': 'Cached'}))
+    assert app_module.get_yt_meta('bbbbbbbbbbb')['title'] == 'Cached'
+    assert extract == []
+
+
+def test_bulk_lookup_maps_failures_to_none(app_module, extract, redis_db):
+    redis_db.set('ytmeta:ccccccccccc', json.dumps({'id': 'ccccccccccc', 'title': 'Cached'}))
+    got = app_module.get_yt_meta_bulk(['ccccccccccc', 'ddddddddddd', 'bad00000000', 'ddddddddddd'])
+    assert got['ccccccccccc']['title'] == 'Cached'
+    assert got['ddddddddddd']['title'] == 'Title ddddddddddd'
+    assert got['bad00000000'] is None
+    assert sorted(extract) == ['bad00000000', 'ddddddddddd']
+
+
+def test_parse_video_id(app_module):
+    assert app_module.parse_video_id('https://youtu.be/eeeeeeeeeee?t=3') == 'eeeeeeeeeee'
+    assert app_module.parse_video_id('https://www.youtube.com/watch?v=fffffffffff&list=x') == 'fffffffffff'
+    assert app_module.parse_video_id('not a url') is None